@@ -25,7 +25,7 @@ except Exception:
 
 def run():
     """This method runs the application."""
-    app = App("GW2 Session Tracker", (400, 120))
+    app = App("GW2 Session Tracker", (480, 690))
     start_new_session()
     app.mainloop()
 
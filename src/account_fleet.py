@@ -0,0 +1,456 @@
+import argparse
+import math
+import os
+import socket
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, FrozenSet, List, Optional
+
+from loguru import logger
+
+from src.database import (
+    CONFIG,
+    acquire_lease,
+    add_fleet_accounts_to_db,
+    count_alive_fleet_workers,
+    get_collection_updated_at,
+    get_fleet_accounts_from_db,
+    get_fleet_items_ids_from_db,
+    get_tp_items_prices_by_ids_from_db,
+    is_database_degraded,
+    release_lease,
+    renew_leases,
+    reset_fleet_start_values_in_db,
+    set_fleet_account_items_in_db,
+    set_fleet_account_start_value_in_db,
+    set_fleet_worker_heartbeat,
+)
+from src.gw2api import Gw2Api
+from src.sale_channels import SaleChannelTable
+from src.session_tracker import TRADING_POST_MODE, resolve_sale_channels
+from src.snapshots import hash_snapshot
+from src.valuation_pool import ValuationPool
+
+logger.remove()
+logger.add(sys.stderr, level="INFO")
+
+
+class AccountFleet:
+    """Tracks the session profit of many accounts from one process.
+
+    API calls run in a thread pool, valuation runs in a process pool sharing
+    one price table, and every account shares the same sale channel table.
+    Accounts can be added and removed from other threads while a tick runs.
+    """
+
+    def __init__(
+        self,
+        accounts: List[dict],
+        valuation_workers: Optional[int] = None,
+        trading_post_mode: str = "sell",
+    ):
+        # Held while the accounts or their valuations change
+        self.lock = threading.RLock()
+        self.apis: Dict[str, Gw2Api] = {}
+        self.start_values = {}
+        # account -> ids of the items it holds
+        self.items_ids: Dict[str, FrozenSet[int]] = {}
+        for account in accounts:
+            self.add_account(account)
+        self.trading_post_mode = TRADING_POST_MODE.get(
+            trading_post_mode, trading_post_mode
+        )
+        self.sale_channels = SaleChannelTable()
+        self.pool = ValuationPool(valuation_workers)
+        self.io_executor = ThreadPoolExecutor(max_workers=32)
+        # snapshot key -> ((snapshot hash, sale channels version), total value)
+        self.valuations = {}
+        self.values = {}
+        self.start_time = datetime.now()
+
+    def has_account(self, account_owner: str) -> bool:
+        return account_owner in self.apis
+
+    def add_account(self, account: dict) -> str:
+        api = Gw2Api(api_key=account.get("api_key"))
+        api.set_active_character(account.get("character"))
+        with self.lock:
+            self.apis[api.account_owner] = api
+            # Accounts moved from another node keep the start value stored there
+            if account.get("start_value") is not None:
+                self.start_values[api.account_owner] = account.get("start_value")
+        return api.account_owner
+
+    def remove_account(self, account_owner: str):
+        with self.lock:
+            self.apis.pop(account_owner, None)
+            self.start_values.pop(account_owner, None)
+            self.items_ids.pop(account_owner, None)
+            self.values.pop(account_owner, None)
+            for key in [key for key in self.valuations if key[0] == account_owner]:
+                del self.valuations[key]
+
+    def fetch_account(self, api: Gw2Api) -> dict:
+        return {
+            "inventory": api.get_character_inventory_items(),
+            "materials": api.get_materials(),
+            "coins": api.get_wallet_coins() or 0,
+        }
+
+    def fetch_accounts(self) -> Dict[str, dict]:
+        with self.lock:
+            apis = list(self.apis.items())
+        futures = {
+            account_owner: self.io_executor.submit(self.fetch_account, api)
+            for account_owner, api in apis
+        }
+        accounts_data = {}
+        for account_owner, future in futures.items():
+            try:
+                accounts_data[account_owner] = future.result()
+            except Exception as e:
+                logger.warning(f"Error fetching account {account_owner}. {e}")
+        return accounts_data
+
+    def value_accounts(self, accounts_data: Dict[str, dict]) -> Dict[str, int]:
+        items_ids = [
+            item.get("id")
+            for account_data in accounts_data.values()
+            for source in ("inventory", "materials")
+            for item in account_data[source]
+            if item
+        ]
+        with self.lock:
+            apis = list(self.apis.values())
+        if items_ids and apis:
+            resolve_sale_channels(self.sale_channels, apis[0], items_ids)
+
+        # Only snapshots that changed since their last valuation go to the pool
+        snapshots = {}
+        # snapshot key -> valuation key, cached once the value arrives
+        pending_valuations = {}
+        with self.lock:
+            for account_owner, account_data in accounts_data.items():
+                for source in ("inventory", "materials"):
+                    items = account_data[source]
+                    valuation_key = (
+                        getattr(items, "snapshot_hash", None),
+                        self.sale_channels.version,
+                    )
+                    valuation = self.valuations.get((account_owner, source))
+                    if not valuation or not valuation_key[0] or (
+                        valuation[0] != valuation_key
+                    ):
+                        snapshot_key = f"{account_owner}:{source}"
+                        snapshots[snapshot_key] = items
+                        pending_valuations[snapshot_key] = valuation_key
+        try:
+            results = self.pool.value_snapshots(
+                snapshots, self.sale_channels, self.trading_post_mode
+            )
+        except Exception as e:
+            logger.warning(f"Error valuing {len(snapshots)} snapshots. {e}")
+            results = {}
+        unvalued_owners = {
+            snapshot_key.split(":", 1)[0]
+            for snapshot_key in pending_valuations
+            if snapshot_key not in results
+        }
+        accounts_values = {}
+        with self.lock:
+            for snapshot_key, (total_value, _) in results.items():
+                account_owner, source = snapshot_key.split(":", 1)
+                if snapshot_key in pending_valuations and self.has_account(
+                    account_owner
+                ):
+                    self.valuations[(account_owner, source)] = (
+                        pending_valuations[snapshot_key],
+                        total_value,
+                    )
+            for account_owner, account_data in accounts_data.items():
+                if not self.has_account(account_owner):
+                    # The account was handed over to another node during the tick
+                    continue
+                self.items_ids[account_owner] = frozenset(
+                    int(item.get("id"))
+                    for source in ("inventory", "materials")
+                    for item in account_data[source]
+                    if item and item.get("count")
+                )
+                if account_owner in unvalued_owners:
+                    # The last values of the account still hold
+                    logger.warning(f"Account {account_owner} couldn't be valued")
+                    continue
+                accounts_values[account_owner] = account_data["coins"] + sum(
+                    self.valuations[(account_owner, source)][1]
+                    for source in ("inventory", "materials")
+                )
+        return accounts_values
+
+    def tick(self) -> Dict[str, dict]:
+        accounts_values = self.value_accounts(self.fetch_accounts())
+        with self.lock:
+            for account_owner, value in accounts_values.items():
+                if not self.has_account(account_owner):
+                    continue
+                self.start_values.setdefault(account_owner, value)
+                self.values[account_owner] = {
+                    "start_value": self.start_values[account_owner],
+                    "current_value": value,
+                    "profit_value": value - self.start_values[account_owner],
+                }
+        logger.info(f"Valued {len(accounts_values)} accounts")
+        return self.values
+
+    def run(self, stop: threading.Event, update_every_minutes: float = 1):
+        while not stop.is_set():
+            self.tick()
+            stop.wait(update_every_minutes * 60)
+        self.shutdown()
+
+    def shutdown(self):
+        self.pool.shutdown()
+        self.io_executor.shutdown()
+
+
+PRICE_MIRROR_LEASE = "price_mirror"
+
+
+def get_account_lease_name(account_owner: str) -> str:
+    return f"account:{account_owner}"
+
+
+class FleetWorker:
+    """One node of a tracker fleet sharing the database with other nodes.
+
+    Accounts are handed out through leases (owner, expiry, heartbeat) so an
+    account is polled by a single node, and leases of a dead node expire and
+    are picked up by the others. The node holding the price mirror lease is
+    the only one refreshing trading post prices from the API; the others reload
+    them from the database.
+    """
+
+    def __init__(
+        self,
+        worker_id: Optional[str] = None,
+        lease_seconds: float = 90,
+        max_accounts: Optional[int] = None,
+        valuation_workers: Optional[int] = None,
+        price_mirror_minutes: float = 10,
+        api_keys: Optional[Dict[str, str]] = None,
+    ):
+        self.worker_id = (
+            worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        )
+        self.lease_seconds = lease_seconds
+        self.max_accounts = max_accounts
+        self.price_mirror_minutes = price_mirror_minutes
+        # account owner -> API key, the keys are never stored in the database so
+        # a node only leases the accounts of its own config
+        self.api_keys = api_keys or {}
+        self.fleet = AccountFleet([], valuation_workers)
+        self.leases_lock = threading.Lock()
+        self.prices_loaded_at = None
+        # What was last stored of the leased accounts for the other nodes
+        self.stored_start_values = set()
+        self.stored_items_ids: Dict[str, FrozenSet[int]] = {}
+
+    def get_fair_share(self, accounts_count: int) -> int:
+        fair_share = math.ceil(accounts_count / max(count_alive_fleet_workers(), 1))
+        if self.max_accounts is not None:
+            fair_share = min(fair_share, self.max_accounts)
+        return fair_share
+
+    def heartbeat(self) -> List[str]:
+        """Renew the held leases and drop the accounts whose lease was lost."""
+        with self.leases_lock:
+            set_fleet_worker_heartbeat(self.worker_id, self.lease_seconds)
+            account_owners = list(self.fleet.apis)
+            held_leases = set(
+                renew_leases(
+                    self.worker_id,
+                    [get_account_lease_name(owner) for owner in account_owners],
+                    self.lease_seconds,
+                )
+            )
+            for account_owner in account_owners:
+                if get_account_lease_name(account_owner) not in held_leases:
+                    logger.warning(f"Lost the lease of account {account_owner}")
+                    self.fleet.remove_account(account_owner)
+            return list(self.fleet.apis)
+
+    def balance_accounts(self):
+        """Lease free accounts up to a fair share and release the extra ones
+        when nodes join."""
+        if is_database_degraded():
+            # Leases can't be coordinated without the shared database
+            logger.warning("Database unreachable, releasing every account")
+            for account_owner in list(self.fleet.apis):
+                self.fleet.remove_account(account_owner)
+            return
+        self.heartbeat()
+        accounts = get_fleet_accounts_from_db()
+        fair_share = self.get_fair_share(len(accounts))
+        with self.leases_lock:
+            for account_owner in list(self.fleet.apis)[fair_share:]:
+                logger.info(f"Releasing account {account_owner}")
+                self.fleet.remove_account(account_owner)
+                release_lease(get_account_lease_name(account_owner), self.worker_id)
+            for account in accounts:
+                if len(self.fleet.apis) >= fair_share:
+                    break
+                account_owner = account.get("account")
+                api_key = self.api_keys.get(account_owner)
+                if not api_key or self.fleet.has_account(account_owner):
+                    continue
+                if acquire_lease(
+                    get_account_lease_name(account_owner),
+                    self.worker_id,
+                    self.lease_seconds,
+                ):
+                    logger.info(f"Leased account {account_owner}")
+                    self.fleet.add_account({**account, "api_key": api_key})
+
+    def store_accounts(self):
+        """Store what other nodes need to take over the leased accounts: their
+        start values and the items they hold, which the price mirror refreshes."""
+        with self.fleet.lock:
+            start_values = dict(self.fleet.start_values)
+            items_ids = dict(self.fleet.items_ids)
+        # Accounts handed over to other nodes are stored by them
+        self.stored_start_values &= set(start_values)
+        for account_owner in set(self.stored_items_ids) - set(items_ids):
+            del self.stored_items_ids[account_owner]
+        for account_owner, start_value in start_values.items():
+            if account_owner not in self.stored_start_values:
+                set_fleet_account_start_value_in_db(account_owner, start_value)
+                self.stored_start_values.add(account_owner)
+        for account_owner, account_items_ids in items_ids.items():
+            if self.stored_items_ids.get(account_owner) != account_items_ids:
+                set_fleet_account_items_in_db(account_owner, list(account_items_ids))
+                self.stored_items_ids[account_owner] = account_items_ids
+
+    def refresh_prices(self):
+        """Refresh the shared price mirror if this node is the elected one,
+        otherwise reload the prices other nodes mirrored."""
+        sale_channels = self.fleet.sale_channels
+        items_ids = list(sale_channels.get_sources())
+        if not items_ids or is_database_degraded():
+            return
+        prices_updated_at = get_collection_updated_at("trading_post_prices_collection")
+        if self.fleet.apis and acquire_lease(
+            PRICE_MIRROR_LEASE, self.worker_id, self.lease_seconds
+        ):
+            due = not prices_updated_at or (
+                prices_updated_at
+                < datetime.now(tz=timezone.utc)
+                - timedelta(minutes=self.price_mirror_minutes)
+            )
+            if due:
+                # The items of every account of the fleet, not only the leased ones
+                mirrored_ids = set(items_ids) | get_fleet_items_ids_from_db()
+                logger.info(
+                    f"Refreshing the trading post price mirror of {len(mirrored_ids)}"
+                    " items"
+                )
+                api = next(iter(self.fleet.apis.values()))
+                prices = api.get_prices_from_trading_post(
+                    [str(item_id) for item_id in mirrored_ids]
+                )
+                sale_channels.update_prices(prices)
+                # As stored, so the next tick doesn't reload the same prices
+                self.prices_loaded_at = get_collection_updated_at(
+                    "trading_post_prices_collection"
+                )
+                return
+        if prices_updated_at and prices_updated_at != self.prices_loaded_at:
+            prices = get_tp_items_prices_by_ids_from_db(items_ids)
+            sale_channels.update_prices(prices.values())
+            self.prices_loaded_at = prices_updated_at
+
+    def watch_leases(self, stop: threading.Event):
+        # Heartbeats run apart from ticks so a slow tick doesn't lose leases
+        while not stop.wait(self.lease_seconds / 3):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.warning(f"Error renewing leases. {e}")
+
+    def run(self, stop: threading.Event, update_every_minutes: float = 1):
+        heartbeat_thread = threading.Thread(
+            target=self.watch_leases, args=(stop,), daemon=True
+        )
+        heartbeat_thread.start()
+        while not stop.is_set():
+            try:
+                self.balance_accounts()
+                self.refresh_prices()
+                if self.fleet.apis:
+                    self.fleet.tick()
+                    self.store_accounts()
+            except Exception as e:
+                logger.warning(f"Error running fleet worker tick. {e}")
+            stop.wait(update_every_minutes * 60)
+        for account_owner in list(self.fleet.apis):
+            release_lease(get_account_lease_name(account_owner), self.worker_id)
+        release_lease(PRICE_MIRROR_LEASE, self.worker_id)
+        self.fleet.shutdown()
+
+
+def get_accounts_api_keys(accounts: List[dict]) -> Dict[str, str]:
+    """Return the API keys of the accounts keyed by account owner, the id the
+    fleet stores instead of the key."""
+    return {
+        hash_snapshot(account.get("api_key"))[:12]: account.get("api_key")
+        for account in accounts
+        if account.get("api_key")
+    }
+
+
+def register_fleet_accounts(accounts: List[dict]):
+    """Store the accounts the fleet tracks, without their API keys."""
+    add_fleet_accounts_to_db(
+        [
+            {
+                "account": hash_snapshot(account.get("api_key"))[:12],
+                "character": account.get("character"),
+            }
+            for account in accounts
+        ]
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Track many GW2 accounts")
+    parser.add_argument(
+        "--worker",
+        action="store_true",
+        help="run as one node of a fleet sharing the database with other nodes",
+    )
+    parser.add_argument(
+        "--new-session",
+        action="store_true",
+        help="forget the start values the fleet stored and start over",
+    )
+    args = parser.parse_args()
+    if args.worker:
+        register_fleet_accounts(CONFIG.get("accounts", []))
+        if args.new_session:
+            reset_fleet_start_values_in_db()
+        worker = FleetWorker(
+            lease_seconds=CONFIG.get("fleet_lease_seconds", 90),
+            max_accounts=CONFIG.get("fleet_max_accounts"),
+            valuation_workers=CONFIG.get("valuation_workers"),
+            price_mirror_minutes=CONFIG.get("price_mirror_minutes", 10),
+            api_keys=get_accounts_api_keys(CONFIG.get("accounts", [])),
+        )
+        worker.run(threading.Event(), CONFIG.get("update_every_minutes", 1))
+    else:
+        fleet = AccountFleet(
+            CONFIG.get("accounts", []),
+            valuation_workers=CONFIG.get("valuation_workers"),
+        )
+        fleet.run(threading.Event(), CONFIG.get("update_every_minutes", 1))
@@ -0,0 +1,191 @@
+import argparse
+import gzip
+import json
+import sys
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from loguru import logger
+
+from src.database import (
+    add_trading_post_prices_to_db,
+    is_database_degraded,
+    set_collection_updated_at,
+    upsert_items_info_to_db,
+)
+from src.item_catalog import build_item_catalog
+
+logger.remove()
+logger.add(sys.stderr, level="INFO")
+
+READ_CHUNK_SIZE = 1 << 16
+DEFAULT_BATCH_SIZE = 1000
+
+
+def open_dump(path: str):
+    """Open a dump as text, transparently decompressing ``.gz`` files."""
+    with open(path, "rb") as f:
+        is_gzip = f.read(2) == b"\x1f\x8b"
+    if is_gzip:
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_json_array(f, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[dict]:
+    """Yield the elements of a JSON array one at a time, keeping only the
+    element being decoded and one chunk of the file in memory."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    started = False
+    end_of_file = False
+    while True:
+        # Skip whitespace, the opening bracket and the separating commas
+        while position < len(buffer) and buffer[position] in " \t\r\n,[":
+            if buffer[position] == "[":
+                if started:
+                    break
+                started = True
+            position += 1
+        if position < len(buffer) and buffer[position] == "]":
+            return
+        try:
+            if position < len(buffer):
+                element, end = decoder.raw_decode(buffer, position)
+                # A number or literal cut at the end of the chunk decodes as a
+                # shorter value, wait until the element is followed by more
+                if end < len(buffer) or end_of_file:
+                    yield element
+                    position = end
+                    continue
+        except json.JSONDecodeError:
+            if end_of_file:
+                raise
+        if end_of_file:
+            return
+        chunk = f.read(chunk_size)
+        end_of_file = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def iter_json_lines(f) -> Iterator[dict]:
+    for line_number, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Skipping invalid line {line_number}. {e}")
+
+
+def iter_dump(path: str) -> Iterator[dict]:
+    """Stream the objects of a JSON array or JSON lines dump, gzipped or not."""
+    with open_dump(path) as f:
+        first_character = ""
+        while first_character.isspace() or not first_character:
+            first_character = f.read(1)
+            if not first_character:
+                return
+        f.seek(0)
+        records = iter_json_array(f) if first_character == "[" else iter_json_lines(f)
+        for record in records:
+            if isinstance(record, dict) and record.get("id") is not None:
+                yield record
+
+
+def iter_batches(records: Iterable[dict], batch_size: int) -> Iterator[List[dict]]:
+    records = iter(records)
+    while batch := list(islice(records, batch_size)):
+        yield batch
+
+
+def check_database_reachable():
+    """The tracker falls back to an in-memory store when MongoDB is unreachable,
+    an import written there would be lost when the process exits."""
+    if is_database_degraded():
+        raise ConnectionError("MongoDB is unreachable, nothing can be imported")
+
+
+def import_dump(
+    path: str,
+    write_batch: Callable[[List[dict]], None],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> int:
+    """Write the records of a dump in bulk batches of ``batch_size``.
+
+    Returns:
+        int: How many records were imported.
+
+    Raises:
+        ConnectionError: MongoDB is unreachable, or stopped answering during
+            the import.
+    """
+    check_database_reachable()
+    imported = 0
+    for batch in iter_batches(iter_dump(path), batch_size):
+        write_batch(batch)
+        check_database_reachable()
+        imported += len(batch)
+        logger.info(f"Imported {imported} records from {path}")
+    return imported
+
+
+def import_items_dumps(
+    paths: List[str],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    build_catalog: bool = False,
+    catalog_path: Optional[str] = None,
+) -> int:
+    """Upsert the items of the dumps into the items info collection and
+    optionally build the item catalog from them. The catalog reads the dumps
+    again, streamed like the import, instead of keeping every item around."""
+    imported = 0
+    for path in paths:
+        imported += import_dump(path, upsert_items_info_to_db, batch_size)
+    set_collection_updated_at("items_info_collection")
+    if build_catalog:
+        catalog_path = build_item_catalog(
+            (item for path in paths for item in iter_dump(path)), catalog_path
+        )
+        logger.info(f"Item catalog written to {catalog_path}")
+    return imported
+
+
+def import_prices_dump(path: str, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Upsert the trading post prices of a dump."""
+    return import_dump(path, add_trading_post_prices_to_db, batch_size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Import item or trading post price dumps into the database"
+    )
+    parser.add_argument(
+        "kind", choices=("items", "prices"), help="what the dumps hold"
+    )
+    parser.add_argument(
+        "paths", nargs="+", help="JSON array or JSON lines files, optionally gzipped"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="records written per bulk write",
+    )
+    parser.add_argument(
+        "--catalog",
+        action="store_true",
+        help="also build the local item catalog from an items dump",
+    )
+    args = parser.parse_args()
+    try:
+        if args.kind == "items":
+            import_items_dumps(args.paths, args.batch_size, args.catalog)
+        else:
+            for path in args.paths:
+                import_prices_dump(path, args.batch_size)
+    except ConnectionError as e:
+        logger.error(f"Import stopped. {e}")
+        sys.exit(1)
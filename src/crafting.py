@@ -0,0 +1,271 @@
+import sys
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from src.database import (
+    add_recipes_to_db,
+    get_collection_updated_at,
+    get_recipes_from_db,
+)
+from src.gw2api import Gw2Api
+from src.helpers import is_older_than_one_day
+
+logger.remove()
+logger.add(sys.stderr, level="INFO")
+
+COIN_CURRENCY_ID = 1
+CRAFTING_CHANNEL = "crafting"
+# (output count, ((ingredient item id, count), ...), coins)
+Recipe = Tuple[int, Tuple[Tuple[int, int], ...], int]
+_RECIPE_GRAPH_LOCK = threading.Lock()
+_RECIPE_GRAPH_STATE = {"graph": None, "loading": False, "loaded": False}
+
+
+def parse_recipe(recipe: dict) -> Optional[Tuple[int, Recipe]]:
+    """Return the output item id and the recipe, or None when the recipe needs
+    something that has no value, like guild upgrades or currencies."""
+    output_item_id = recipe.get("output_item_id")
+    if output_item_id is None:
+        return None
+    ingredients = []
+    coins = 0
+    for ingredient in recipe.get("ingredients") or []:
+        ingredient_type = ingredient.get("type", "Item")
+        ingredient_id = ingredient.get("id", ingredient.get("item_id"))
+        if ingredient_type == "Item":
+            ingredients.append((int(ingredient_id), int(ingredient.get("count", 1))))
+        elif ingredient_type == "Currency" and ingredient_id == COIN_CURRENCY_ID:
+            coins += int(ingredient.get("count", 0))
+        else:
+            return None
+    if recipe.get("guild_ingredients"):
+        return None
+    return int(output_item_id), (
+        int(recipe.get("output_item_count") or 1),
+        tuple(ingredients),
+        coins,
+    )
+
+
+class RecipeGraph:
+    """Recipes keyed by output item, shared by every tracker of the process.
+    The craft values are computed by a :class:`CraftValuator` per tracker, from
+    its own market values."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.recipes: Dict[int, List[Recipe]] = {}
+        # ingredient item id -> ids of the items crafted with it
+        self.used_in: Dict[int, Set[int]] = {}
+        # Incremented whenever recipes are added
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self.recipes)
+
+    def has_recipe(self, item_id) -> bool:
+        return int(item_id) in self.recipes
+
+    def add_recipes(self, recipes: Iterable[dict]) -> int:
+        """Add recipes as returned by the ``/recipes`` endpoint.
+
+        Returns:
+            int: How many recipes were added.
+        """
+        added = 0
+        with self._lock:
+            for recipe in recipes:
+                parsed_recipe = parse_recipe(recipe)
+                if not parsed_recipe:
+                    continue
+                output_item_id, parsed_recipe = parsed_recipe
+                output_recipes = self.recipes.setdefault(output_item_id, [])
+                if parsed_recipe in output_recipes:
+                    continue
+                output_recipes.append(parsed_recipe)
+                for ingredient_id, _ in parsed_recipe[1]:
+                    self.used_in.setdefault(ingredient_id, set()).add(output_item_id)
+                added += 1
+            if added:
+                self.version += 1
+        return added
+
+    def get_ingredients_ids(self, item_id) -> Set[int]:
+        """Return every item that can take part in crafting the item."""
+        ingredients_ids = set()
+        pending = [int(item_id)]
+        while pending:
+            for _, ingredients, _ in self.recipes.get(pending.pop(), ()):
+                for ingredient_id, _ in ingredients:
+                    if ingredient_id not in ingredients_ids:
+                        ingredients_ids.add(ingredient_id)
+                        pending.append(ingredient_id)
+        return ingredients_ids
+
+
+class CraftValuator:
+    """The craft value of each item of a recipe graph, computed bottom-up from
+    the market values of one tracker and memoized.
+
+    The craft value of an item is the cheapest of its recipes, counting every
+    ingredient at its market value or its own craft value, whichever is lower.
+    When the market value of an item changes only the craft values that depend
+    on it are dropped, the rest stays memoized.
+    """
+
+    def __init__(self, graph: RecipeGraph):
+        self.graph = graph
+        self._lock = threading.RLock()
+        self.market_values: Dict[int, Optional[int]] = {}
+        self._craft_values: Dict[int, Optional[int]] = {}
+        self._graph_version = graph.version
+        self._version = 0
+
+    @property
+    def version(self) -> Tuple[int, int]:
+        """Changes with the market values and the recipes, lets callers cache
+        valuations."""
+        return self._version, self.graph.version
+
+    def invalidate(self, item_id: int):
+        """Drop the memoized craft values of the item and of everything crafted
+        from it."""
+        with self._lock:
+            pending = deque([item_id])
+            seen = {item_id}
+            while pending:
+                current_id = pending.popleft()
+                self._craft_values.pop(current_id, None)
+                # Copied, the graph may be loading recipes meanwhile
+                for output_id in tuple(self.graph.used_in.get(current_id, ())):
+                    if output_id not in seen:
+                        seen.add(output_id)
+                        pending.append(output_id)
+            self._version += 1
+
+    def set_market_values(self, market_values: Dict[int, Optional[int]]) -> int:
+        """Set the unit market value of items, None when they can't be bought
+        or sold. Only the items whose value changed invalidate craft values.
+
+        Returns:
+            int: How many market values changed.
+        """
+        changed = 0
+        with self._lock:
+            for item_id, value in market_values.items():
+                item_id = int(item_id)
+                value = value or None
+                if (
+                    item_id in self.market_values
+                    and self.market_values[item_id] == value
+                ):
+                    continue
+                self.market_values[item_id] = value
+                self.invalidate(item_id)
+                changed += 1
+        return changed
+
+    def _get_value(
+        self, item_id: int, crafting: Set[int]
+    ) -> Tuple[Optional[int], Set[int]]:
+        """Lowest of the market and craft values of an ingredient, and the items
+        where a cycle was cut to compute it."""
+        market_value = self.market_values.get(item_id)
+        craft_value, cuts = self._get_craft_value(item_id, crafting)
+        values = [value for value in (market_value, craft_value) if value is not None]
+        return (min(values) if values else None), cuts
+
+    def _get_craft_value(
+        self, item_id: int, crafting: Set[int]
+    ) -> Tuple[Optional[int], Set[int]]:
+        if item_id in self._craft_values:
+            return self._craft_values[item_id], set()
+        if item_id in crafting:
+            # Cycle, e.g. items that can be crafted back from their own output
+            return None, {item_id}
+        recipes = self.graph.recipes.get(item_id)
+        if not recipes:
+            return None, set()
+        crafting.add(item_id)
+        craft_value = None
+        cuts = set()
+        for output_count, ingredients, coins in recipes:
+            recipe_value = coins
+            for ingredient_id, count in ingredients:
+                ingredient_value, ingredient_cuts = self._get_value(
+                    ingredient_id, crafting
+                )
+                cuts |= ingredient_cuts
+                if ingredient_value is None:
+                    recipe_value = None
+                    break
+                recipe_value += ingredient_value * count
+            if recipe_value is None:
+                continue
+            unit_value = recipe_value // output_count
+            if craft_value is None or unit_value < craft_value:
+                craft_value = unit_value
+        crafting.discard(item_id)
+        cuts.discard(item_id)
+        if not cuts:
+            # A value found by cutting a cycle at an item still being crafted
+            # depends on where the walk started, so it isn't memoized
+            self._craft_values[item_id] = craft_value
+        return craft_value, cuts
+
+    def get_craft_value(self, item_id) -> Optional[int]:
+        """Return the unit craft value of the item, or None if it has no recipe
+        or some ingredient has no value."""
+        with self._lock:
+            if self._graph_version != self.graph.version:
+                # Recipes were added, every memoized value may be cheaper now
+                self._craft_values.clear()
+                self._graph_version = self.graph.version
+            return self._get_craft_value(int(item_id), set())[0]
+
+
+def load_recipe_graph(api: Gw2Api, graph: Optional[RecipeGraph] = None) -> RecipeGraph:
+    """Load the recipes from the database into a graph, refreshing them from
+    the API when they are older than one day."""
+    graph = graph or RecipeGraph()
+    recipes_updated_at = get_collection_updated_at("recipes_collection")
+    if not recipes_updated_at or is_older_than_one_day(recipes_updated_at):
+        logger.info("Recipes older than 1 day. Updating recipes...")
+        recipes = api.get_recipes(api.get_recipes_ids())
+        add_recipes_to_db(recipes)
+        graph.add_recipes(recipes)
+    else:
+        graph.add_recipes(get_recipes_from_db())
+    logger.info(f"Loaded recipes of {len(graph)} items")
+    return graph
+
+
+def load_shared_recipe_graph(api: Gw2Api):
+    try:
+        load_recipe_graph(api, _RECIPE_GRAPH_STATE["graph"])
+        _RECIPE_GRAPH_STATE["loaded"] = True
+    except Exception as e:
+        logger.warning(f"Error loading recipes. {e}")
+    finally:
+        with _RECIPE_GRAPH_LOCK:
+            _RECIPE_GRAPH_STATE["loading"] = False
+
+
+def get_recipe_graph(api: Gw2Api) -> RecipeGraph:
+    """Return the recipe graph shared by every tracker of the process.
+
+    The first call loads the recipes in the background, the graph has no
+    recipes until then. A failed load is retried by the next call.
+    """
+    with _RECIPE_GRAPH_LOCK:
+        if _RECIPE_GRAPH_STATE["graph"] is None:
+            _RECIPE_GRAPH_STATE["graph"] = RecipeGraph()
+        if not _RECIPE_GRAPH_STATE["loaded"] and not _RECIPE_GRAPH_STATE["loading"]:
+            _RECIPE_GRAPH_STATE["loading"] = True
+            threading.Thread(
+                target=load_shared_recipe_graph, args=(api,), daemon=True
+            ).start()
+        return _RECIPE_GRAPH_STATE["graph"]
@@ -1,14 +1,23 @@
 import json
 import os
 import pathlib
-import pprint
 import sys
-from datetime import datetime, timezone
-from typing import List, Optional
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set
 
 from dotenv import load_dotenv
 from loguru import logger
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import (
+    ConnectionFailure,
+    DuplicateKeyError,
+    OperationFailure,
+    PyMongoError,
+)
+
+from src.memory_store import MemoryCursor, MemoryDatabase
 
 CONFIG = {}
 logger.remove()
@@ -16,8 +25,6 @@ logger.add(sys.stderr, level="INFO")
 
 load_dotenv()
 
-printer = pprint.PrettyPrinter()
-
 
 def get_current_file_path():
     return pathlib.Path(__file__).parent.resolve()
@@ -54,46 +61,200 @@ def load_config():
 
 load_config()
 print(f"Loaded config: {CONFIG}")
+DATABASE_TIMEOUT_MS = CONFIG.get("database_timeout_ms", 2000)
+DATABASE_HEALTH_CHECK_SECONDS = CONFIG.get("database_health_check_seconds", 30)
+# Item fields the tracker reads on every tick, kept apart in the items summary
+# collection so hot-path reads don't load whole item documents
+ITEM_SUMMARY_FIELDS = ("id", "name", "vendor_value", "flags", "rarity")
+ITEM_SUMMARY_PROJECTION = {"_id": 0, **{field: 1 for field in ITEM_SUMMARY_FIELDS}}
+TP_PRICE_PROJECTION = {"_id": 0, "id": 1, "buys.unit_price": 1, "sells.unit_price": 1}
 mongo_client = MongoClient(
     host="172.17.0.1:27017",
     username=CONFIG.get("MONGO_INITDB_ROOT_USERNAME"),
     password=CONFIG.get("MONGO_INITDB_ROOT_PASSWORD"),
-    serverSelectionTimeoutMS=60000,
+    serverSelectionTimeoutMS=DATABASE_TIMEOUT_MS,
+    connectTimeoutMS=DATABASE_TIMEOUT_MS,
 )
+memory_db = MemoryDatabase()
+DATABASE_STATE = {"degraded": None, "health_check_thread": None}
+database_state_lock = threading.Lock()
+
+
+def is_database_reachable() -> bool:
+    try:
+        mongo_client.admin.command("ping")
+        return True
+    except PyMongoError as e:
+        logger.warning(f"Database unreachable. {e}")
+        return False
+
+
+def set_database_degraded(degraded: bool):
+    with database_state_lock:
+        was_degraded = DATABASE_STATE["degraded"]
+        if degraded == was_degraded:
+            return
+        if degraded:
+            logger.warning("Database unreachable, using the in-memory store")
+            DATABASE_STATE["degraded"] = True
+            return
+        if was_degraded:
+            replayed = memory_db.replay_pending_writes(
+                mongo_client.gw2tracker_database, retry_on=(ConnectionFailure,)
+            )
+            logger.info(f"Database reachable again, replayed {replayed} writes")
+            if memory_db.pending_writes:
+                return
+        DATABASE_STATE["degraded"] = False
+
+
+def is_database_degraded() -> bool:
+    if DATABASE_STATE["degraded"] is None:
+        set_database_degraded(not is_database_reachable())
+        start_database_health_check()
+    return DATABASE_STATE["degraded"]
+
+
+def watch_database_health():
+    while True:
+        time.sleep(DATABASE_HEALTH_CHECK_SECONDS)
+        set_database_degraded(not is_database_reachable())
+
+
+def start_database_health_check():
+    with database_state_lock:
+        if DATABASE_STATE["health_check_thread"]:
+            return
+        DATABASE_STATE["health_check_thread"] = threading.Thread(
+            target=watch_database_health, daemon=True
+        )
+        DATABASE_STATE["health_check_thread"].start()
+
+
+class BulkUpdate(UpdateOne):
+    """pymongo's ``UpdateOne``, also keeping its arguments in public attributes
+    so the in-memory store can apply it."""
+
+    def __init__(self, filter: dict, update: dict, upsert: bool = False):
+        super().__init__(filter, update, upsert=upsert)
+        self.filter = filter
+        self.update = update
+        self.upsert = upsert
+
+
+class FailoverCollection:
+    """A collection that runs its calls on MongoDB while it is reachable. When a
+    call fails because MongoDB went away, the tracker switches to the in-memory
+    store and the call is retried there, so a session keeps going until the
+    health check sees MongoDB again."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __getattr__(self, method_name: str):
+        if method_name.startswith("_"):
+            raise AttributeError(method_name)
+
+        def call(*args, **kwargs):
+            if not DATABASE_STATE["degraded"]:
+                collection = mongo_client.gw2tracker_database[self.name]
+                try:
+                    result = getattr(collection, method_name)(*args, **kwargs)
+                    if method_name == "find":
+                        # Read the cursor here so failing halfway fails over too
+                        result = MemoryCursor(result)
+                    return result
+                except ConnectionFailure as e:
+                    logger.warning(f"Error on {self.name}.{method_name}. {e}")
+                    set_database_degraded(True)
+            return getattr(memory_db[self.name], method_name)(*args, **kwargs)
+
+        return call
+
+
+class FailoverDatabase:
+    def __getattr__(self, name: str) -> FailoverCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return FailoverCollection(name)
+
+
+failover_db = FailoverDatabase()
+# (collection name, keys) of the indexes known to exist on MongoDB
+CREATED_INDEXES = set()
+# (collection name, index name) of the old indexes already dropped
+DROPPED_INDEXES = set()
+
+
+def ensure_index(collection, keys, **kwargs):
+    """Create an index the first time its collection is used. ``create_index``
+    is a round trip to MongoDB even when the index already exists."""
+    index = (collection.name, repr(keys))
+    if index in CREATED_INDEXES:
+        return
+    collection.create_index(keys, **kwargs)
+    # The in-memory store ignores indexes, create them on MongoDB once it's back
+    if not DATABASE_STATE["degraded"]:
+        CREATED_INDEXES.add(index)
+
+
+def drop_index(collection, index_name: str):
+    """Drop an index left by an older version, once per run. Dropping an index
+    that doesn't exist is fine."""
+    index = (collection.name, index_name)
+    if index in DROPPED_INDEXES:
+        return
+    try:
+        collection.drop_index(index_name)
+        logger.info(f"Dropped index {index_name} of {collection.name}")
+    except OperationFailure:
+        pass
+    if not DATABASE_STATE["degraded"]:
+        DROPPED_INDEXES.add(index)
 
 
 def get_db():
-    db = mongo_client.gw2tracker_database
-    return db
+    # Checks whether MongoDB is reachable on first use
+    is_database_degraded()
+    return failover_db
 
 
 def get_items_collection():
     db = get_db()
-    db.items_collection.create_index("id", unique=True)
+    ensure_index(db.items_collection, "id", unique=True)
     return db.items_collection
 
 
 def get_items_info_collection():
     db = get_db()
-    db.items_info_collection.create_index("id", unique=True)
+    ensure_index(db.items_info_collection, "id", unique=True)
     return db.items_info_collection
 
 
+def get_items_summary_collection():
+    db = get_db()
+    ensure_index(db.items_summary_collection, "id", unique=True)
+    return db.items_summary_collection
+
+
 def get_inventory_items_collection():
     db = get_db()
-    # db.inventory_items_collection.create_index("id", unique=True)
+    ensure_index(db.inventory_items_collection, "character_name")
     return db.inventory_items_collection
 
 
 def get_materials_items_collection():
     db = get_db()
-    db.materials_items_collection.create_index("id", unique=True)
+    ensure_index(db.materials_items_collection, "id", unique=True)
     return db.materials_items_collection
 
 
 def get_character_info_collection():
     db = get_db()
-    db.character_info_collection.create_index("name", unique=True)
+    # Documents are keyed by character_name, the unique index on the missing
+    # name field made every character after the first a duplicate of null
+    drop_index(db.character_info_collection, "name_1")
+    ensure_index(db.character_info_collection, "character_name", unique=True)
     return db.character_info_collection
 
 
@@ -104,10 +265,85 @@ def get_account_info_collection():
 
 def get_currencies_collection():
     db = get_db()
-    db.currencies_collection.create_index("id", unique=True)
+    ensure_index(db.currencies_collection, "id", unique=True)
     return db.currencies_collection
 
 
+def get_snapshots_collection():
+    db = get_db()
+    ensure_index(db.snapshots_collection, "hash", unique=True)
+    return db.snapshots_collection
+
+
+def get_snapshot_heads_collection():
+    db = get_db()
+    ensure_index(db.snapshot_heads_collection, [("owner", 1), ("kind", 1)], unique=True)
+    return db.snapshot_heads_collection
+
+
+def get_leases_collection():
+    db = get_db()
+    ensure_index(db.leases_collection, "name", unique=True)
+    ensure_index(db.leases_collection, "owner")
+    return db.leases_collection
+
+
+def get_fleet_workers_collection():
+    db = get_db()
+    ensure_index(db.fleet_workers_collection, "worker_id", unique=True)
+    return db.fleet_workers_collection
+
+
+def get_fleet_accounts_collection():
+    db = get_db()
+    ensure_index(db.fleet_accounts_collection, "account", unique=True)
+    return db.fleet_accounts_collection
+
+
+def get_sessions_collection():
+    db = get_db()
+    ensure_index(db.sessions_collection, "session_id", unique=True)
+    ensure_index(db.sessions_collection, [("character", 1), ("start_time", -1)])
+    return db.sessions_collection
+
+
+def get_session_rollups_collection():
+    db = get_db()
+    ensure_index(
+        db.session_rollups_collection,
+        [("scope", 1), ("key", 1), ("period", 1)],
+        unique=True,
+    )
+    return db.session_rollups_collection
+
+
+def get_recipes_collection():
+    db = get_db()
+    ensure_index(db.recipes_collection, "id", unique=True)
+    return db.recipes_collection
+
+
+def get_transactions_collection():
+    db = get_db()
+    ensure_index(
+        db.transactions_collection,
+        [("account", 1), ("kind", 1), ("id", 1)],
+        unique=True,
+    )
+    ensure_index(
+        db.transactions_collection, [("account", 1), ("kind", 1), ("purchased", -1)]
+    )
+    return db.transactions_collection
+
+
+def get_transactions_watermarks_collection():
+    db = get_db()
+    ensure_index(
+        db.transactions_watermarks_collection, [("account", 1), ("kind", 1)], unique=True
+    )
+    return db.transactions_watermarks_collection
+
+
 def get_updated_at_collection():
     db = get_db()
     return db.collection_updated_at
@@ -126,13 +362,18 @@ def set_collection_updated_at(collection_name: str):
     )
 
 
-def get_collection_updated_at(collection_name: str):
+def get_collection_updated_at(collection_name: str) -> Optional[datetime]:
+    """Return when a collection was last updated, in UTC."""
     try:
-        return (
+        updated_at = (
             get_updated_at_collection()
             .find_one({"name": collection_name})
             .get("updated_at", None)
         )
+        # MongoDB returns naive datetimes, in UTC
+        if updated_at and updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        return updated_at
     except Exception as e:
         logger.warning(
             f"Error getting updated at from collection {collection_name}. {e}"
@@ -140,11 +381,60 @@ def get_collection_updated_at(collection_name: str):
         return None
 
 
+def get_item_summary(item: dict) -> dict:
+    return {field: item.get(field) for field in ITEM_SUMMARY_FIELDS}
+
+
+def upsert_items_summaries_to_db(items: List[dict]):
+    if not items:
+        return
+    get_items_summary_collection().bulk_write(
+        [
+            BulkUpdate(
+                {"id": item.get("id")}, {"$set": get_item_summary(item)}, upsert=True
+            )
+            for item in items
+        ],
+        ordered=False,
+    )
+
+
+def get_items_summaries_from_db(
+    items_ids: List[int], projection: dict = ITEM_SUMMARY_PROJECTION
+) -> Dict[int, dict]:
+    """Read items from the summary collection, falling back to the items info
+    collection for the ones not summarized yet and summarizing them."""
+    items_ids = [int(item_id) for item_id in items_ids]
+    items = {
+        item.get("id"): item
+        for item in get_items_summary_collection().find(
+            {"id": {"$in": items_ids}}, projection
+        )
+    }
+    missing_ids = [item_id for item_id in items_ids if item_id not in items]
+    if missing_ids:
+        missing_items = list(
+            get_items_info_collection().find(
+                {"id": {"$in": missing_ids}}, ITEM_SUMMARY_PROJECTION
+            )
+        )
+        upsert_items_summaries_to_db(missing_items)
+        for item in missing_items:
+            items[item.get("id")] = {
+                field: value
+                for field, value in item.items()
+                if projection.get(field) or field == "id"
+            }
+    return items
+
+
 def add_items_info_to_db(items: List[dict]):
     logger.info("Adding items info to the database")
     items_info_collection = get_items_info_collection()
     items_info_collection.delete_many({})
     items_info_collection.insert_many(items)
+    get_items_summary_collection().delete_many({})
+    upsert_items_summaries_to_db(items)
     set_collection_updated_at("items_info_collection")
 
 
@@ -154,16 +444,37 @@ def get_items_info_from_db():
     items_info_collection.find()
 
 
+def upsert_items_info_to_db(items: List[dict]):
+    if not items:
+        return
+    logger.info(f"Upserting {len(items)} items info to the database")
+    get_items_info_collection().bulk_write(
+        [
+            BulkUpdate({"id": item.get("id")}, {"$set": item}, upsert=True)
+            for item in items
+        ],
+        ordered=False,
+    )
+    upsert_items_summaries_to_db(items)
+
+
+def get_items_info_by_ids_from_db(items_ids: List[int]) -> Dict[int, dict]:
+    """Return the summary fields of the items, see ``ITEM_SUMMARY_FIELDS``."""
+    logger.info(f"Getting {len(items_ids)} items info from the database")
+    return get_items_summaries_from_db(items_ids)
+
+
 def add_item_info_to_db(item: dict):
     logger.info("Adding item info to the database")
     items_info_collection = get_items_info_collection()
     items_info_collection.insert_one(item)
+    upsert_items_summaries_to_db([item])
 
 
 def get_item_info_from_db(item_id: str):
+    """Return the summary fields of the item, see ``ITEM_SUMMARY_FIELDS``."""
     logger.info("Getting items info from the database")
-    items_info_collection = get_items_info_collection()
-    item = items_info_collection.find_one({"id": item_id})
+    item = get_items_summaries_from_db([item_id]).get(int(item_id))
     logger.debug(f"Item found {item}")
     return item
 
@@ -179,15 +490,16 @@ def get_items_from_db(character_name: str):
     logger.info("Getting items from the database")
     items_collection = get_items_collection()
     items = items_collection.find({"character_name": character_name})
-    printer.pprint(items)
     return items
 
 
-def add_inventory_items_to_db(items: List[dict]):
-    logger.info("Adding inventory items to the database")
+def add_inventory_items_to_db(items: List[dict], character_name: str):
+    """Replace the stored inventory items of a character."""
+    logger.info(f"Adding {character_name} inventory items to the database")
     inventory_items_collection = get_inventory_items_collection()
-    inventory_items_collection.delete_many({})
-    inventory_items_collection.insert_many(items)
+    inventory_items_collection.delete_many({"character_name": character_name})
+    if items:
+        inventory_items_collection.insert_many(items)
     set_collection_updated_at("inventory_items_collection")
 
 
@@ -195,12 +507,16 @@ def get_inventory_items_from_db(character_name: str):
     logger.info(f"Getting {character_name} inventory items from the database")
     items_collection = get_inventory_items_collection()
     items = items_collection.find({"character_name": character_name})
-    printer.pprint(items)
     return items
 
 
 def get_trading_post_prices_collection():
     db = get_db()
+    # Covers the price reads, which only need the unit prices
+    ensure_index(
+        db.trading_post_prices_collection,
+        [("id", 1), ("buys.unit_price", 1), ("sells.unit_price", 1)],
+    )
     return db.trading_post_prices_collection
 
 
@@ -216,26 +532,43 @@ def add_trading_post_price_to_db(trading_post_price: dict):
 
 def add_trading_post_prices_to_db(trading_post_prices: List[dict]):
     logger.info("Adding trading post prices to the database")
+    if not trading_post_prices:
+        return
     trading_post_prices_collection = get_trading_post_prices_collection()
-    trading_post_prices_collection.insert_many(trading_post_prices)
+    trading_post_prices_collection.bulk_write(
+        [
+            BulkUpdate({"id": price.get("id")}, {"$set": price}, upsert=True)
+            for price in trading_post_prices
+        ],
+        ordered=False,
+    )
     set_collection_updated_at("trading_post_prices_collection")
 
 
 def get_trading_post_prices_from_db():
     logger.info("Getting trading post prices from the database")
     trading_post_prices = get_trading_post_prices_collection().find()
-    printer.pprint(trading_post_prices)
     return trading_post_prices
 
 
 def get_tp_item_price_by_id_from_db(item_id: str) -> Optional[int]:
     item_price = None
     logger.info(f"Getting trading post price for item {item_id} from the database")
-    item_price = get_trading_post_prices_collection().find_one({"id": item_id})
+    item_price = get_trading_post_prices_collection().find_one(
+        {"id": int(item_id)}, TP_PRICE_PROJECTION
+    )
     logger.debug(f"Item price {item_price}")
     return item_price
 
 
+def get_tp_items_prices_by_ids_from_db(items_ids: List[int]) -> Dict[int, dict]:
+    logger.info(f"Getting trading post prices for {len(items_ids)} items")
+    prices = get_trading_post_prices_collection().find(
+        {"id": {"$in": [int(item_id) for item_id in items_ids]}}, TP_PRICE_PROJECTION
+    )
+    return {price.get("id"): price for price in prices}
+
+
 def add_current_inventory_value_to_db(
     current_inventory_value: int, character_name: str
 ):
@@ -272,7 +605,7 @@ def get_current_inventory_value_from_db(character_name: str) -> int:
     logger.info("Getting current inventory value")
     character_info_collection = get_character_info_collection()
     character_info = character_info_collection.find_one(
-        {"character_name": character_name}
+        {"character_name": character_name}, {"_id": 0, "current_inventory_value": 1}
     )
     current_inventory_value = character_info.get("current_inventory_value")
     logger.debug(f"Current inventory value: {current_inventory_value}")
@@ -283,7 +616,7 @@ def get_current_material_storage_value_from_db(character_name: str) -> int:
     logger.info("Getting current material storage value")
     character_info_collection = get_character_info_collection()
     character_info = character_info_collection.find_one(
-        {"character_name": character_name}
+        {"character_name": character_name}, {"_id": 0, "material_storage_value": 1}
     )
     current_material_storage_value = character_info.get("material_storage_value")
     logger.debug(f"Current material storage value: {current_material_storage_value}")
@@ -292,27 +625,344 @@ def get_current_material_storage_value_from_db(character_name: str) -> int:
 
 def get_item_name_from_db(item_id: str):
     logger.info(f"Getting item {item_id} name from the database")
-    items_collection = get_items_info_collection()
-    item_name = items_collection.find_one({"id": int(item_id)}).get("name")
+    item_name = (
+        get_items_summaries_from_db([item_id], {"_id": 0, "id": 1, "name": 1})
+        .get(int(item_id), {})
+        .get("name")
+    )
     logger.info(f"Item {item_id} name: {item_name}")
     return item_name
 
 
+def get_items_names_from_db(items_ids: List[int]) -> Dict[int, str]:
+    logger.info(f"Getting {len(items_ids)} items names from the database")
+    items = get_items_summaries_from_db(items_ids, {"_id": 0, "id": 1, "name": 1})
+    return {item_id: item.get("name") for item_id, item in items.items()}
+
+
 def add_currencies_to_db(currencies: List[dict]):
-    logger.info("Adding currencies to the database")
-    currencies_collection = get_currencies_collection()
-    currencies_collection.insert_many(currencies)
+    if not currencies:
+        return
+    logger.info(f"Upserting {len(currencies)} currencies to the database")
+    get_currencies_collection().bulk_write(
+        [
+            BulkUpdate({"id": currency.get("id")}, {"$set": currency}, upsert=True)
+            for currency in currencies
+        ],
+        ordered=False,
+    )
 
 
-def get_currencies_from_db():
+def get_currencies_from_db() -> List[dict]:
     logger.info("Getting currencies from the database")
-    currencies = get_currencies_collection().find()
-    printer.pprint(currencies)
-    return currencies
+    return list(get_currencies_collection().find({}, {"_id": 0}))
 
 
 def get_currency_from_db(currency_id: str):
     logger.info(f"Getting currency {currency_id} from the database")
     currency = get_currencies_collection().find_one({"id": currency_id})
-    printer.pprint(currency)
     return currency
+
+
+def add_snapshot_to_db(snapshot_hash: str, kind: str, data):
+    logger.info(f"Adding {kind} snapshot {snapshot_hash} to the database")
+    get_snapshots_collection().update_one(
+        {"hash": snapshot_hash},
+        {
+            "$setOnInsert": {
+                "hash": snapshot_hash,
+                "kind": kind,
+                "data": data,
+                "created_at": datetime.now(tz=timezone.utc),
+            }
+        },
+        upsert=True,
+    )
+
+
+def get_snapshot_from_db(snapshot_hash: str) -> Optional[dict]:
+    return get_snapshots_collection().find_one({"hash": snapshot_hash})
+
+
+def set_snapshot_head_in_db(owner: str, kind: str, snapshot_hash: str):
+    get_snapshot_heads_collection().update_one(
+        {"owner": owner, "kind": kind},
+        {
+            "$set": {
+                "owner": owner,
+                "kind": kind,
+                "hash": snapshot_hash,
+                "updated_at": datetime.now(tz=timezone.utc),
+            }
+        },
+        upsert=True,
+    )
+
+
+def get_snapshot_heads_from_db() -> dict:
+    logger.info("Getting snapshot heads from the database")
+    return {
+        (head.get("owner"), head.get("kind")): head.get("hash")
+        for head in get_snapshot_heads_collection().find()
+    }
+
+
+def acquire_lease(name: str, owner: str, lease_seconds: float) -> bool:
+    """Take the lease if it is free, expired or already ours.
+
+    Returns:
+        bool: Whether the owner holds the lease.
+    """
+    now = datetime.now(tz=timezone.utc)
+    try:
+        lease = get_leases_collection().find_one_and_update(
+            {
+                "name": name,
+                "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}],
+            },
+            {
+                "$set": {
+                    "name": name,
+                    "owner": owner,
+                    "expires_at": now + timedelta(seconds=lease_seconds),
+                    "heartbeat_at": now,
+                }
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # Another owner holds a lease that hasn't expired yet
+        return False
+    return bool(lease) and lease.get("owner") == owner
+
+
+def renew_leases(owner: str, names: List[str], lease_seconds: float) -> List[str]:
+    """Extend the owner's unexpired leases.
+
+    Returns:
+        List[str]: The names of the leases the owner still holds.
+    """
+    if not names:
+        return []
+    now = datetime.now(tz=timezone.utc)
+    leases_collection = get_leases_collection()
+    leases_collection.update_many(
+        {"name": {"$in": names}, "owner": owner, "expires_at": {"$gte": now}},
+        {
+            "$set": {
+                "expires_at": now + timedelta(seconds=lease_seconds),
+                "heartbeat_at": now,
+            }
+        },
+    )
+    leases = leases_collection.find(
+        {"name": {"$in": names}, "owner": owner, "expires_at": {"$gte": now}},
+        {"_id": 0, "name": 1},
+    )
+    return [lease.get("name") for lease in leases]
+
+
+def release_lease(name: str, owner: str):
+    get_leases_collection().update_one(
+        {"name": name, "owner": owner},
+        {"$set": {"expires_at": datetime.now(tz=timezone.utc)}},
+    )
+
+
+def set_fleet_worker_heartbeat(worker_id: str, lease_seconds: float):
+    now = datetime.now(tz=timezone.utc)
+    get_fleet_workers_collection().update_one(
+        {"worker_id": worker_id},
+        {
+            "$set": {
+                "worker_id": worker_id,
+                "heartbeat_at": now,
+                "expires_at": now + timedelta(seconds=lease_seconds),
+            }
+        },
+        upsert=True,
+    )
+
+
+def count_alive_fleet_workers() -> int:
+    return get_fleet_workers_collection().count_documents(
+        {"expires_at": {"$gte": datetime.now(tz=timezone.utc)}}
+    )
+
+
+def add_fleet_accounts_to_db(accounts: List[dict]):
+    logger.info(f"Adding {len(accounts)} fleet accounts to the database")
+    if not accounts:
+        return
+    get_fleet_accounts_collection().bulk_write(
+        [
+            BulkUpdate(
+                {"account": account.get("account")},
+                # Older versions stored the API keys
+                {"$set": account, "$unset": {"api_key": ""}},
+                upsert=True,
+            )
+            for account in accounts
+        ],
+        ordered=False,
+    )
+
+
+def get_fleet_accounts_from_db() -> List[dict]:
+    return list(get_fleet_accounts_collection().find({}, {"_id": 0, "items_ids": 0}))
+
+
+def set_fleet_account_start_value_in_db(account: str, start_value: int):
+    """Store the session start value of an account unless it already has one,
+    so its profit carries over when it moves to another node."""
+    get_fleet_accounts_collection().update_one(
+        {"account": account, "start_value": {"$exists": False}},
+        {"$set": {"start_value": start_value}},
+    )
+
+
+def reset_fleet_start_values_in_db():
+    logger.info("Starting a new fleet session")
+    get_fleet_accounts_collection().update_many({}, {"$unset": {"start_value": ""}})
+
+
+def set_fleet_account_items_in_db(account: str, items_ids: List[int]):
+    get_fleet_accounts_collection().update_one(
+        {"account": account}, {"$set": {"items_ids": sorted(items_ids)}}
+    )
+
+
+def get_fleet_items_ids_from_db() -> Set[int]:
+    """Return the ids of the items held by any account of the fleet."""
+    items_ids = set()
+    for account in get_fleet_accounts_collection().find(
+        {}, {"_id": 0, "items_ids": 1}
+    ):
+        items_ids.update(account.get("items_ids") or [])
+    return items_ids
+
+
+def add_session_to_db(session: dict) -> bool:
+    """Insert the session if it isn't stored yet.
+
+    Returns:
+        bool: Whether the session was inserted.
+    """
+    logger.info(f"Adding session {session.get('session_id')} to the database")
+    sessions_collection = get_sessions_collection()
+    if sessions_collection.find_one(
+        {"session_id": session.get("session_id")}, {"_id": 1}
+    ):
+        return False
+    sessions_collection.insert_one(session)
+    return True
+
+
+def increment_session_rollups(rollup_keys: List[tuple], increments: dict):
+    logger.info(f"Updating {len(rollup_keys)} session rollups")
+    now = datetime.now(tz=timezone.utc)
+    get_session_rollups_collection().bulk_write(
+        [
+            BulkUpdate(
+                {"scope": scope, "key": key, "period": period},
+                {"$inc": increments, "$set": {"updated_at": now}},
+                upsert=True,
+            )
+            for scope, key, period in rollup_keys
+        ],
+        ordered=False,
+    )
+
+
+def get_session_rollup_from_db(scope: str, key: str, period: str) -> Optional[dict]:
+    return get_session_rollups_collection().find_one(
+        {"scope": scope, "key": key, "period": period}, {"_id": 0}
+    )
+
+
+def add_recipes_to_db(recipes: List[dict]):
+    if not recipes:
+        return
+    logger.info(f"Upserting {len(recipes)} recipes to the database")
+    get_recipes_collection().bulk_write(
+        [
+            BulkUpdate({"id": recipe.get("id")}, {"$set": recipe}, upsert=True)
+            for recipe in recipes
+        ],
+        ordered=False,
+    )
+    set_collection_updated_at("recipes_collection")
+
+
+def get_recipes_from_db():
+    logger.info("Getting recipes from the database")
+    return get_recipes_collection().find(
+        {},
+        {
+            "_id": 0,
+            "id": 1,
+            "output_item_id": 1,
+            "output_item_count": 1,
+            "ingredients": 1,
+        },
+    )
+
+
+def add_transactions_to_db(account: str, kind: str, transactions: List[dict]):
+    if not transactions:
+        return
+    logger.info(f"Adding {len(transactions)} {kind} transactions to the database")
+    get_transactions_collection().bulk_write(
+        [
+            BulkUpdate(
+                {"account": account, "kind": kind, "id": transaction.get("id")},
+                {"$set": {**transaction, "account": account, "kind": kind}},
+                upsert=True,
+            )
+            for transaction in transactions
+        ],
+        ordered=False,
+    )
+
+
+def get_transactions_watermark_from_db(account: str, kind: str) -> dict:
+    """Return the id of the newest transaction stored by a complete ingestion,
+    as ``last_id``, and the ``backfill`` progress of an unfinished one."""
+    watermark = get_transactions_watermarks_collection().find_one(
+        {"account": account, "kind": kind}, {"_id": 0, "last_id": 1, "backfill": 1}
+    )
+    return watermark or {}
+
+
+def set_transactions_watermark_in_db(
+    account: str, kind: str, last_id: Optional[int]
+):
+    update = {"$unset": {"backfill": ""}}
+    if last_id is not None:
+        update["$max"] = {"last_id": last_id}
+    get_transactions_watermarks_collection().update_one(
+        {"account": account, "kind": kind}, update, upsert=True
+    )
+
+
+def set_transactions_backfill_in_db(
+    account: str, kind: str, page: int, last_id: Optional[int]
+):
+    get_transactions_watermarks_collection().update_one(
+        {"account": account, "kind": kind},
+        {"$set": {"backfill": {"page": page, "last_id": last_id}}},
+        upsert=True,
+    )
+
+
+def get_transactions_total_from_db(account: str, kind: str, since: str) -> int:
+    """Sum the coins of the transactions completed since an ISO timestamp."""
+    transactions = get_transactions_collection().find(
+        {"account": account, "kind": kind, "purchased": {"$gte": since}},
+        {"_id": 0, "price": 1, "quantity": 1},
+    )
+    return sum(
+        transaction.get("price", 0) * transaction.get("quantity", 0)
+        for transaction in transactions
+    )
@@ -1,21 +1,32 @@
 import os
 import json
+import queue
 import sys
 import threading
 import time
 import tkinter as tk
-from tkinter import CENTER, TOP, StringVar, ttk, W, E, BOTTOM, X, messagebox
+from types import MappingProxyType
+from tkinter import CENTER, TOP, StringVar, ttk, W, E, N, S, BOTTOM, X, messagebox
 from typing import Optional, Tuple
 from src.session_tracker import SessionTracker
 from loguru import logger
 from src.helpers import get_current_file_path, create_session_file
+from src.session_analytics import record_closed_session
+from src.live_feed import LiveFeed
 
 BUTTONS_FRAME = None
 MAIN_FRAME = None
 CONFIG = {}
 SESSION_TRACKER = None
-STOP_SESSION = False
+STOP_SESSION = threading.Event()
 CURRENT_SESSION_THREAD = None
+# Held while the tracker of the current session is swapped
+SESSION_TRACKER_LOCK = threading.Lock()
+# Values computed by the worker threads, drained by the Tk main loop
+UI_QUEUE = queue.Queue()
+UI_QUEUE_POLL_MS = 200
+# Read-only feed of the same values for overlays and scripts
+LIVE_FEED: Optional[LiveFeed] = None
 
 API_KEY = ""
 
@@ -26,6 +37,14 @@ def set_api_key(key: str):
     API_KEY = key
 
 
+def publish_values(values: dict):
+    """Send a snapshot of session values to the UI. Safe to call from any
+    thread, the widgets are only touched by the Tk main loop."""
+    UI_QUEUE.put(MappingProxyType(dict(values)))
+    if LIVE_FEED:
+        LIVE_FEED.publish(values)
+
+
 def load_config():
     global CONFIG
     logger.info("Loading config")
@@ -56,7 +75,7 @@ def load_config():
 
 class App(tk.Tk):
     def __init__(self, title: str, size: Tuple[int, int]):
-        global MAIN_FRAME, SESSION_TRACKER
+        global MAIN_FRAME, LIVE_FEED
         super().__init__()
         self.title(title)
         self.style = ttk.Style(self)
@@ -65,8 +84,13 @@ class App(tk.Tk):
         self.minsize(size[0], size[1])
         self.configure_style()
         load_config()
-        if api_key := (CONFIG.get("api_key") or os.getenv("GW2_API_KEY")):
-            SESSION_TRACKER = SessionTracker(api_key)
+        if live_feed_port := CONFIG.get("live_feed_port", 8765):
+            LIVE_FEED = LiveFeed(port=live_feed_port)
+            if not LIVE_FEED.start():
+                LIVE_FEED = None
+        # The session tracker is created by the session worker, see
+        # start_session_tracker
+        if CONFIG.get("api_key") or os.getenv("GW2_API_KEY"):
             self._frame = None
             MAIN_FRAME = MainFrame(self)
             self.main_frame = MAIN_FRAME
@@ -74,10 +98,38 @@ class App(tk.Tk):
             MAIN_FRAME.pack(side=TOP, fill=X)
             BUTTONS_FRAME = ButtonsFrame(self)
             BUTTONS_FRAME.pack(side=BOTTOM, fill=X)
+            self.after(UI_QUEUE_POLL_MS, self.drain_ui_queue)
+            self.protocol("WM_DELETE_WINDOW", self.close)
         else:
             # self._frame = Config(self)
             pass
 
+    def close(self):
+        """Record the running session before the window closes, the session
+        worker is a daemon thread and dies with it."""
+        session_data = stop_current_session()
+        if session_data:
+            try:
+                record_closed_session(session_data)
+            except Exception as e:
+                logger.error(f"Error recording the session. {e}")
+        self.destroy()
+
+    def drain_ui_queue(self):
+        """Apply the values published by the workers since the last poll. Only
+        the latest value of each field is rendered."""
+        values = {}
+        try:
+            while True:
+                values.update(UI_QUEUE.get_nowait())
+        except queue.Empty:
+            pass
+        if values and MAIN_FRAME:
+            MAIN_FRAME.session_profit_tracker.apply_values(values)
+            if "items_breakdown" in values:
+                MAIN_FRAME.item_breakdown.update_rows(values.get("items_breakdown"))
+        self.after(UI_QUEUE_POLL_MS, self.drain_ui_queue)
+
     def load_main_frame(self):
         self.main_frame = MAIN_FRAME
         # self.switch_frame(SessionProfitTracker)
@@ -117,8 +169,9 @@ class App(tk.Tk):
         self._frame.pack()
 
     def set_transparency(self, transparency):
-        self.wait_visibility()
-        self.wm_attributes("-alpha", transparency)
+        # Some window managers ignore the alpha until the window is mapped, set
+        # it when idle instead of blocking on wait_visibility
+        self.after_idle(self.wm_attributes, "-alpha", transparency)
 
 
 class ButtonsFrame(ttk.Frame):
@@ -132,6 +185,175 @@ class MainFrame(ttk.Frame):
         super().__init__(parent)
         self.session_profit_tracker = SessionProfitTracker(self)
         self.session_profit_tracker.grid()
+        self.item_breakdown = ItemBreakdownView(self)
+        self.item_breakdown.grid(row=10, column=0, columnspan=2, sticky=W + E)
+
+
+def format_coins(value: int) -> str:
+    sign = "-" if value < 0 else ""
+    value = abs(int(value))
+    return f"{sign}{value // 10000}g {value // 100 % 100}s {value % 100}c"
+
+
+class ItemBreakdownView(ttk.Frame):
+    """Lists every valued item. Only ``visible_rows`` rows exist in the
+    Treeview, scrolling moves a window over the sorted and filtered rows, so
+    thousands of items cost the same to render as a screenful."""
+
+    COLUMNS = ("name", "count", "unit_price", "channel", "total")
+    HEADINGS = ("Item", "Count", "Unit price", "Channel", "Total")
+    NUMERIC_COLUMNS = ("count", "unit_price", "total")
+
+    def __init__(self, parent, visible_rows: int = 12):
+        super().__init__(parent)
+        self.visible_rows = visible_rows
+        # item id -> (name, count, unit price, channel, total)
+        self.rows = {}
+        self.order = []
+        self.offset = 0
+        self.sort_column = "total"
+        self.sort_reverse = True
+        self.order_outdated = False
+        self.filter_after_id = None
+        self.rendered_rows = [None] * visible_rows
+        self.create_widgets()
+
+    def create_widgets(self):
+        self.filter_text = StringVar()
+        self.filter_text.trace_add("write", lambda *_: self.schedule_filter())
+        filter_entry = ttk.Entry(self, textvariable=self.filter_text)
+        filter_entry.grid(row=0, column=0, columnspan=2, sticky=W + E)
+
+        self.tree = ttk.Treeview(
+            self,
+            columns=self.COLUMNS,
+            show="headings",
+            height=self.visible_rows,
+            selectmode="none",
+        )
+        for column, heading in zip(self.COLUMNS, self.HEADINGS):
+            self.tree.heading(
+                column, text=heading, command=lambda c=column: self.sort_by(c)
+            )
+            self.tree.column(
+                column,
+                width=140 if column == "name" else 70,
+                anchor=W if column == "name" else E,
+            )
+        self.slots = [
+            self.tree.insert("", "end", values=("",) * len(self.COLUMNS))
+            for _ in range(self.visible_rows)
+        ]
+        self.tree.grid(row=1, column=0, sticky=W + E)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.scroll)
+        self.scrollbar.grid(row=1, column=1, sticky=N + S)
+        self.tree.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.tree.bind("<Button-4>", lambda _: self.scroll("scroll", -1, "units"))
+        self.tree.bind("<Button-5>", lambda _: self.scroll("scroll", 1, "units"))
+        self.columnconfigure(0, weight=1)
+
+    def update_rows(self, rows: Optional[dict]):
+        """Apply the rows of a tick, only the changed rows are touched."""
+        rows = rows or {}
+        removed_ids = self.rows.keys() - rows.keys()
+        for item_id in removed_ids:
+            del self.rows[item_id]
+        changed = bool(removed_ids)
+        for item_id, row in rows.items():
+            if self.rows.get(item_id) != row:
+                self.rows[item_id] = row
+                changed = True
+        if changed:
+            self.order_outdated = True
+            self.render()
+
+    def schedule_filter(self):
+        # Wait for the user to stop typing before filtering
+        if self.filter_after_id:
+            self.after_cancel(self.filter_after_id)
+        self.filter_after_id = self.after(150, self.apply_filter)
+
+    def apply_filter(self):
+        self.filter_after_id = None
+        self.order_outdated = True
+        self.offset = 0
+        self.render()
+
+    def sort_by(self, column: str):
+        if self.sort_column == column:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column = column
+            self.sort_reverse = column in self.NUMERIC_COLUMNS
+        self.order_outdated = True
+        self.render()
+
+    def refresh_order(self):
+        filter_text = self.filter_text.get().strip().lower()
+        column_index = self.COLUMNS.index(self.sort_column)
+        item_ids = [
+            item_id
+            for item_id, row in self.rows.items()
+            if not filter_text or filter_text in row[0].lower()
+        ]
+        if self.sort_column in self.NUMERIC_COLUMNS:
+            item_ids.sort(
+                key=lambda i: self.rows[i][column_index], reverse=self.sort_reverse
+            )
+        else:
+            item_ids.sort(
+                key=lambda i: str(self.rows[i][column_index]).lower(),
+                reverse=self.sort_reverse,
+            )
+        self.order = item_ids
+        self.order_outdated = False
+
+    def format_row(self, row: tuple) -> tuple:
+        name, count, unit_price, channel, total = row
+        return (
+            name,
+            count,
+            format_coins(unit_price),
+            channel,
+            format_coins(total),
+        )
+
+    def render(self):
+        if self.order_outdated:
+            self.refresh_order()
+        max_offset = max(len(self.order) - self.visible_rows, 0)
+        self.offset = min(max(self.offset, 0), max_offset)
+        for index, slot in enumerate(self.slots):
+            position = self.offset + index
+            row = (
+                self.rows[self.order[position]]
+                if position < len(self.order)
+                else None
+            )
+            if row == self.rendered_rows[index]:
+                continue
+            self.rendered_rows[index] = row
+            values = self.format_row(row) if row else ("",) * len(self.COLUMNS)
+            self.tree.item(slot, values=values)
+        if self.order:
+            self.scrollbar.set(
+                self.offset / len(self.order),
+                min((self.offset + self.visible_rows) / len(self.order), 1),
+            )
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll(self, action: str, amount, unit: Optional[str] = None):
+        if action == "moveto":
+            self.offset = int(float(amount) * len(self.order))
+        elif unit == "pages":
+            self.offset += int(amount) * self.visible_rows
+        else:
+            self.offset += int(amount)
+        self.render()
+
+    def on_mouse_wheel(self, event):
+        self.scroll("scroll", -1 if event.delta > 0 else 1, "units")
 
 
 class SessionProfitTracker(ttk.Frame):
@@ -139,7 +361,17 @@ class SessionProfitTracker(ttk.Frame):
         super().__init__(parent)
         self.start_value = 0
         self.current_value = 0
+        self.materials_value = 0
+        self.inventory_value = 0
+        self.bank_value = 0
+        self.shared_inventory_value = 0
+        self.wallet_value = 0
+        self.trading_post_value = 0
+        self.trading_post_sales = 0
         self.profit = 0
+        self.stale = False
+        self.top_movers = {"gainers": [], "losers": []}
+        self.labels_text = {}
         self.style = ttk.Style(self)
         self.create_session_tracker_widgets(parent)
 
@@ -155,9 +387,23 @@ class SessionProfitTracker(ttk.Frame):
     def set_inventory_value(self, value: int):
         self.inventory_value = str(value)
 
+    def set_bank_values(self, value: int, shared_inventory: int):
+        self.bank_value = str(value or 0)
+        self.shared_inventory_value = str(shared_inventory or 0)
+
+    def set_wallet_value(self, value: int):
+        self.wallet_value = str(value or 0)
+
+    def set_trading_post_values(self, value: int, sales: int):
+        self.trading_post_value = str(value or 0)
+        self.trading_post_sales = str(sales or 0)
+
     def set_profit(self, value: int):
         self.profit = str(value)
 
+    def set_top_movers(self, top_movers: Optional[dict]):
+        self.top_movers = top_movers or {"gainers": [], "losers": []}
+
     def set_values(
         self,
         start: int = 0,
@@ -172,6 +418,35 @@ class SessionProfitTracker(ttk.Frame):
         self.set_inventory_value(inventory)
         self.set_profit(profit)
 
+    def apply_values(self, values: dict):
+        if "start_value" in values:
+            self.set_start_value(values.get("start_value"))
+        if "current_value" in values:
+            self.set_current_value(values.get("current_value"))
+        if "materials_value" in values:
+            self.set_materials_value(values.get("materials_value"))
+        if "inventory_value" in values:
+            self.set_inventory_value(values.get("inventory_value"))
+        if "bank_value" in values or "shared_inventory_value" in values:
+            self.set_bank_values(
+                values.get("bank_value", self.bank_value),
+                values.get("shared_inventory_value", self.shared_inventory_value),
+            )
+        if "wallet_value" in values:
+            self.set_wallet_value(values.get("wallet_value"))
+        if "trading_post_value" in values or "trading_post_sales" in values:
+            self.set_trading_post_values(
+                values.get("trading_post_value", self.trading_post_value),
+                values.get("trading_post_sales", self.trading_post_sales),
+            )
+        if "profit_value" in values:
+            self.set_profit(values.get("profit_value"))
+        if "top_movers" in values:
+            self.set_top_movers(values.get("top_movers"))
+        if "stale" in values:
+            self.stale = bool(values.get("stale"))
+        self.update_values()
+
     def format_value(self, value) -> str:
         value = int(value)
         gold = int(value / (100 * 100))
@@ -180,29 +455,64 @@ class SessionProfitTracker(ttk.Frame):
         formatted_value = f"{gold} gold, {silver} silver, {copper} copper"
         return formatted_value
 
+    def format_top_movers(self, movers: list) -> str:
+        if not movers:
+            return "-"
+        return "\n".join(
+            f"{mover.get('name') or mover.get('id')}: "
+            f"{'+' if mover.get('value') > 0 else '-'}"
+            f"{self.format_value(abs(mover.get('value')))}"
+            for mover in movers
+        )
+
+    def set_label_text(self, label: ttk.Label, text: str):
+        """Reconfigure the label only when its text changed."""
+        if self.labels_text.get(str(label)) == text:
+            return
+        self.labels_text[str(label)] = text
+        label.configure(text=text)
+
     def update_values(self):
-        self.start_value_label["text"] = self.format_value(self.start_value)
-        self.start_value_label.configure(text=self.format_value(self.start_value))
-        self.materials_value_label["text"] = self.format_value(self.materials_value)
-        self.materials_value_label.configure(
-            text=self.format_value(self.materials_value)
+        self.set_label_text(self.start_value_label, self.format_value(self.start_value))
+        self.set_label_text(
+            self.materials_value_label, self.format_value(self.materials_value)
+        )
+        self.set_label_text(
+            self.inventory_value_label, self.format_value(self.inventory_value)
+        )
+        current_value_text = self.format_value(self.current_value)
+        if self.stale:
+            current_value_text += " (updating)"
+        self.set_label_text(self.current_value_label, current_value_text)
+        self.set_label_text(self.profit_label, self.format_value(self.profit))
+        self.set_label_text(
+            self.top_gainers_label,
+            self.format_top_movers(self.top_movers.get("gainers")),
+        )
+        self.set_label_text(
+            self.top_losers_label,
+            self.format_top_movers(self.top_movers.get("losers")),
         )
-        self.inventory_value_label["text"] = self.format_value(self.inventory_value)
-        self.inventory_value_label.configure(
-            text=self.format_value(self.inventory_value)
+        self.set_label_text(
+            self.bank_value_label,
+            f"{self.format_value(self.bank_value)}\n"
+            f"Shared: {self.format_value(self.shared_inventory_value)}",
+        )
+        self.set_label_text(
+            self.wallet_value_label, self.format_value(self.wallet_value)
+        )
+        self.set_label_text(
+            self.trading_post_label,
+            f"{self.format_value(self.trading_post_value)}\n"
+            f"Sold: {self.format_value(self.trading_post_sales)}",
         )
-        self.current_value_label["text"] = self.format_value(self.current_value)
-        self.current_value_label.configure(text=self.format_value(self.current_value))
-        self.profit_label["text"] = self.format_value(self.profit)
-        self.profit_label.configure(text=self.format_value(self.profit))
-        self.current_value_label.grid()
 
     def create_session_tracker_widgets(self, parent):
         # self.configure_style()
         self.style = "SessionFrame"
         parent.columnconfigure(0, weight=2)
         parent.columnconfigure(1, weight=3)
-        parent.rowconfigure((0, 1, 2, 3, 4), weight=1)
+        parent.rowconfigure((0, 1, 2, 3, 4, 5, 6, 7, 8, 9), weight=1)
 
         start_value_text_label = ttk.Label(parent, text="Start value")
         start_value_text_label.grid(row=0, column=0, sticky=W, padx=2, pady=2)
@@ -231,6 +541,31 @@ class SessionProfitTracker(ttk.Frame):
         self.profit_label = ttk.Label(parent, text=self.profit)
         self.profit_label.grid(row=4, column=1, sticky=W, padx=2, pady=2)
 
+        top_gainers_text_label = ttk.Label(parent, text="Top gainers")
+        top_gainers_text_label.grid(row=5, column=0, sticky=W + N, padx=2, pady=2)
+        self.top_gainers_label = ttk.Label(parent, text="-")
+        self.top_gainers_label.grid(row=5, column=1, sticky=W, padx=2, pady=2)
+
+        top_losers_text_label = ttk.Label(parent, text="Top losers")
+        top_losers_text_label.grid(row=6, column=0, sticky=W + N, padx=2, pady=2)
+        self.top_losers_label = ttk.Label(parent, text="-")
+        self.top_losers_label.grid(row=6, column=1, sticky=W, padx=2, pady=2)
+
+        trading_post_text_label = ttk.Label(parent, text="Trading post")
+        trading_post_text_label.grid(row=7, column=0, sticky=W + N, padx=2, pady=2)
+        self.trading_post_label = ttk.Label(parent, text="-")
+        self.trading_post_label.grid(row=7, column=1, sticky=W, padx=2, pady=2)
+
+        bank_value_text_label = ttk.Label(parent, text="Bank value")
+        bank_value_text_label.grid(row=8, column=0, sticky=W + N, padx=2, pady=2)
+        self.bank_value_label = ttk.Label(parent, text="-")
+        self.bank_value_label.grid(row=8, column=1, sticky=W, padx=2, pady=2)
+
+        wallet_value_text_label = ttk.Label(parent, text="Wallet value")
+        wallet_value_text_label.grid(row=9, column=0, sticky=W, padx=2, pady=2)
+        self.wallet_value_label = ttk.Label(parent, text="-")
+        self.wallet_value_label.grid(row=9, column=1, sticky=W, padx=2, pady=2)
+
         self.start_new_session_btn = ttk.Button(
             BUTTONS_FRAME, text="New session", command=lambda: start_new_session()
         )
@@ -271,30 +606,31 @@ class Config(ttk.Frame):
 
 
 def test_watch_for_changes():
-    global MAIN_FRAME
     current_value = 0
     while True:
         time.sleep(3)
         current_value += 10
-        MAIN_FRAME.session_profit_tracker.set_current_value(current_value)
-        MAIN_FRAME.session_profit_tracker.update_values()
-        MAIN_FRAME.pack()
+        publish_values({"current_value": current_value})
 
 
 def watch_for_changes():
-    global MAIN_FRAME
     while True:
         values = SESSION_TRACKER.update_session()
-        MAIN_FRAME.session_profit_tracker.set_current_value(values.get("current_value"))
-        MAIN_FRAME.session_profit_tracker.set_profit(values.get("profit_value"))
-        MAIN_FRAME.session_profit_tracker.update_values()
-        MAIN_FRAME.pack()
+        publish_values(
+            {
+                "current_value": values.get("current_value"),
+                "profit_value": values.get("profit_value"),
+            }
+        )
         time.sleep(CONFIG.get("update_every_minutes") * 60)
 
 
 def save_session(session_data: Optional[dict] = None):
-    global SESSION_TRACKER
-    session_data = session_data if session_data else SESSION_TRACKER.get_session_data()
+    if not session_data:
+        if not SESSION_TRACKER:
+            messagebox.showinfo("No session", "The session hasn't started yet")
+            return
+        session_data = SESSION_TRACKER.get_session_data()
     session_file = create_session_file("gw2tracker")
     logger.info(f"Saving session to {session_file}")
     session_data_json = json.dumps(session_data, indent=2)
@@ -304,57 +640,79 @@ def save_session(session_data: Optional[dict] = None):
     messagebox.showinfo("Session saved", f"Session saved to {session_file}")
 
 
-def start_session_tracker():
-    global SESSION_TRACKER, STOP_SESSION
-    SESSION_TRACKER = SessionTracker()
-    start_session_values = SESSION_TRACKER.start_session()
-    start_value = start_session_values.get("start_value")
-    MAIN_FRAME.session_profit_tracker.set_start_value(start_value)
-    MAIN_FRAME.session_profit_tracker.set_materials_value(
-        start_session_values.get("materials_value")
-    )
-    MAIN_FRAME.session_profit_tracker.set_inventory_value(
-        start_session_values.get("inventory_value")
-    )
-    MAIN_FRAME.session_profit_tracker.update_values()
-    MAIN_FRAME.pack()
-    while not STOP_SESSION:
-        time.sleep(CONFIG.get("update_every_minutes") * 60)
-        values = SESSION_TRACKER.update_session()
-        MAIN_FRAME.session_profit_tracker.set_start_value(start_value)
-        MAIN_FRAME.session_profit_tracker.set_current_value(values.get("current_value"))
-        MAIN_FRAME.session_profit_tracker.set_materials_value(
-            values.get("materials_value")
-        )
-        MAIN_FRAME.session_profit_tracker.set_inventory_value(
-            values.get("inventory_value")
-        )
-        MAIN_FRAME.session_profit_tracker.set_profit(values.get("profit_value"))
-        MAIN_FRAME.session_profit_tracker.update_values()
-        MAIN_FRAME.pack()
-    sys.exit()
-    return
+def start_session_tracker(stop_session: threading.Event):
+    """Run one session until ``stop_session`` is set. The worker only touches
+    the tracker it created, a stopped session may still be finishing its last
+    tick while the next one starts."""
+    global SESSION_TRACKER
+
+    def publish_session_values(values: dict):
+        # A stopped session must not overwrite the values of the new one
+        if not stop_session.is_set():
+            publish_values(values)
+
+    session_tracker = SessionTracker()
+    with SESSION_TRACKER_LOCK:
+        if stop_session.is_set():
+            return
+        SESSION_TRACKER = session_tracker
+    try:
+        # Values corrected after a tick ran out of time are published as well
+        session_tracker.on_revalidated = publish_session_values
+        publish_session_values(session_tracker.start_session())
+        while not stop_session.wait(session_tracker.get_next_poll_delay()):
+            publish_session_values(session_tracker.update_session())
+    except Exception as e:
+        logger.error(f"Session stopped by an error. {e}")
+    finally:
+        session_tracker.stop_session()
+
+
+def stop_current_session() -> Optional[dict]:
+    """Stop the running session and return its data, None if it hadn't
+    started yet."""
+    global SESSION_TRACKER
+    with SESSION_TRACKER_LOCK:
+        STOP_SESSION.set()
+        # The tracker is left to its worker, which stops it once its current
+        # tick finishes
+        session_tracker, SESSION_TRACKER = SESSION_TRACKER, None
+    return session_tracker.get_session_data() if session_tracker else None
 
 
 def start_new_session():
-    global SESSION_TRACKER, STOP_SESSION, CURRENT_SESSION_THREAD
-    STOP_SESSION = True
-    session_data = SESSION_TRACKER.get_session_data()
-    SESSION_TRACKER.reset_session()
-    MAIN_FRAME.session_profit_tracker.set_values(0, 0, 0)
-    MAIN_FRAME.session_profit_tracker.update_values()
-    MAIN_FRAME.pack()
-    STOP_SESSION = False
-    if CURRENT_SESSION_THREAD:
+    global STOP_SESSION, CURRENT_SESSION_THREAD
+    session_data = stop_current_session()
+    publish_values(
+        {
+            "start_value": 0,
+            "current_value": 0,
+            "materials_value": 0,
+            "inventory_value": 0,
+            "bank_value": 0,
+            "shared_inventory_value": 0,
+            "wallet_value": 0,
+            "trading_post_value": 0,
+            "trading_post_sales": 0,
+            "profit_value": 0,
+            "top_movers": None,
+            "items_breakdown": None,
+            "stale": False,
+        }
+    )
+    if session_data:
+        threading.Thread(
+            target=record_closed_session, args=(session_data,), daemon=True
+        ).start()
         save_session(session_data)
-        # CURRENT_SESSION_THREAD.exit()
-        CURRENT_SESSION_THREAD.join()
-        CURRENT_SESSION_THREAD = None
-    CURRENT_SESSION_THREAD = threading.Thread(target=start_session_tracker)
+    STOP_SESSION = threading.Event()
+    CURRENT_SESSION_THREAD = threading.Thread(
+        target=start_session_tracker, args=(STOP_SESSION,), daemon=True
+    )
     CURRENT_SESSION_THREAD.start()
 
 
 if __name__ == "__main__":
-    app = App("GW2 Session Tracker", (400, 120))
+    app = App("GW2 Session Tracker", (480, 690))
     start_new_session()
     app.mainloop()
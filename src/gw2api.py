@@ -1,12 +1,14 @@
 import os
 import sys
 import urllib.parse
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 
 import requests
 from dotenv import load_dotenv
 from loguru import logger
 from src.helpers import is_item_sellable
+from src.single_flight import SingleFlight
+from src.snapshots import SnapshotStore, hash_snapshot
 from src.database import (
     add_inventory_items_to_db,
     add_trading_post_price_to_db,
@@ -23,22 +25,52 @@ logger.add(sys.stderr, level="INFO")
 load_dotenv()
 
 
+def get_bags_items(character_name: str, bags: Optional[List[dict]]) -> List[dict]:
+    items = []
+    for bag in bags or []:
+        if not bag:
+            continue
+        for item in bag["inventory"]:
+            if item:
+                items.append({**item, "character_name": character_name})
+    return items
+
+
 class Gw2Api:
     def __init__(self, api_key: str):
         self.base_url = "https://api.guildwars2.com/v2"
-        self.owned_items_tp_prices = {}
         self.active_character = ""
+        self.snapshots = SnapshotStore()
+        self.account_owner = hash_snapshot(api_key)[:12]
+        # Concurrent identical requests share one in-flight call
+        self.requests_flight = SingleFlight()
+        self.items_flight = SingleFlight()
+        self.prices_flight = SingleFlight()
+        # Called with the url and response of every request, e.g. to learn
+        # how often the endpoints refresh
+        self.on_response: Optional[Callable[[str, requests.Response], None]] = None
         if os.environ.get("GW2_API_KEY"):
             self.headers = {"Authorization": f"Bearer {api_key}"}
         else:
             self.headers = {"Authorization": f"Bearer {api_key}"}
 
+    def get(self, url: str) -> requests.Response:
+        """GET the url, sharing the response with concurrent callers of the
+        same url."""
+        response = self.requests_flight.do(
+            url, requests.get, url, headers=self.headers
+        )
+        if self.on_response:
+            self.on_response(url, response)
+        return response
+
     @staticmethod
     def url_encode(string: str) -> str:
         return urllib.parse.quote(string, safe="")
 
     def set_api_key(self, api_key: str):
         self.headers = {"Authorization": f"Bearer {api_key}"}
+        self.account_owner = hash_snapshot(api_key)[:12]
 
     def set_active_character(self, name: str):
         logger.info(f"Setting active character: {name}")
@@ -50,19 +82,13 @@ class Gw2Api:
     def get_character(self, character_name: str):
         character_name = character_name or self.active_character
         encoded_name = self.url_encode(character_name)
-        response = requests.get(
-            f"{self.base_url}/characters/{encoded_name}",
-            headers=self.headers,
-        )
+        response = self.get(f"{self.base_url}/characters/{encoded_name}")
         return response.json()
 
     def get_character_inventory(self, character_name: Optional[str] = None):
         character_name = character_name or self.active_character
         encoded_name = self.url_encode(character_name)
-        response = requests.get(
-            f"{self.base_url}/characters/{encoded_name}/inventory",
-            headers=self.headers,
-        )
+        response = self.get(f"{self.base_url}/characters/{encoded_name}/inventory")
         if response.status_code < 200 or response.status_code > 299:
             logger.warning("Failed to get character inventory")
             return None
@@ -70,52 +96,106 @@ class Gw2Api:
         logger.info("Successfully fetched character inventory")
         return response.json()
 
-    def get_character_inventory_items(self, character_name: Optional[str] = None):
+    def get_character_inventory_items(
+        self, character_name: Optional[str] = None, snapshot: bool = True
+    ):
+        """Get the items in the bags of a character. Without ``snapshot`` they
+        are returned as a plain list and the snapshot store isn't touched, so
+        the next snapshot still sees the changes."""
         character_name = character_name or self.active_character
         logger.info(f"Getting items from character {character_name} inventory")
-        items = []
         inventory = self.get_character_inventory(character_name)
-        for bag in inventory["bags"]:
-            for item in bag["inventory"]:
-                if item:
-                    items.append({**item, "character_name": character_name})
-        add_inventory_items_to_db(items)
+        if not inventory:
+            return []
+        if not snapshot:
+            return get_bags_items(character_name, inventory.get("bags"))
+        return self.snapshot_inventory_items(character_name, inventory.get("bags"))
+
+    def snapshot_inventory_items(self, character_name: str, bags: List[dict]):
+        """Snapshot the items in the bags of a character, storing them when
+        they changed."""
+        items = self.snapshots.snapshot(
+            f"{self.account_owner}:{character_name}",
+            "inventory",
+            get_bags_items(character_name, bags),
+        )
+        if items.changed:
+            add_inventory_items_to_db(items, character_name)
         return items
 
+    def get_characters_inventories_items(
+        self, snapshot: bool = True
+    ) -> Optional[Dict[str, List[dict]]]:
+        """Get the inventory items of every character of the account with a
+        single request, keyed by character name. None when the request fails.
+        See :meth:`get_character_inventory_items` for ``snapshot``."""
+        logger.info("Getting items from every character inventory")
+        response = self.get(f"{self.base_url}/characters?ids=all")
+        if response.status_code != 200:
+            logger.warning("Failed to get the characters")
+            return None
+        logger.info("Successfully fetched the characters")
+        get_items = self.snapshot_inventory_items if snapshot else get_bags_items
+        return {
+            character.get("name"): get_items(
+                character.get("name"), character.get("bags")
+            )
+            for character in response.json()
+            if character.get("name")
+        }
+
     def inventory_changes(self, character_name: str):
         pass
 
-    def get_bank_content(self):
+    def get_bank_content(self, snapshot: bool = True):
         logger.info("Getting bank content")
-        response = requests.get(
-            f"{self.base_url}/account/bank",
-            headers=self.headers,
-        )
+        response = self.get(f"{self.base_url}/account/bank")
         if response.status_code == 200:
             logger.info("Successfully fetched bank content")
-            return response.json()
+            if not snapshot:
+                return response.json()
+            return self.snapshots.snapshot(self.account_owner, "bank", response.json())
         else:
             logger.error("Failed to fetch bank content")
             return []
 
-    def get_materials(self):
-        response = requests.get(
-            f"{self.base_url}/account/materials",
-            headers=self.headers,
-        )
+    def get_shared_inventory(self, snapshot: bool = True):
+        response = self.get(f"{self.base_url}/account/inventory")
+        if response.status_code == 200:
+            logger.info("Successfully fetched shared inventory")
+            if not snapshot:
+                return response.json()
+            return self.snapshots.snapshot(
+                self.account_owner, "shared_inventory", response.json()
+            )
+        else:
+            logger.error("Failed to fetch shared inventory")
+            return []
+
+    def get_materials(self, snapshot: bool = True):
+        response = self.get(f"{self.base_url}/account/materials")
         if response.status_code == 200:
             logger.info("Successfully fetched materials")
-            return response.json()
+            if not snapshot:
+                return response.json()
+            return self.snapshots.snapshot(
+                self.account_owner, "materials", response.json()
+            )
         else:
             logger.error("Failed to fetch materials")
             return []
 
     def get_owned_items_ids(self, character_name: Optional[str] = None) -> List[str]:
         character_name = character_name or self.active_character
-        inventory_items = self.get_character_inventory_items(character_name)
-        bank_items = self.get_bank_content()
-        materials = self.get_materials()
-        all_items = inventory_items + bank_items + materials
+        # Runs outside the tick, snapshots are left to the tick so it still
+        # sees the changes
+        inventory_items = self.get_character_inventory_items(
+            character_name, snapshot=False
+        )
+        bank_items = self.get_bank_content(snapshot=False)
+        materials = self.get_materials(snapshot=False)
+        shared_inventory_items = self.get_shared_inventory(snapshot=False)
+        all_items = inventory_items + bank_items + materials + shared_inventory_items
         all_items_ids = []
         for item in all_items:
             if not item:
@@ -126,10 +206,8 @@ class Gw2Api:
     def get_prices_from_chunk(self, chunk: List[str]):
         items_url = str(",".join(chunk))
 
-        response = requests.get(
-            f"{self.base_url}/commerce/prices?ids={items_url}", headers=self.headers
-        )
-        if response.status_code >= 200 or response.status_code <= 299:
+        response = self.get(f"{self.base_url}/commerce/prices?ids={items_url}")
+        if 200 <= response.status_code <= 299:
             logger.info("Successfully fetched trading post prices")
             return response.json()
         else:
@@ -142,29 +220,39 @@ class Gw2Api:
             del lst[:chunk_size]
             yield chunk
 
-    def get_prices_from_trading_post(self, items: Optional[List[str]] = []):
-        items = items or self.get_owned_items_ids()
-        chunk_length = 30
-        chunks = []
-        chunks_prices = []
-
-        while len(items) > chunk_length:
-            chunk = items[:chunk_length]
-            chunk_prices = self.get_prices_from_chunk(chunk)
-            chunks_prices += chunk_prices
-            chunks.append(chunk)
-            del items[:chunk_length]
+    def get_items_prices(self, items_ids: List[str], chunk_size: int = 200):
+        """Fetches the trading post prices of many items, up to ``chunk_size``
+        items per request, and saves them on the database. Prices already being
+        fetched by another thread are awaited instead of requested again."""
+
+        def fetch_prices(ids: List[int]) -> dict:
+            prices = []
+            for start in range(0, len(ids), chunk_size):
+                end = start + chunk_size
+                chunk = [str(item_id) for item_id in ids[start:end]]
+                prices += self.get_prices_from_chunk(chunk)
+            add_trading_post_prices_to_db(prices)
+            return {price.get("id"): price for price in prices}
+
+        prices = self.prices_flight.do_many(
+            [int(item_id) for item_id in items_ids], fetch_prices
+        )
+        return [price for price in prices.values() if price]
 
-        self.owned_items_tp_prices = chunks_prices
-        add_trading_post_prices_to_db(chunks_prices)
+    def get_prices_from_trading_post(self, items: Optional[List[str]] = None):
+        items = items or self.get_owned_items_ids()
+        return self.get_items_prices(list(dict.fromkeys(items)))
 
     def get_item_price_from_trading_post(self, item_id: str):
+        return self.prices_flight.do(
+            int(item_id), self.fetch_item_price_from_trading_post, item_id
+        )
+
+    def fetch_item_price_from_trading_post(self, item_id: str):
         if not is_item_sellable(item_id):
             logger.warning("Item not sellable")
             return None
-        response = requests.get(
-            f"{self.base_url}/commerce/prices/{item_id}", headers=self.headers
-        )
+        response = self.get(f"{self.base_url}/commerce/prices/{item_id}")
         if response.status_code < 200 or response.status_code > 299:
             logger.error("Failed to fetch item price")
             return None
@@ -174,7 +262,7 @@ class Gw2Api:
         return response.json()
 
     def get_all_gw2_items_ids(self):
-        response = requests.get(f"{self.base_url}/items", headers=self.headers)
+        response = self.get(f"{self.base_url}/items")
         if response.status_code < 200 or response.status_code > 299:
             logger.error("Failed to fetch items")
             return []
@@ -188,9 +276,7 @@ class Gw2Api:
         items_ids = self.get_owned_items_ids()
         for chunk in self.chunk_list(items_ids, 30):
             items_url = str(",".join(chunk))
-            response = requests.get(
-                f"{self.base_url}/items?ids={items_url}", headers=self.headers
-            )
+            response = self.get(f"{self.base_url}/items?ids={items_url}")
             if response.status_code < 200 or response.status_code > 299:
                 logger.error("Failed to fetch items")
                 return []
@@ -200,6 +286,99 @@ class Gw2Api:
             logger.info(f"Total items: {len(response.json())}")
         add_items_info_to_db(items)
 
+    def get_transactions_page(
+        self, kind: str, page: int = 0, page_size: int = 200
+    ) -> Tuple[Optional[List[dict]], int]:
+        """Fetches a page of trading post transactions, newest first.
+
+        Args:
+            kind (str): ``current/buys``, ``current/sells``, ``history/buys`` or
+                ``history/sells``.
+
+        Returns:
+            Tuple[Optional[List[dict]], int]: The transactions, None when the
+                page can't be fetched, and the number of pages.
+        """
+        response = self.get(
+            f"{self.base_url}/commerce/transactions/{kind}"
+            f"?page={page}&page_size={page_size}"
+        )
+        if response.status_code == 200:
+            return response.json(), int(response.headers.get("X-Page-Total", 1))
+        logger.error(f"Failed to fetch {kind} transactions")
+        return None, 0
+
+    def get_current_transactions(self, kind: str) -> List[dict]:
+        """Fetches every open buy order or sell listing."""
+        transactions, page_total = self.get_transactions_page(f"current/{kind}")
+        transactions = transactions or []
+        for page in range(1, page_total):
+            transactions += self.get_transactions_page(f"current/{kind}", page)[0] or []
+        return transactions
+
+    def get_delivery_box(self) -> dict:
+        """Fetches the coins and items waiting to be picked up at the trading
+        post."""
+        response = self.get(f"{self.base_url}/commerce/delivery")
+        if response.status_code == 200:
+            return response.json()
+        logger.error("Failed to fetch the delivery box")
+        return {"coins": 0, "items": []}
+
+    def get_recipes_ids(self) -> List[int]:
+        response = self.get(f"{self.base_url}/recipes")
+        if response.status_code == 200:
+            return response.json()
+        logger.error("Failed to fetch recipes ids")
+        return []
+
+    def get_recipes(self, recipes_ids: List[int], chunk_size: int = 200) -> List[dict]:
+        """Fetches many recipes, up to ``chunk_size`` per request."""
+        recipes = []
+        for start in range(0, len(recipes_ids), chunk_size):
+            end = start + chunk_size
+            chunk = recipes_ids[start:end]
+            recipes_url = ",".join(str(recipe_id) for recipe_id in chunk)
+            response = self.get(f"{self.base_url}/recipes?ids={recipes_url}")
+            if response.status_code < 200 or response.status_code > 299:
+                logger.error("Failed to fetch recipes")
+                continue
+            recipes += response.json()
+        logger.info(f"Fetched {len(recipes)} recipes")
+        return recipes
+
+    def get_items_info(self, items_ids: List[str], chunk_size: int = 200) -> List[dict]:
+        """Fetches the info of many items from the GW2 API, using the ``ids``
+        parameter to get up to ``chunk_size`` items per request. Items already
+        being fetched by another thread are awaited instead of requested again.
+
+        Args:
+            items_ids (List[str]): The ids of the items to fetch.
+            chunk_size (int): Items per request, the API allows up to 200.
+
+        Returns:
+            List[dict]: The items info fetched from the API.
+        """
+
+        def fetch_items(ids: List[int]) -> dict:
+            items = []
+            for start in range(0, len(ids), chunk_size):
+                end = start + chunk_size
+                chunk = ids[start:end]
+                items_url = ",".join(str(item_id) for item_id in chunk)
+                response = self.get(f"{self.base_url}/items?ids={items_url}")
+                if response.status_code < 200 or response.status_code > 299:
+                    logger.error("Failed to fetch items")
+                    continue
+                items += response.json()
+            logger.info(f"Fetched info of {len(items)} items")
+            return {item.get("id"): item for item in items}
+
+        items = self.items_flight.do_many(
+            [int(item_id) for item_id in items_ids], fetch_items
+        )
+        return [item for item in items.values() if item]
+
     def fetch_item_info(self, item_id: str):
         """
         Fetches item info from the GW2 API given an item id.
@@ -210,9 +389,10 @@ class Gw2Api:
         Returns:
             dict: The item info fetched from the API.
         """
-        response = requests.get(
-            f"{self.base_url}/items/{item_id}", headers=self.headers
-        )
+        return self.items_flight.do(int(item_id), self.request_item_info, item_id)
+
+    def request_item_info(self, item_id: str):
+        response = self.get(f"{self.base_url}/items/{item_id}")
         if response.status_code < 200 or response.status_code > 299:
             logger.error(f"Failed to fetch item {item_id}")
             return None
@@ -220,9 +400,7 @@ class Gw2Api:
         return response.json()
 
     def get_currency_name(self, currency_id: str):
-        response = requests.get(
-            f"{self.base_url}/currencies/{currency_id}", headers=self.headers
-        )
+        response = self.get(f"{self.base_url}/currencies/{currency_id}")
         if response.status_code < 200 or response.status_code > 299:
             logger.error("Failed to fetch currency")
             return None
@@ -230,9 +408,7 @@ class Gw2Api:
         return response.json().get("name")
 
     def get_all_currencies_and_save_on_db(self):
-        response = requests.get(
-            "https://api.guildwars2.com/v2/currencies?ids=all", headers=self.headers
-        )
+        response = self.get(f"{self.base_url}/currencies?ids=all")
         if response.status_code < 200 or response.status_code > 299:
             logger.error("Failed to fetch currencies")
             return None
@@ -247,32 +423,48 @@ class Gw2Api:
             currencies = self.get_all_currencies_and_save_on_db()
         return currencies
 
+    def get_gems_exchange_rate(self, quantity: int = 100) -> Optional[int]:
+        """Return how many coins one gem sells for when exchanging ``quantity``
+        gems."""
+        response = self.get(
+            f"{self.base_url}/commerce/exchange/gems?quantity={quantity}"
+        )
+        if response.status_code < 200 or response.status_code > 299:
+            logger.error("Failed to fetch the gems exchange rate")
+            return None
+        return response.json().get("coins_per_gem")
+
     def get_wallet_content(self):
-        response = requests.get(f"{self.base_url}/account/wallet", headers=self.headers)
+        response = self.get(f"{self.base_url}/account/wallet")
         if response.status_code < 200 or response.status_code > 299:
             logger.error("Failed to fetch wallet content")
             return None
 
         logger.info("Successfully fetched wallet content")
-        return response.json()
+        return self.snapshots.snapshot(self.account_owner, "wallet", response.json())
 
-    def get_wallet_coins(self) -> int:
+    def get_wallet_coins(self, wallet: Optional[List[dict]] = None) -> int:
         """Return the amount of coins from account wallet
         The "id" of the currency Coin in the Guild Wars 2 API is 1
 
+        Args:
+            wallet (Optional[List[dict]]): A wallet already fetched this tick,
+                fetched when not given.
+
         Returns:
             int: wallet coins
         """
         character_name = self.get_active_character()
-        response = requests.get(f"{self.base_url}/account/wallet", headers=self.headers)
-        if response.status_code < 200 or response.status_code > 299:
+        wallet = wallet if wallet is not None else self.get_wallet_content()
+        if wallet is None:
             logger.error("Failed to fetch wallet coins")
             return None
-        for currency in response.json():
+        for currency in wallet:
             if currency.get("id") == 1:
                 logger.info("Successfully fetched wallet coins")
                 coins_amount = currency.get("value")
                 if not coins_amount:
                     logger.warning("Wallet coins not found")
-                add_coins_amount_to_db(coins_amount, character_name)
+                if getattr(wallet, "changed", True):
+                    add_coins_amount_to_db(coins_amount, character_name)
                 return coins_amount
@@ -8,6 +8,7 @@ from datetime import datetime
 from loguru import logger
 
 from src.database import get_item_info_from_db
+from src.item_catalog import get_item_catalog
 
 printer = pprint.PrettyPrinter()
 
@@ -58,6 +59,10 @@ def convert_list_to_dict(lst: list) -> dict:
 
 
 def is_item_sellable(item_id: str) -> bool:
+    if catalog := get_item_catalog():
+        sellable = catalog.is_item_sellable(item_id)
+        if sellable is not None:
+            return sellable
     item_info = get_item_info_from_db(item_id)
     if "NoSell" in item_info.get("flags") or "AccountBound" in item_info.get("flags"):
         return False
@@ -72,7 +77,7 @@ def is_date_difference_greater_than_one_day(date1, date2):
 
 
 def is_older_than_one_day(date):
-    if (datetime.now() - date).days > 0:
+    if (datetime.now(tz=date.tzinfo) - date).days > 0:
         return True
     return False
 
@@ -91,3 +96,21 @@ def create_session_file(folder_name: str):
     return os.path.join(
         create_program_folder(folder_name), f"session_{datetime_str}.json"
     )
+
+
+def create_session_journal_file(folder_name: str, session_id: str):
+    datetime_str = datetime.now().isoformat(sep="_", timespec="seconds")
+    return os.path.join(
+        create_program_folder(folder_name),
+        "journals",
+        f"session_{datetime_str}_{session_id}.journal",
+    )
+
+
+def create_session_profile_file(folder_name: str, session_id: str):
+    datetime_str = datetime.now().isoformat(sep="_", timespec="seconds")
+    return os.path.join(
+        create_program_folder(folder_name),
+        "profiles",
+        f"session_{datetime_str}_{session_id}.folded",
+    )
@@ -0,0 +1,329 @@
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from typing import Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+logger.remove()
+logger.add(sys.stderr, level="INFO")
+
+CATALOG_FILE_NAME = "item_catalog.bin"
+CATALOG_MAGIC = b"GW2CAT01"
+
+# magic, records count, string table offset
+CATALOG_HEADER = struct.Struct("<8sII")
+# id, vendor_value, flags bitmask, name offset, name length, rarity code, padding
+CATALOG_RECORD = struct.Struct("<IIIIHBx")
+CATALOG_UINT32 = struct.Struct("<I")
+RECORD_VENDOR_VALUE_OFFSET = 4
+RECORD_FLAGS_OFFSET = 8
+
+ITEM_RARITIES = [
+    "Junk",
+    "Basic",
+    "Fine",
+    "Masterwork",
+    "Rare",
+    "Exotic",
+    "Ascended",
+    "Legendary",
+]
+UNKNOWN_RARITY_CODE = 0xFF
+
+ITEM_FLAGS = [
+    "AccountBindOnUse",
+    "AccountBound",
+    "Attuned",
+    "BulkConsume",
+    "DeleteWarning",
+    "HideSuffix",
+    "Infused",
+    "MonsterOnly",
+    "NoMysticForge",
+    "NoSalvage",
+    "NoSell",
+    "NotUpgradeable",
+    "NoUnderwater",
+    "SoulbindOnAcquire",
+    "SoulBindOnUse",
+    "Tonic",
+    "Unique",
+]
+ITEM_FLAGS_BITS = {flag: 1 << index for index, flag in enumerate(ITEM_FLAGS)}
+NO_SELL_FLAG = ITEM_FLAGS_BITS["NoSell"]
+NOT_SELLABLE_FLAGS = ITEM_FLAGS_BITS["NoSell"] | ITEM_FLAGS_BITS["AccountBound"]
+
+_CATALOG = None
+# The path the shared catalog was asked for, its file is a version of it
+_CATALOG_PATH = None
+_CATALOG_LOCK = threading.Lock()
+
+
+def get_default_catalog_path() -> str:
+    return os.path.join(os.path.expanduser("~"), "gw2tracker", CATALOG_FILE_NAME)
+
+
+def get_catalog_versions(path: str) -> List[Tuple[int, str]]:
+    """Return the (version, file path) of every catalog built for a path,
+    oldest first. A file at the path itself predates versioning."""
+    folder, file_name = os.path.split(path)
+    stem, extension = os.path.splitext(file_name)
+    if not os.path.isdir(folder or "."):
+        return []
+    versions = []
+    for name in os.listdir(folder or "."):
+        if name == file_name:
+            versions.append((0, path))
+            continue
+        name_stem, name_extension = os.path.splitext(name)
+        prefix, _, version = name_stem.rpartition(".")
+        if prefix == stem and name_extension == extension and version.isdigit():
+            versions.append((int(version), os.path.join(folder, name)))
+    return sorted(versions)
+
+
+def get_catalog_file(path: str) -> Optional[str]:
+    """Return the file of the newest catalog built for a path."""
+    versions = get_catalog_versions(path)
+    return versions[-1][1] if versions else None
+
+
+def remove_old_catalogs(path: str):
+    """Delete the catalogs older than the newest one. A catalog still mapped,
+    which Windows won't delete, is left for the next build."""
+    for _, file_path in get_catalog_versions(path)[:-1]:
+        try:
+            os.remove(file_path)
+        except OSError as e:
+            logger.debug(f"Keeping old item catalog {file_path}. {e}")
+
+
+def encode_item_flags(flags: Optional[List[str]]) -> int:
+    bitmask = 0
+    for flag in flags or []:
+        bitmask |= ITEM_FLAGS_BITS.get(flag, 0)
+    return bitmask
+
+
+def decode_item_flags(bitmask: int) -> List[str]:
+    return [flag for flag, bit in ITEM_FLAGS_BITS.items() if bitmask & bit]
+
+
+def encode_item_rarity(rarity: Optional[str]) -> int:
+    try:
+        return ITEM_RARITIES.index(rarity)
+    except ValueError:
+        return UNKNOWN_RARITY_CODE
+
+
+def build_item_catalog(items: Iterable[dict], path: Optional[str] = None) -> str:
+    """Write the items to a fixed-width binary catalog sorted by item id.
+
+    Args:
+        items (Iterable[dict]): Items as returned by the ``/items`` endpoint.
+        path (str, optional): Where to write the catalog. Defaults to the program
+            folder.
+
+    Every build is written to a file of its own, ``item_catalog.<version>.bin``
+    for the default path, so a catalog mapped by a running tracker is never
+    overwritten; it keeps reading the old file until it reloads.
+
+    Returns:
+        str: The path to open the catalog with, see :func:`get_item_catalog`.
+    """
+    path = path or get_default_catalog_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Only the encoded fields are kept, items can be streamed from a dump
+    items_by_id = {}
+    for item in items:
+        if item and item.get("id") is not None:
+            items_by_id[int(item.get("id"))] = (
+                int(item.get("vendor_value") or 0),
+                encode_item_flags(item.get("flags")),
+                (item.get("name") or "").encode("utf-8")[:0xFFFF],
+                encode_item_rarity(item.get("rarity")),
+            )
+
+    count = len(items_by_id)
+    records = bytearray()
+    names = bytearray()
+    for item_id in sorted(items_by_id):
+        vendor_value, flags, name, rarity_code = items_by_id.pop(item_id)
+        records += CATALOG_RECORD.pack(
+            item_id, vendor_value, flags, len(names), len(name), rarity_code
+        )
+        names += name
+
+    header = CATALOG_HEADER.pack(
+        CATALOG_MAGIC, count, CATALOG_HEADER.size + len(records)
+    )
+    stem, extension = os.path.splitext(path)
+    version_path = f"{stem}.{time.time_ns()}{extension}"
+    # Write to a temporary file first so a catalog is never read half written
+    temporary_path = f"{version_path}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(header)
+        f.write(records)
+        f.write(names)
+    os.replace(temporary_path, version_path)
+    logger.info(f"Item catalog with {count} items written to {version_path}")
+    remove_old_catalogs(path)
+    return path
+
+
+class ItemCatalog:
+    """Read-only, memory-mapped view over a catalog written by
+    :func:`build_item_catalog`. Lookups binary search the sorted id column."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self._strings_offset = CATALOG_HEADER.unpack_from(
+            self._mmap, 0
+        )
+        if magic != CATALOG_MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not an item catalog")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, item_id) -> bool:
+        return self._find(item_id) >= 0
+
+    def close(self):
+        """Unmap the file, which also closes the descriptor the map holds. The
+        shared catalog is never closed, other threads may still read it: it is
+        unmapped once the last reference to it is gone."""
+        self._mmap.close()
+
+    def _record_offset(self, index: int) -> int:
+        return CATALOG_HEADER.size + index * CATALOG_RECORD.size
+
+    def _find(self, item_id) -> int:
+        try:
+            item_id = int(item_id)
+        except (TypeError, ValueError):
+            return -1
+        low, high = 0, self.count - 1
+        while low <= high:
+            middle = (low + high) // 2
+            (middle_id,) = CATALOG_UINT32.unpack_from(
+                self._mmap, self._record_offset(middle)
+            )
+            if middle_id < item_id:
+                low = middle + 1
+            elif middle_id > item_id:
+                high = middle - 1
+            else:
+                return middle
+        return -1
+
+    def _get_record(self, item_id) -> Optional[tuple]:
+        index = self._find(item_id)
+        if index < 0:
+            return None
+        return CATALOG_RECORD.unpack_from(self._mmap, self._record_offset(index))
+
+    def is_item_sellable(self, item_id) -> Optional[bool]:
+        """Return None when the item is not in the catalog."""
+        index = self._find(item_id)
+        if index < 0:
+            return None
+        (flags,) = CATALOG_UINT32.unpack_from(
+            self._mmap, self._record_offset(index) + RECORD_FLAGS_OFFSET
+        )
+        return not flags & NOT_SELLABLE_FLAGS
+
+    def can_sell_item_to_vendor(self, item_id) -> Optional[bool]:
+        index = self._find(item_id)
+        if index < 0:
+            return None
+        (flags,) = CATALOG_UINT32.unpack_from(
+            self._mmap, self._record_offset(index) + RECORD_FLAGS_OFFSET
+        )
+        return not flags & NO_SELL_FLAG
+
+    def get_item_vendor_value(self, item_id) -> Optional[int]:
+        index = self._find(item_id)
+        if index < 0:
+            return None
+        (vendor_value,) = CATALOG_UINT32.unpack_from(
+            self._mmap, self._record_offset(index) + RECORD_VENDOR_VALUE_OFFSET
+        )
+        return vendor_value
+
+    def get_item_name(self, item_id) -> Optional[str]:
+        record = self._get_record(item_id)
+        if not record:
+            return None
+        name_start = self._strings_offset + record[3]
+        name_end = name_start + record[4]
+        return self._mmap[name_start:name_end].decode("utf-8")
+
+    def get_item_info(self, item_id) -> Optional[dict]:
+        """Return the catalog fields shaped like an ``/items`` document."""
+        record = self._get_record(item_id)
+        if not record:
+            return None
+        rarity_code = record[5]
+        return {
+            "id": record[0],
+            "name": self.get_item_name(item_id),
+            "vendor_value": record[1],
+            "flags": decode_item_flags(record[2]),
+            "rarity": ITEM_RARITIES[rarity_code]
+            if rarity_code < len(ITEM_RARITIES)
+            else None,
+        }
+
+
+def get_item_catalog(path: Optional[str] = None) -> Optional[ItemCatalog]:
+    """Return the shared catalog, or None when it has not been built yet."""
+    global _CATALOG, _CATALOG_PATH
+    path = path or get_default_catalog_path()
+    with _CATALOG_LOCK:
+        if _CATALOG and _CATALOG_PATH == path:
+            return _CATALOG
+        file_path = get_catalog_file(path)
+        if not file_path:
+            return None
+        try:
+            catalog = ItemCatalog(file_path)
+        except Exception as e:
+            logger.warning(f"Error opening item catalog {file_path}. {e}")
+            return None
+        # The catalog replaced isn't closed, callers may still hold it
+        _CATALOG = catalog
+        _CATALOG_PATH = path
+        return _CATALOG
+
+
+def reload_item_catalog(path: Optional[str] = None) -> Optional[ItemCatalog]:
+    """Open the newest catalog, e.g. after it was rebuilt."""
+    global _CATALOG
+    with _CATALOG_LOCK:
+        _CATALOG = None
+    return get_item_catalog(path)
+
+
+def build_item_catalog_from_api(path: Optional[str] = None) -> str:
+    """Fetch every item from the ``/items`` endpoint and write the catalog."""
+    from src.database import CONFIG
+    from src.gw2api import Gw2Api
+
+    api = Gw2Api(api_key=os.getenv("GW2_API_KEY") or CONFIG.get("api_key"))
+    items_ids = api.get_all_gw2_items_ids()
+    items = api.get_items_info([str(item_id) for item_id in items_ids])
+    path = build_item_catalog(items, path)
+    reload_item_catalog(path)
+    return path
+
+
+if __name__ == "__main__":
+    build_item_catalog_from_api(sys.argv[1] if len(sys.argv) > 1 else None)
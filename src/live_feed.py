@@ -0,0 +1,264 @@
+import base64
+import hashlib
+import json
+import socket
+import struct
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Set
+
+from loguru import logger
+
+logger.remove()
+logger.add(sys.stderr, level="INFO")
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+WEBSOCKET_TEXT_OPCODE = 0x1
+WEBSOCKET_CLOSE_OPCODE = 0x8
+WEBSOCKET_PING_OPCODE = 0x9
+WEBSOCKET_PONG_OPCODE = 0xA
+# Values served to readers, the per-item breakdown stays in the window
+LIVE_FEED_FIELDS = (
+    "start_value",
+    "current_value",
+    "inventory_value",
+    "characters_values",
+    "materials_value",
+    "bank_value",
+    "shared_inventory_value",
+    "wallet_value",
+    "trading_post_value",
+    "trading_post_sales",
+    "profit_value",
+    "top_movers",
+    "stale",
+)
+
+
+def encode_websocket_frame(payload: bytes, opcode: int = WEBSOCKET_TEXT_OPCODE) -> bytes:
+    header = bytes([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        header += bytes([length])
+    elif length < 1 << 16:
+        header += bytes([126]) + struct.pack("!H", length)
+    else:
+        header += bytes([127]) + struct.pack("!Q", length)
+    return header + payload
+
+
+def read_exactly(stream, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) < size:
+        raise ConnectionError("Websocket closed")
+    return data
+
+
+def read_websocket_frame(stream):
+    """Read one client frame, returns (opcode, payload)."""
+    first_byte, second_byte = read_exactly(stream, 2)
+    opcode = first_byte & 0x0F
+    length = second_byte & 0x7F
+    if length == 126:
+        (length,) = struct.unpack("!H", read_exactly(stream, 2))
+    elif length == 127:
+        (length,) = struct.unpack("!Q", read_exactly(stream, 8))
+    mask = read_exactly(stream, 4) if second_byte & 0x80 else None
+    payload = read_exactly(stream, length)
+    if mask:
+        payload = bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+    return opcode, payload
+
+
+class WebSocketClient:
+    """A connected WebSocket reader.
+
+    Values frames are sent by a thread of its own and only the latest one not
+    sent yet is kept, so a slow reader only falls behind instead of holding
+    up the tracker. Every frame written to the socket holds ``write_lock``.
+    """
+
+    def __init__(self, connection: socket.socket):
+        self.connection = connection
+        self.write_lock = threading.Lock()
+        self.condition = threading.Condition()
+        self.pending_frame: Optional[bytes] = None
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def push(self, frame: bytes):
+        """Queue a values frame, replacing the one not sent yet."""
+        with self.condition:
+            self.pending_frame = frame
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending_frame is None and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                frame, self.pending_frame = self.pending_frame, None
+            if not self.send(frame):
+                return
+
+    def send(self, frame: bytes) -> bool:
+        try:
+            with self.write_lock:
+                self.connection.sendall(frame)
+            return True
+        except OSError:
+            self.close()
+            return False
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+
+class LiveFeed:
+    """Serves the latest session values to local readers.
+
+    ``GET /values`` returns them as JSON with an ETag, so readers polling with
+    ``If-None-Match`` get a 304 until the values change. ``/ws`` upgrades to a
+    WebSocket that pushes the values every time they change. Readers never
+    cause API calls, they only see what the tracker already computed.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765):
+        self.host = host
+        self.port = port
+        self.values = {}
+        self.payload = b"{}"
+        self.etag = self.make_etag(self.payload)
+        self.lock = threading.Lock()
+        self.websockets: Set[WebSocketClient] = set()
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    @staticmethod
+    def make_etag(payload: bytes) -> str:
+        return f'"{hashlib.blake2b(payload, digest_size=8).hexdigest()}"'
+
+    def publish(self, values: dict):
+        """Merge the values with the latest ones and push them if they changed."""
+        with self.lock:
+            for field in LIVE_FEED_FIELDS:
+                if field in values:
+                    self.values[field] = values[field]
+            payload = json.dumps(
+                self.values, sort_keys=True, separators=(",", ":"), default=str
+            ).encode("utf-8")
+            if payload == self.payload:
+                return
+            self.payload = payload
+            self.etag = self.make_etag(payload)
+            websockets = list(self.websockets)
+        frame = encode_websocket_frame(payload)
+        for websocket in websockets:
+            websocket.push(frame)
+
+    def get_payload(self):
+        with self.lock:
+            return self.payload, self.etag
+
+    def add_websocket(self, connection: socket.socket) -> WebSocketClient:
+        websocket = WebSocketClient(connection)
+        with self.lock:
+            self.websockets.add(websocket)
+        return websocket
+
+    def remove_websocket(self, websocket: WebSocketClient):
+        with self.lock:
+            self.websockets.discard(websocket)
+        websocket.close()
+
+    def start(self) -> bool:
+        live_feed = self
+
+        class LiveFeedRequestHandler(BaseHTTPRequestHandler):
+            # WebSocket handshakes must be HTTP/1.1
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+            def do_GET(self):
+                if self.path.split("?")[0] == "/ws":
+                    self.serve_websocket()
+                elif self.path.split("?")[0] in ("/", "/values"):
+                    self.serve_values()
+                else:
+                    self.send_error(404)
+
+            def serve_values(self):
+                payload, etag = live_feed.get_payload()
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("Content-Length", "0")
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def serve_websocket(self):
+                key = self.headers.get("Sec-WebSocket-Key")
+                if self.headers.get("Upgrade", "").lower() != "websocket" or not key:
+                    self.send_error(400, "Expected a WebSocket upgrade")
+                    return
+                accept = base64.b64encode(
+                    hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()
+                ).decode()
+                self.send_response(101)
+                self.send_header("Upgrade", "websocket")
+                self.send_header("Connection", "Upgrade")
+                self.send_header("Sec-WebSocket-Accept", accept)
+                self.end_headers()
+                self.wfile.flush()
+                websocket = live_feed.add_websocket(self.connection)
+                websocket.push(encode_websocket_frame(live_feed.get_payload()[0]))
+                try:
+                    while True:
+                        opcode, payload = read_websocket_frame(self.rfile)
+                        if opcode == WEBSOCKET_CLOSE_OPCODE:
+                            websocket.send(
+                                encode_websocket_frame(payload, WEBSOCKET_CLOSE_OPCODE)
+                            )
+                            break
+                        if opcode == WEBSOCKET_PING_OPCODE:
+                            websocket.send(
+                                encode_websocket_frame(payload, WEBSOCKET_PONG_OPCODE)
+                            )
+                except (ConnectionError, OSError):
+                    pass
+                finally:
+                    live_feed.remove_websocket(websocket)
+                    self.close_connection = True
+
+        try:
+            self.server = ThreadingHTTPServer(
+                (self.host, self.port), LiveFeedRequestHandler
+            )
+        except OSError as e:
+            logger.warning(f"Error starting the live feed on port {self.port}. {e}")
+            return False
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info(f"Live feed serving on http://{self.host}:{self.port}/values")
+        return True
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
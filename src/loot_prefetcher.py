@@ -0,0 +1,106 @@
+import sys
+import threading
+from typing import Callable, List, Optional
+
+from loguru import logger
+
+from src.gw2api import Gw2Api
+from src.snapshots import hash_snapshot
+
+logger.remove()
+logger.add(sys.stderr, level="INFO")
+
+
+class LootPrefetcher:
+    """Polls the character inventory between ticks and warms the item info and
+    prices of newly looted items, so the tick doesn't wait on them.
+
+    The inventories are fetched without taking a snapshot: the snapshots are
+    left to the tick, which would otherwise see the loot as unchanged.
+
+    Args:
+        api (Gw2Api): The API of the tracked account.
+        resolve_items (Callable): Resolves the info and prices of item ids in
+            bulk, e.g. :meth:`SessionTracker.resolve_sale_channels`.
+        is_resolved (Callable): Whether an item id is already resolved.
+        interval_seconds (float): Time between inventory polls.
+        on_loot (Optional[Callable]): Called when the inventory changed.
+        all_characters (bool): Poll the inventories of every character, with a
+            single request like the tick, instead of the active one's.
+    """
+
+    def __init__(
+        self,
+        api: Gw2Api,
+        resolve_items: Callable[[List[int]], None],
+        is_resolved: Callable[[int], bool],
+        interval_seconds: float = 15,
+        on_loot: Optional[Callable[[], None]] = None,
+        all_characters: bool = True,
+    ):
+        self.api = api
+        self.resolve_items = resolve_items
+        self.is_resolved = is_resolved
+        self.interval_seconds = interval_seconds
+        self.on_loot = on_loot
+        self.all_characters = all_characters
+        self.inventory_hash: Optional[str] = None
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def poll(self) -> List[int]:
+        """Warm the items seen in the inventory for the first time.
+
+        Returns:
+            List[int]: The ids that were prefetched.
+        """
+        if self.all_characters:
+            inventories = self.api.get_characters_inventories_items(snapshot=False)
+            inventory_items = [
+                item for items in (inventories or {}).values() for item in items
+            ]
+        else:
+            inventory_items = self.api.get_character_inventory_items(snapshot=False)
+        if not inventory_items:
+            # Failed to fetch
+            return []
+        inventory_hash = hash_snapshot(inventory_items)
+        previous_inventory_hash = self.inventory_hash
+        if inventory_hash == previous_inventory_hash:
+            return []
+        self.inventory_hash = inventory_hash
+        new_items_ids = list(
+            {
+                int(item.get("id"))
+                for item in inventory_items
+                if item and not self.is_resolved(item.get("id"))
+            }
+        )
+        if new_items_ids:
+            logger.info(f"Prefetching {len(new_items_ids)} newly looted items")
+            self.resolve_items(new_items_ids)
+        # The first poll has nothing to compare with
+        if self.on_loot and previous_inventory_hash is not None:
+            self.on_loot()
+        return new_items_ids
+
+    def run(self):
+        while not self.stop_event.wait(self.interval_seconds):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.warning(f"Error prefetching looted items. {e}")
+
+    def start(self):
+        if self.thread or not self.interval_seconds:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop polling, waiting for a poll in progress to finish."""
+        self.stop_event.set()
+        thread, self.thread = self.thread, None
+        if thread and thread is not threading.current_thread():
+            thread.join()
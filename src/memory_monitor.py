@@ -0,0 +1,183 @@
+import os
+import sys
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+logger.remove()
+logger.add(sys.stderr, level="INFO")
+
+SRC_FOLDER = os.path.dirname(os.path.abspath(__file__))
+TOP_GROWTH_COUNT = 10
+
+
+def get_subsystem(filename: str) -> str:
+    """Name the subsystem that owns a source file: the module for files of the
+    tracker, the top-level package for installed packages, else "python"."""
+    filename = os.path.abspath(filename)
+    if filename.startswith(SRC_FOLDER + os.sep):
+        return os.path.splitext(os.path.basename(filename))[0]
+    parts = filename.split(os.sep)
+    for folder in ("site-packages", "dist-packages"):
+        if folder in parts:
+            index = parts.index(folder)
+            if index + 1 < len(parts):
+                return os.path.splitext(parts[index + 1])[0]
+    return "python"
+
+
+def evict_oldest(cache: dict, count: int) -> int:
+    """Drop the ``count`` entries inserted first in a dict. Returns how many
+    were dropped."""
+    evicted = 0
+    for key in list(cache)[:count]:
+        cache.pop(key, None)
+        evicted += 1
+    return evicted
+
+
+class MemoryMonitor:
+    """Keeps the caches of a long-running tracker under their ceilings and, when
+    ``every_ticks`` is set, traces allocations to report where memory grows.
+
+    Every ``every_ticks`` ticks a tracemalloc snapshot is taken, the memory held
+    by each subsystem is logged along with the lines that allocated the most
+    since the previous snapshot.
+
+    Args:
+        every_ticks (int): Ticks between snapshots, 0 disables tracing.
+        top_count (int): How many growth sites are reported.
+        frames (int): Frames kept per allocation traceback.
+    """
+
+    def __init__(
+        self, every_ticks: int = 0, top_count: int = TOP_GROWTH_COUNT, frames: int = 1
+    ):
+        self.every_ticks = every_ticks
+        self.top_count = top_count
+        self.frames = frames
+        self.ticks = 0
+        self.previous_snapshot: Optional[tracemalloc.Snapshot] = None
+        # name -> (size, evict, ceiling)
+        self.caches: Dict[str, Tuple[Callable[[], int], Callable[[int], int], int]] = {}
+        self.evictions: Dict[str, int] = {}
+        self.last_report: Optional[dict] = None
+
+    def register_cache(
+        self,
+        name: str,
+        size: Callable[[], int],
+        evict: Callable[[int], int],
+        ceiling: Optional[int],
+    ):
+        """Bound a cache to ``ceiling`` entries.
+
+        Args:
+            name (str): Name used in the reports.
+            size (Callable): Returns the number of entries in the cache.
+            evict (Callable): Evicts the given number of entries, returns how
+                many it evicted.
+            ceiling (Optional[int]): Maximum entries, None or 0 leaves the cache
+                unbounded but still reported.
+        """
+        self.caches[name] = (size, evict, ceiling or 0)
+        self.evictions.setdefault(name, 0)
+
+    def start(self):
+        if self.every_ticks and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    def stop(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.previous_snapshot = None
+
+    def enforce_ceilings(self) -> Dict[str, int]:
+        """Evict the entries over the ceiling of each cache.
+
+        Returns:
+            Dict[str, int]: The entries evicted from each cache.
+        """
+        evicted = {}
+        for name, (size, evict, ceiling) in self.caches.items():
+            if not ceiling:
+                continue
+            excess = size() - ceiling
+            if excess > 0:
+                evicted[name] = evict(excess)
+                self.evictions[name] += evicted[name]
+                logger.info(f"Evicted {evicted[name]} entries from {name}")
+        return evicted
+
+    def get_caches_sizes(self) -> Dict[str, int]:
+        return {name: size() for name, (size, _, _) in self.caches.items()}
+
+    def get_subsystems_sizes(self, snapshot: tracemalloc.Snapshot) -> Dict[str, int]:
+        sizes = {}
+        for stat in snapshot.statistics("filename"):
+            subsystem = get_subsystem(stat.traceback[0].filename)
+            sizes[subsystem] = sizes.get(subsystem, 0) + stat.size
+        return dict(sorted(sizes.items(), key=lambda item: item[1], reverse=True))
+
+    def get_top_growth(self, snapshot: tracemalloc.Snapshot) -> List[Tuple[str, int]]:
+        if self.previous_snapshot is None:
+            return []
+        growth = []
+        for stat in snapshot.compare_to(self.previous_snapshot, "lineno"):
+            if stat.size_diff <= 0:
+                continue
+            frame = stat.traceback[0]
+            growth.append((f"{frame.filename}:{frame.lineno}", stat.size_diff))
+            if len(growth) >= self.top_count:
+                break
+        return growth
+
+    def take_report(self) -> dict:
+        """Snapshot the traced allocations and compare them with the last one."""
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            )
+        )
+        traced_size, traced_peak = tracemalloc.get_traced_memory()
+        report = {
+            "tick": self.ticks,
+            "traced_size": traced_size,
+            "traced_peak": traced_peak,
+            "subsystems": self.get_subsystems_sizes(snapshot),
+            "top_growth": self.get_top_growth(snapshot),
+            "caches": self.get_caches_sizes(),
+            "evictions": dict(self.evictions),
+        }
+        self.previous_snapshot = snapshot
+        return report
+
+    def log_report(self, report: dict):
+        logger.info(
+            f"Memory at tick {report['tick']}: {report['traced_size'] / 1024:.0f} KiB"
+            f" traced, {report['traced_peak'] / 1024:.0f} KiB peak"
+        )
+        for subsystem, size in report["subsystems"].items():
+            logger.info(f"  {subsystem}: {size / 1024:.0f} KiB")
+        for site, size_diff in report["top_growth"]:
+            logger.info(f"  +{size_diff / 1024:.1f} KiB at {site}")
+        logger.info(f"  caches: {report['caches']}, evictions: {report['evictions']}")
+
+    def tick(self) -> Optional[dict]:
+        """Enforce the cache ceilings and, every ``every_ticks`` ticks, report
+        the memory growth.
+
+        Returns:
+            Optional[dict]: The report, if one was taken this tick.
+        """
+        self.ticks += 1
+        self.enforce_ceilings()
+        if not self.every_ticks or self.ticks % self.every_ticks:
+            return None
+        self.start()
+        report = self.take_report()
+        self.log_report(report)
+        self.last_report = report
+        return report
@@ -0,0 +1,346 @@
+import copy
+import itertools
+import sys
+import threading
+from typing import Any, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+logger.remove()
+logger.add(sys.stderr, level="INFO")
+
+MISSING = object()
+
+
+def get_field(document: dict, key: str, default=MISSING):
+    value = document
+    for part in key.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return default
+        value = value[part]
+    return value
+
+
+def set_field(document: dict, key: str, value):
+    parts = key.split(".")
+    for part in parts[:-1]:
+        document = document.setdefault(part, {})
+    document[parts[-1]] = value
+
+
+def unset_field(document: dict, key: str):
+    *parents, name = key.split(".")
+    parent = get_field(document, ".".join(parents)) if parents else document
+    if isinstance(parent, dict):
+        parent.pop(name, None)
+
+
+def match_condition(value, condition) -> bool:
+    if isinstance(condition, dict) and any(key.startswith("$") for key in condition):
+        for operator, operand in condition.items():
+            if operator == "$in":
+                if value is MISSING or value not in operand:
+                    return False
+            elif operator == "$nin":
+                if value is not MISSING and value in operand:
+                    return False
+            elif operator == "$ne":
+                if value is not MISSING and value == operand:
+                    return False
+            elif operator == "$exists":
+                if (value is not MISSING) != bool(operand):
+                    return False
+            elif operator in ("$gt", "$gte", "$lt", "$lte"):
+                if value is MISSING or value is None:
+                    return False
+                if operator == "$gt" and not value > operand:
+                    return False
+                if operator == "$gte" and not value >= operand:
+                    return False
+                if operator == "$lt" and not value < operand:
+                    return False
+                if operator == "$lte" and not value <= operand:
+                    return False
+            else:
+                raise NotImplementedError(f"Operator {operator} not supported")
+        return True
+    if value is MISSING:
+        return condition is None
+    return value == condition
+
+
+def match_document(document: dict, filter: Optional[dict]) -> bool:
+    for key, condition in (filter or {}).items():
+        if key == "$or":
+            if not any(match_document(document, sub_filter) for sub_filter in condition):
+                return False
+        elif not match_condition(get_field(document, key), condition):
+            return False
+    return True
+
+
+def project_document(document: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return copy.deepcopy(document)
+    included = [key for key, value in projection.items() if value and key != "_id"]
+    if not included:
+        projected = copy.deepcopy(document)
+        for key, value in projection.items():
+            if not value:
+                projected.pop(key, None)
+        return projected
+    projected = {}
+    if projection.get("_id", 1) and "_id" in document:
+        projected["_id"] = document["_id"]
+    for key in included:
+        value = get_field(document, key)
+        if value is not MISSING:
+            set_field(projected, key, copy.deepcopy(value))
+    return projected
+
+
+def apply_update(document: dict, update: dict, inserting: bool = False):
+    for operator, fields in update.items():
+        if operator == "$set":
+            for key, value in fields.items():
+                set_field(document, key, copy.deepcopy(value))
+        elif operator == "$setOnInsert":
+            if inserting:
+                for key, value in fields.items():
+                    set_field(document, key, copy.deepcopy(value))
+        elif operator == "$inc":
+            for key, value in fields.items():
+                current_value = get_field(document, key, 0)
+                set_field(document, key, current_value + value)
+        elif operator == "$unset":
+            for key in fields:
+                unset_field(document, key)
+        elif operator == "$max":
+            for key, value in fields.items():
+                current_value = get_field(document, key)
+                if current_value is MISSING or value > current_value:
+                    set_field(document, key, value)
+        elif operator == "$min":
+            for key, value in fields.items():
+                current_value = get_field(document, key)
+                if current_value is MISSING or value < current_value:
+                    set_field(document, key, value)
+        else:
+            raise NotImplementedError(f"Operator {operator} not supported")
+
+
+class MemoryCursor(list):
+    """The list of documents returned by :meth:`MemoryCollection.find`, with the
+    cursor methods the tracker uses."""
+
+    def sort(self, key_or_list, direction: int = 1):
+        keys = (
+            key_or_list
+            if isinstance(key_or_list, list)
+            else [(key_or_list, direction)]
+        )
+        for key, key_direction in reversed(keys):
+            super().sort(
+                key=lambda document: (
+                    get_field(document, key, None) is None,
+                    get_field(document, key, None),
+                ),
+                reverse=key_direction < 0,
+            )
+        return self
+
+    def limit(self, count: int):
+        if count:
+            del self[count:]
+        return self
+
+
+class MemoryCollection:
+    """A small, thread-safe subset of the pymongo ``Collection`` API backed by a
+    list of dicts. Writes are recorded on the database so they can be replayed
+    once MongoDB is reachable again."""
+
+    def __init__(self, database: "MemoryDatabase", name: str):
+        self.database = database
+        self.name = name
+        self._documents: List[dict] = []
+        self._lock = threading.RLock()
+
+    def _queue_write(self, method: str, *args, **kwargs):
+        self.database.queue_write(self.name, method, copy.deepcopy(args), kwargs)
+
+    def _insert(self, document: dict) -> dict:
+        document = copy.deepcopy(document)
+        document.setdefault("_id", self.database.next_id())
+        self._documents.append(document)
+        return document
+
+    def create_index(self, keys, **kwargs):
+        return keys
+
+    def drop_index(self, index_name: str):
+        pass
+
+    def find(self, filter: Optional[dict] = None, projection: Optional[dict] = None):
+        with self._lock:
+            return MemoryCursor(
+                project_document(document, projection)
+                for document in self._documents
+                if match_document(document, filter)
+            )
+
+    def find_one(self, filter: Optional[dict] = None, projection=None, sort=None):
+        documents = self.find(filter, projection)
+        if sort:
+            documents.sort(sort)
+        return documents[0] if documents else None
+
+    def count_documents(self, filter: Optional[dict] = None) -> int:
+        with self._lock:
+            return sum(
+                1 for document in self._documents if match_document(document, filter)
+            )
+
+    def insert_one(self, document: dict):
+        with self._lock:
+            self._queue_write("insert_one", {k: v for k, v in document.items()})
+            self._insert(document)
+
+    def insert_many(self, documents: Iterable[dict], **kwargs):
+        documents = list(documents)
+        with self._lock:
+            self._queue_write("insert_many", documents, **kwargs)
+            for document in documents:
+                self._insert(document)
+
+    def _update(
+        self, filter: dict, update: dict, upsert: bool, many: bool
+    ) -> Optional[dict]:
+        """Return the last updated or inserted document."""
+        updated_document = None
+        for document in self._documents:
+            if match_document(document, filter):
+                apply_update(document, update)
+                updated_document = document
+                if not many:
+                    break
+        if updated_document is None and upsert:
+            document = {
+                key: copy.deepcopy(value)
+                for key, value in filter.items()
+                if not key.startswith("$") and not isinstance(value, dict)
+            }
+            apply_update(document, update, inserting=True)
+            updated_document = self._insert(document)
+        return updated_document
+
+    def update_one(self, filter: dict, update: dict, upsert: bool = False):
+        with self._lock:
+            self._queue_write("update_one", filter, update, upsert=upsert)
+            self._update(filter, update, upsert, many=False)
+
+    def update_many(self, filter: dict, update: dict, upsert: bool = False):
+        with self._lock:
+            self._queue_write("update_many", filter, update, upsert=upsert)
+            self._update(filter, update, upsert, many=True)
+
+    def find_one_and_update(
+        self, filter: dict, update: dict, upsert: bool = False, **kwargs
+    ):
+        with self._lock:
+            self._queue_write("find_one_and_update", filter, update, upsert=upsert)
+            document = self._update(filter, update, upsert, many=False)
+            return copy.deepcopy(document) if document else None
+
+    def bulk_write(self, requests: list, ordered: bool = True):
+        """Apply update requests exposing ``filter``, ``update`` and ``upsert``
+        attributes, like ``database.BulkUpdate``."""
+        with self._lock:
+            self._queue_write("bulk_write", requests, ordered=ordered)
+            for request in requests:
+                self._update(
+                    request.filter, request.update, request.upsert, many=False
+                )
+
+    def delete_many(self, filter: Optional[dict] = None):
+        with self._lock:
+            self._queue_write("delete_many", filter or {})
+            self._documents = [
+                document
+                for document in self._documents
+                if not match_document(document, filter)
+            ]
+
+    def delete_one(self, filter: dict):
+        with self._lock:
+            self._queue_write("delete_one", filter)
+            for index, document in enumerate(self._documents):
+                if match_document(document, filter):
+                    del self._documents[index]
+                    break
+
+
+class MemoryDatabase:
+    """Stand-in for the MongoDB database used while it is unreachable."""
+
+    def __init__(self, max_pending_writes: int = 100000):
+        self._collections = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.max_pending_writes = max_pending_writes
+        self.pending_writes: List[Tuple[str, str, tuple, dict]] = []
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = MemoryCollection(self, name)
+            return self._collections[name]
+
+    def next_id(self) -> str:
+        return f"memory-{next(self._ids)}"
+
+    def queue_write(self, collection_name: str, method: str, args: tuple, kwargs):
+        with self._lock:
+            if len(self.pending_writes) >= self.max_pending_writes:
+                logger.warning("Too many pending writes, dropping the oldest one")
+                self.pending_writes.pop(0)
+            self.pending_writes.append((collection_name, method, args, kwargs))
+
+    def take_pending_writes(self) -> List[Tuple[str, str, tuple, dict]]:
+        with self._lock:
+            pending_writes = self.pending_writes
+            self.pending_writes = []
+            return pending_writes
+
+    def replay_pending_writes(
+        self, database: Any, retry_on: Tuple[type, ...] = ()
+    ) -> int:
+        """Apply the queued writes, in order, to a pymongo database.
+
+        Args:
+            database: The pymongo database to write to.
+            retry_on: Errors that stop the replay and keep the remaining writes
+                queued. Other errors only skip the failing write.
+
+        Returns:
+            int: How many writes were replayed.
+        """
+        pending_writes = self.take_pending_writes()
+        for index, (collection_name, method, args, kwargs) in enumerate(
+            pending_writes
+        ):
+            try:
+                getattr(database[collection_name], method)(*args, **kwargs)
+            except retry_on as e:
+                with self._lock:
+                    self.pending_writes = pending_writes[index:] + self.pending_writes
+                logger.warning(f"Error replaying {method} on {collection_name}. {e}")
+                return index
+            except Exception as e:
+                logger.warning(f"Skipping {method} on {collection_name}. {e}")
+        return len(pending_writes)
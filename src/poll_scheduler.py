@@ -0,0 +1,170 @@
+import hashlib
+import math
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+from loguru import logger
+
+logger.remove()
+logger.add(sys.stderr, level="INFO")
+
+# Endpoints whose content follows what the player does
+TRACKED_PATHS = ("/v2/account", "/v2/characters", "/v2/commerce/transactions")
+MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+CHANGE_INTERVALS_KEPT = 8
+
+
+def get_cache_seconds(headers) -> Optional[float]:
+    """Seconds until the response expires from the server cache, from the
+    ``Cache-Control``/``Age`` headers or else ``Expires`` and ``Date``."""
+    if match := MAX_AGE_PATTERN.search(headers.get("Cache-Control") or ""):
+        try:
+            age = float(headers.get("Age") or 0)
+        except ValueError:
+            age = 0
+        return max(float(match.group(1)) - age, 0)
+    if headers.get("Expires") and headers.get("Date"):
+        try:
+            expires = parsedate_to_datetime(headers.get("Expires"))
+            date = parsedate_to_datetime(headers.get("Date"))
+        except (TypeError, ValueError):
+            return None
+        return max((expires - date).total_seconds(), 0)
+    return None
+
+
+class EndpointCadence:
+    """What is known about when an endpoint refreshes: when its cached response
+    expires and how often its content changed."""
+
+    def __init__(self):
+        self.content_hash: Optional[str] = None
+        self.last_change_at: Optional[float] = None
+        self.change_intervals = deque(maxlen=CHANGE_INTERVALS_KEPT)
+        self.expires_at: Optional[float] = None
+        self.cache_seconds: Optional[float] = None
+
+    def observe(self, content: bytes, cache_seconds: Optional[float], at: float):
+        if cache_seconds is not None:
+            self.expires_at = at + cache_seconds
+            if cache_seconds:
+                self.cache_seconds = max(cache_seconds, self.cache_seconds or 0)
+        content_hash = hashlib.blake2b(content, digest_size=16).hexdigest()
+        if content_hash != self.content_hash:
+            if self.content_hash is not None and self.last_change_at is not None:
+                self.change_intervals.append(at - self.last_change_at)
+            self.content_hash = content_hash
+            self.last_change_at = at
+
+    def get_cadence(self) -> Optional[float]:
+        """The refresh period: the cache lifetime when the server sends one,
+        else the shortest time seen between two changes."""
+        if self.cache_seconds:
+            return self.cache_seconds
+        if self.change_intervals:
+            return min(self.change_intervals)
+        return None
+
+    def get_refresh_before(self, target: float, now: float) -> Optional[float]:
+        """Latest expected refresh between now and ``target``."""
+        cadence = self.get_cadence()
+        anchor = self.expires_at or self.last_change_at
+        if not cadence or anchor is None:
+            return None
+        refresh = anchor + math.floor((target - anchor) / cadence) * cadence
+        return refresh if refresh > now else None
+
+    def get_refresh_after(self, now: float) -> Optional[float]:
+        """First expected refresh after now."""
+        if self.expires_at and self.expires_at > now:
+            return self.expires_at
+        cadence = self.get_cadence()
+        anchor = self.expires_at or self.last_change_at
+        if not cadence or anchor is None:
+            return None
+        return anchor + (math.floor((now - anchor) / cadence) + 1) * cadence
+
+
+class PollScheduler:
+    """Chooses when the next tick runs.
+
+    The wanted interval starts at ``base_interval``, grows by ``backoff`` on
+    every tick without changes and shrinks by ``tighten`` on every tick with
+    changes or when loot is seen between ticks. The delay is then moved to
+    just after the latest refresh expected before that time: polling before
+    an endpoint refreshes returns the same cached data.
+
+    Args:
+        base_interval (float): Seconds between ticks before anything is known.
+        min_interval (float): Shortest delay between ticks.
+        max_interval (float): Longest delay between ticks.
+        refresh_margin (float): Seconds to wait after an expected refresh.
+    """
+
+    def __init__(
+        self,
+        base_interval: float,
+        min_interval: float = 30,
+        max_interval: float = 600,
+        refresh_margin: float = 2,
+        backoff: float = 1.5,
+        tighten: float = 0.5,
+    ):
+        self.base_interval = base_interval
+        self.min_interval = min(min_interval, base_interval)
+        self.max_interval = max(max_interval, base_interval)
+        self.refresh_margin = refresh_margin
+        self.backoff = backoff
+        self.tighten = tighten
+        self.interval = base_interval
+        self.endpoints: Dict[str, EndpointCadence] = {}
+        self._lock = threading.Lock()
+
+    def observe_response(self, url: str, response, at: Optional[float] = None):
+        """Learn from an API response, meant to be set as ``Gw2Api.on_response``."""
+        path = urllib.parse.urlsplit(url).path
+        if not path.startswith(TRACKED_PATHS) or response.status_code != 200:
+            return
+        at = time.monotonic() if at is None else at
+        with self._lock:
+            endpoint = self.endpoints.setdefault(path, EndpointCadence())
+            endpoint.observe(response.content, get_cache_seconds(response.headers), at)
+
+    def record_tick(self, changed: bool):
+        with self._lock:
+            factor = self.tighten if changed else self.backoff
+            self.interval = min(
+                max(self.interval * factor, self.min_interval), self.max_interval
+            )
+
+    def record_activity(self):
+        """Loot was seen between ticks, poll sooner."""
+        self.record_tick(True)
+
+    def get_next_delay(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            target = now + self.interval
+            earliest = now + self.min_interval
+            refreshes_before = []
+            refreshes_after = []
+            for endpoint in self.endpoints.values():
+                if (refresh := endpoint.get_refresh_before(target, now)) is not None:
+                    refreshes_before.append(refresh)
+                if (refresh := endpoint.get_refresh_after(now)) is not None:
+                    refreshes_after.append(refresh)
+            next_poll = target
+            if refreshes_before:
+                next_poll = max(refreshes_before) + self.refresh_margin
+            elif refreshes_after:
+                # Nothing refreshes before the target, wait for the first refresh
+                next_poll = min(refreshes_after) + self.refresh_margin
+            delay = min(max(next_poll, earliest) - now, self.max_interval)
+        logger.info(f"Next tick in {delay:.0f} seconds")
+        return delay
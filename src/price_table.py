@@ -0,0 +1,73 @@
+import mmap
+import os
+import struct
+import sys
+from typing import Iterable, Optional, Tuple
+
+from loguru import logger
+
+logger.remove()
+logger.add(sys.stderr, level="INFO")
+
+PRICE_TABLE_MAGIC = b"GW2PRC01"
+
+# magic, records count
+PRICE_TABLE_HEADER = struct.Struct("<8sI")
+# id, vendor value, buys unit price, sells unit price
+PRICE_TABLE_RECORD = struct.Struct("<IIII")
+PRICE_TABLE_UINT32 = struct.Struct("<I")
+
+
+def build_price_table(
+    sources: Iterable[Tuple[int, Tuple[int, int, int]]], path: str
+) -> str:
+    """Write (item id, (vendor value, buys, sells)) pairs to a fixed-width
+    binary file sorted by item id."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    sources = sorted(sources)
+    records = bytearray()
+    for item_id, (vendor_value, buys, sells) in sources:
+        records += PRICE_TABLE_RECORD.pack(item_id, vendor_value, buys, sells)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(PRICE_TABLE_HEADER.pack(PRICE_TABLE_MAGIC, len(sources)))
+        f.write(records)
+    os.replace(temporary_path, path)
+    logger.info(f"Price table with {len(sources)} items written to {path}")
+    return path
+
+
+class PriceTable:
+    """Read-only, memory-mapped view over a file written by
+    :func:`build_price_table`. Processes opening the same file share its pages."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = PRICE_TABLE_HEADER.unpack_from(self._mmap, 0)
+        if magic != PRICE_TABLE_MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a price table")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self):
+        self._mmap.close()
+
+    def get_prices(self, item_id: int) -> Optional[Tuple[int, int, int, int]]:
+        """Return the (id, vendor value, buys, sells) record of the item, or
+        None if it is not in the table."""
+        low, high = 0, self.count - 1
+        while low <= high:
+            middle = (low + high) // 2
+            offset = PRICE_TABLE_HEADER.size + middle * PRICE_TABLE_RECORD.size
+            (middle_id,) = PRICE_TABLE_UINT32.unpack_from(self._mmap, offset)
+            if middle_id < item_id:
+                low = middle + 1
+            elif middle_id > item_id:
+                high = middle - 1
+            else:
+                return PRICE_TABLE_RECORD.unpack_from(self._mmap, offset)
+        return None
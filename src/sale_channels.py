@@ -0,0 +1,171 @@
+import sys
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+from loguru import logger
+
+logger.remove()
+logger.add(sys.stderr, level="INFO")
+
+VENDOR_CHANNEL = "vendor"
+TRADING_POST_CHANNEL = "trading_post"
+TRADING_POST_MODES = ("buys", "sells")
+
+
+def best_sale_channel(vendor_value: int, tp_value: int) -> Optional[str]:
+    """Return where an item is worth more, or None when it can't be sold."""
+    if vendor_value == 0 and tp_value == 0:
+        return None
+    if vendor_value >= tp_value:
+        return VENDOR_CHANNEL
+    return TRADING_POST_CHANNEL
+
+
+def can_have_trading_post_price(item_info: Optional[dict]) -> bool:
+    flags = (item_info or {}).get("flags") or []
+    return "AccountBound" not in flags and "SoulbindOnAcquire" not in flags
+
+
+def get_vendor_value_from_item_info(item_info: Optional[dict]) -> int:
+    if not item_info or "NoSell" in (item_info.get("flags") or []):
+        return 0
+    return item_info.get("vendor_value") or 0
+
+
+def get_unit_price_from_tp_price(price: Optional[dict], trading_post_mode: str) -> int:
+    try:
+        return price.get(trading_post_mode).get("unit_price") or 0
+    except AttributeError:
+        return 0
+
+
+class SaleChannelTable:
+    """Maps an item id to its best sale channel and unit value for both trading
+    post modes, so valuing an item is a single lookup.
+
+    Entries are only recomputed when the vendor value or the trading post prices
+    of the item changed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # item id -> (vendor value, buys unit price, sells unit price)
+        self._sources: Dict[int, Tuple[int, int, int]] = {}
+        # item id -> {mode: (channel, unit value)}
+        self._entries: Dict[int, dict] = {}
+        # Incremented on every entry change, lets callers cache valuations
+        self.version = 0
+
+    def __contains__(self, item_id) -> bool:
+        return int(item_id) in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_sources(self) -> Dict[int, Tuple[int, int, int]]:
+        with self._lock:
+            return dict(self._sources)
+
+    def get_source(self, item_id) -> Optional[Tuple[int, int, int]]:
+        with self._lock:
+            return self._sources.get(int(item_id))
+
+    def _set_source(self, item_id: int, source: Tuple[int, int, int]) -> bool:
+        if self._sources.get(item_id) == source:
+            return False
+        self._sources[item_id] = source
+        vendor_value = source[0]
+        entry = {}
+        for mode, tp_value in zip(TRADING_POST_MODES, source[1:]):
+            channel = best_sale_channel(vendor_value, tp_value)
+            unit_value = vendor_value if channel == VENDOR_CHANNEL else tp_value
+            entry[mode] = (channel, unit_value)
+        self._entries[item_id] = entry
+        self.version += 1
+        return True
+
+    def update_item(
+        self, item_id, item_info: Optional[dict], price: Optional[dict]
+    ) -> bool:
+        """Recompute the entry of one item. Returns True if it changed."""
+        source = (
+            get_vendor_value_from_item_info(item_info),
+            get_unit_price_from_tp_price(price, "buys"),
+            get_unit_price_from_tp_price(price, "sells"),
+        )
+        with self._lock:
+            return self._set_source(int(item_id), source)
+
+    def update_items(self, items_info: dict, prices: dict) -> int:
+        """Recompute the entries of the given items info, keyed by item id.
+
+        Returns:
+            int: How many entries changed.
+        """
+        changed = 0
+        for item_id, item_info in items_info.items():
+            if self.update_item(item_id, item_info, prices.get(int(item_id))):
+                changed += 1
+        return changed
+
+    def update_prices(self, prices: Iterable[dict]) -> int:
+        """Apply a price refresh, touching only the items already in the table
+        whose prices changed.
+
+        Returns:
+            int: How many entries changed.
+        """
+        changed = 0
+        with self._lock:
+            for price in prices:
+                if not price:
+                    continue
+                item_id = int(price.get("id"))
+                source = self._sources.get(item_id)
+                if source is None:
+                    continue
+                new_source = (
+                    source[0],
+                    get_unit_price_from_tp_price(price, "buys"),
+                    get_unit_price_from_tp_price(price, "sells"),
+                )
+                if self._set_source(item_id, new_source):
+                    changed += 1
+        logger.info(f"Sale channels updated for {changed} items")
+        return changed
+
+    def evict(self, count: int, keep: Iterable[int] = ()) -> int:
+        """Drop up to ``count`` of the oldest entries whose id is not in
+        ``keep``. Evicted items are resolved again the next time they are seen.
+
+        Returns:
+            int: How many entries were evicted.
+        """
+        keep = {int(item_id) for item_id in keep}
+        evicted = 0
+        with self._lock:
+            for item_id in list(self._entries):
+                if evicted >= count:
+                    break
+                if item_id in keep:
+                    continue
+                del self._entries[item_id]
+                del self._sources[item_id]
+                evicted += 1
+        return evicted
+
+    def lookup(
+        self, item_id, trading_post_mode: str = "sells", bound: bool = False
+    ) -> Optional[Tuple[Optional[str], int]]:
+        """Return the (channel, unit value) of the item, or None if the item is
+        not in the table. Bound items can only be sold to a vendor."""
+        item_id = int(item_id)
+        # Entries and sources change together under the lock, e.g. on eviction
+        with self._lock:
+            entry = self._entries.get(item_id)
+            if entry is None:
+                return None
+            if bound:
+                vendor_value = self._sources[item_id][0]
+                return (VENDOR_CHANNEL if vendor_value else None, vendor_value)
+            return entry[trading_post_mode]
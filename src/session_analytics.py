@@ -0,0 +1,118 @@
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from src.database import (
+    add_session_to_db,
+    get_session_rollup_from_db,
+    increment_session_rollups,
+)
+
+logger.remove()
+logger.add(sys.stderr, level="INFO")
+
+SESSION_TIME_FORMAT = "%Y-%m-%d_%H:%M:%S"
+ALL_TIME = "all"
+
+
+def parse_session_time(value: str) -> datetime:
+    return datetime.strptime(value, SESSION_TIME_FORMAT)
+
+
+def get_session_rollup_keys(session: dict) -> List[tuple]:
+    """Return the (scope, key, period) rollups a session counts towards with
+    its whole profit, the character rollups are in
+    :func:`get_character_rollup_keys`.
+
+    Periods are ``YYYY-MM`` months, ``YYYY-MM-DD`` days or ``all``.
+    """
+    start_time = parse_session_time(session.get("start_time"))
+    month = start_time.strftime("%Y-%m")
+    day = start_time.strftime("%Y-%m-%d")
+    day_of_week = start_time.strftime("%A")
+    rollup_keys = [
+        ("account", ALL_TIME, day),
+        ("account", ALL_TIME, month),
+        ("account", ALL_TIME, ALL_TIME),
+        ("day_of_week", day_of_week, ALL_TIME),
+    ]
+    for tag in session.get("tags") or []:
+        rollup_keys += [("tag", tag, month), ("tag", tag, ALL_TIME)]
+    return rollup_keys
+
+
+def get_character_rollup_keys(session: dict, character: str) -> List[tuple]:
+    start_time = parse_session_time(session.get("start_time"))
+    day_of_week = start_time.strftime("%A")
+    return [
+        ("character", character, start_time.strftime("%Y-%m-%d")),
+        ("character", character, start_time.strftime("%Y-%m")),
+        ("character", character, ALL_TIME),
+        ("character_day_of_week", f"{character}:{day_of_week}", ALL_TIME),
+    ]
+
+
+def get_characters_profits(session: dict) -> Dict[str, int]:
+    """Return the profit of each character of a session: how much its
+    inventory value changed. The bank, wallet and trading post belong to the
+    account and only count towards the account rollups.
+
+    Characters whose inventory didn't change are left out, except the active
+    one, so idle alts don't dilute their profit per hour.
+    """
+    start_values = session.get("characters_start_values") or {}
+    end_values = session.get("characters_values") or {}
+    active_character = session.get("character") or ""
+    characters_profits = {}
+    for character in {*start_values, *end_values, active_character} - {""}:
+        profit = end_values.get(character, 0) - start_values.get(character, 0)
+        if profit or character == active_character:
+            characters_profits[character] = profit
+    return characters_profits
+
+
+def record_closed_session(session: dict) -> bool:
+    """Store a closed session with its timeline and add it to the rollups.
+
+    Returns:
+        bool: False if the session had already been recorded.
+    """
+    if not session.get("timeline"):
+        logger.info("Session has no ticks, not recording it")
+        return False
+    duration_seconds = (
+        parse_session_time(session.get("end_time"))
+        - parse_session_time(session.get("start_time"))
+    ).total_seconds()
+    session = {**session, "duration_seconds": duration_seconds}
+    if not add_session_to_db(session):
+        logger.info(f"Session {session.get('session_id')} already recorded")
+        return False
+    increment_session_rollups(
+        get_session_rollup_keys(session),
+        {
+            "profit": session.get("profit_value") or 0,
+            "duration_seconds": duration_seconds,
+            "sessions": 1,
+        },
+    )
+    for character, profit in get_characters_profits(session).items():
+        increment_session_rollups(
+            get_character_rollup_keys(session, character),
+            {"profit": profit, "duration_seconds": duration_seconds, "sessions": 1},
+        )
+    return True
+
+
+def get_profit_per_hour(scope: str, key: str, period: str = ALL_TIME) -> Optional[float]:
+    """Return the average profit per hour of a rollup, e.g. the average of a
+    character last month is ``get_profit_per_hour("character", name, "2026-09")``.
+    Character rollups only count the inventory of the character, see
+    :func:`get_characters_profits`.
+    """
+    rollup = get_session_rollup_from_db(scope, key, period)
+    if not rollup or not rollup.get("duration_seconds"):
+        return None
+    return rollup.get("profit", 0) / (rollup.get("duration_seconds") / 3600)
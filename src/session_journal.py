@@ -0,0 +1,160 @@
+import csv
+import json
+import os
+import struct
+import sys
+from collections import namedtuple
+from typing import Iterator, Optional
+
+from loguru import logger
+
+logger.remove()
+logger.add(sys.stderr, level="INFO")
+
+JOURNAL_MAGIC = b"GW2JRN01"
+JOURNAL_HEADER = struct.Struct("<8s")
+# payload length, then timestamp, start, current, inventory, materials and profit
+JOURNAL_LENGTH = struct.Struct("<H")
+JOURNAL_PAYLOAD = struct.Struct("<dqqqqq")
+JOURNAL_RECORD = struct.Struct("<Hdqqqqq")
+JOURNAL_FIELDS = (
+    "timestamp",
+    "start_value",
+    "current_value",
+    "inventory_value",
+    "materials_value",
+    "profit_value",
+)
+JournalRecord = namedtuple("JournalRecord", JOURNAL_FIELDS)
+
+
+class SessionJournal:
+    """Append-only journal with one length-prefixed binary record per tick.
+
+    Records are buffered and fsynced every ``fsync_every`` appends. When the
+    journal is reopened a torn record left by a crash is truncated, so every
+    record before it survives.
+    """
+
+    def __init__(self, path: str, fsync_every: int = 10):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.pending_records = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.truncate_torn_record()
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC))
+            self.sync()
+
+    def truncate_torn_record(self):
+        if not os.path.exists(self.path):
+            return
+        size = os.path.getsize(self.path)
+        if size < JOURNAL_HEADER.size:
+            os.truncate(self.path, 0)
+            return
+        torn_bytes = (size - JOURNAL_HEADER.size) % JOURNAL_RECORD.size
+        if torn_bytes:
+            logger.warning(f"Truncating torn record at the end of {self.path}")
+            os.truncate(self.path, size - torn_bytes)
+
+    def append(
+        self,
+        timestamp: float,
+        start_value: int,
+        current_value: int,
+        inventory_value: int,
+        materials_value: int,
+        profit_value: int,
+    ):
+        self.file.write(
+            JOURNAL_RECORD.pack(
+                JOURNAL_PAYLOAD.size,
+                timestamp,
+                start_value or 0,
+                current_value or 0,
+                inventory_value or 0,
+                materials_value or 0,
+                profit_value or 0,
+            )
+        )
+        self.pending_records += 1
+        if self.pending_records >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending_records = 0
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+
+def iter_journal_records(
+    path: str, chunk_records: int = 4096
+) -> Iterator[JournalRecord]:
+    """Stream the records of a journal, reading ``chunk_records`` at a time.
+    Stops at the first incomplete or invalid record."""
+    with open(path, "rb") as f:
+        (magic,) = JOURNAL_HEADER.unpack(f.read(JOURNAL_HEADER.size))
+        if magic != JOURNAL_MAGIC:
+            raise ValueError(f"{path} is not a session journal")
+        while chunk := f.read(JOURNAL_RECORD.size * chunk_records):
+            for offset in range(0, len(chunk), JOURNAL_RECORD.size):
+                end = offset + JOURNAL_RECORD.size
+                record = chunk[offset:end]
+                if len(record) < JOURNAL_RECORD.size:
+                    return
+                (length,) = JOURNAL_LENGTH.unpack_from(record)
+                if length != JOURNAL_PAYLOAD.size:
+                    logger.warning(f"Invalid record in {path}, stopping")
+                    return
+                yield JournalRecord(
+                    *JOURNAL_PAYLOAD.unpack_from(record, JOURNAL_LENGTH.size)
+                )
+
+
+def export_journal_to_csv(path: str, output_path: str) -> int:
+    """Write the journal records as CSV rows. Returns the rows written."""
+    rows = 0
+    with open(output_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(JOURNAL_FIELDS)
+        for record in iter_journal_records(path):
+            writer.writerow(record)
+            rows += 1
+    return rows
+
+
+def export_journal_to_jsonl(path: str, output_path: str) -> int:
+    """Write the journal records as JSON lines. Returns the lines written."""
+    lines = 0
+    with open(output_path, "w") as f:
+        for record in iter_journal_records(path):
+            f.write(json.dumps(record._asdict(), separators=(",", ":")) + "\n")
+            lines += 1
+    return lines
+
+
+def load_journal_as_numpy(path: str, records: Optional[int] = None):
+    """Memory-map the journal as a NumPy structured array, nothing is read
+    until the array is accessed. Requires numpy."""
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError("numpy is needed to load a journal as an array")
+
+    dtype = np.dtype(
+        [("length", "<u2")]
+        + [("timestamp", "<f8")]
+        + [(field, "<i8") for field in JOURNAL_FIELDS[1:]]
+    )
+    if records is None:
+        records = (os.path.getsize(path) - JOURNAL_HEADER.size) // dtype.itemsize
+    return np.memmap(
+        path, dtype=dtype, mode="r", offset=JOURNAL_HEADER.size, shape=(records,)
+    )
@@ -1,11 +1,14 @@
-from datetime import datetime
+from datetime import datetime, timezone
+import heapq
 import json
 import os
-import pprint
 import sys
 import threading
 import time
-from typing import List, Optional
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Callable, List, Optional
 
 from loguru import logger
 
@@ -17,21 +20,112 @@ from src.database import (
     get_current_inventory_value_from_db,
     get_current_material_storage_value_from_db,
     get_item_info_from_db,
-    get_item_name_from_db,
+    get_items_info_by_ids_from_db,
+    get_items_names_from_db,
+    get_transactions_total_from_db,
     get_tp_item_price_by_id_from_db,
+    get_tp_items_prices_by_ids_from_db,
+    upsert_items_info_to_db,
+)
+from src.crafting import (
+    CRAFTING_CHANNEL,
+    CraftValuator,
+    RecipeGraph,
+    get_recipe_graph,
 )
 from src.gw2api import Gw2Api
 from src.helpers import (
+    create_session_journal_file,
+    create_session_profile_file,
     get_current_file_path,
     is_older_than_one_day,
 )
+from src.item_catalog import get_item_catalog
+from src.loot_prefetcher import LootPrefetcher
+from src.memory_monitor import MemoryMonitor, evict_oldest
+from src.poll_scheduler import PollScheduler
+from src.sale_channels import (
+    SaleChannelTable,
+    best_sale_channel,
+    can_have_trading_post_price,
+)
+from src.session_journal import SessionJournal
+from src.tick_profiler import TickProfiler
+from src.trading_post import (
+    TRADING_POST_EXCHANGE_FEE,
+    TRANSACTION_HISTORY_KINDS,
+    TRANSACTION_HISTORY_PAGES_PER_TICK,
+    get_listings_value,
+    ingest_transaction_history,
+)
+from src.wallet import WalletValuator
 
 logger.remove()
 logger.add(sys.stderr, level="INFO")
-printer = pprint.PrettyPrinter()
 
 TRADING_POST_MODE = {"buy": "buys", "sell": "sells"}
 TRADING_POST_DEFAULT_MODE = "sells"
+TOP_MOVERS_COUNT = 5
+# Attribute holding the value of each valued source
+SOURCES_VALUES_ATTRIBUTES = {
+    "inventory": "inventory_value",
+    "materials": "materials_value",
+    "bank": "bank_value",
+    "shared_inventory": "shared_inventory_value",
+    "delivery": "trading_post_value",
+}
+DEFAULT_CACHE_CEILINGS = {"items_names": 20000, "sale_channels": 50000}
+
+
+def resolve_sale_channels(
+    sale_channels: SaleChannelTable, api: Gw2Api, items_ids: List[int]
+):
+    """Add the items missing from the sale channel table, reading their info
+    and prices in bulk and fetching only what the database doesn't have."""
+    missing_ids = [
+        int(item_id)
+        for item_id in set(items_ids)
+        if item_id is not None and item_id not in sale_channels
+    ]
+    if not missing_ids:
+        return
+    items_info = {}
+    ids_not_in_catalog = []
+    catalog = get_item_catalog()
+    for item_id in missing_ids:
+        item_info = catalog.get_item_info(item_id) if catalog else None
+        if item_info:
+            items_info[item_id] = item_info
+        else:
+            ids_not_in_catalog.append(item_id)
+    if ids_not_in_catalog:
+        items_info.update(get_items_info_by_ids_from_db(ids_not_in_catalog))
+        ids_to_fetch = [
+            str(item_id)
+            for item_id in ids_not_in_catalog
+            if item_id not in items_info
+        ]
+        if ids_to_fetch:
+            fetched_items_info = api.get_items_info(ids_to_fetch)
+            upsert_items_info_to_db(fetched_items_info)
+            for item_info in fetched_items_info:
+                items_info[item_info.get("id")] = item_info
+
+    prices = get_tp_items_prices_by_ids_from_db(list(items_info))
+    prices_to_fetch = [
+        str(item_id)
+        for item_id, item_info in items_info.items()
+        if item_id not in prices and can_have_trading_post_price(item_info)
+    ]
+    if prices_to_fetch:
+        for price in api.get_items_prices(prices_to_fetch):
+            prices[price.get("id")] = price
+    sale_channels.update_items(items_info, prices)
+    for item_id in missing_ids:
+        if item_id not in items_info:
+            # Keep unknown items in the table so they aren't looked up every tick
+            logger.warning(f"No item with id {item_id} found")
+            sale_channels.update_item(item_id, None, None)
 
 
 class SessionTracker:
@@ -41,8 +135,26 @@ class SessionTracker:
         self.start_value = 0
         self.current_value = 0
         self.inventory_value = 0
+        # character name -> inventory value
+        self.characters_values = {}
+        # character name -> inventory value when the session started
+        self.characters_start_values = {}
         self.materials_value = 0
+        self.bank_value = 0
+        self.shared_inventory_value = 0
+        self.wallet_value = 0
+        self.trading_post_value = 0
+        self.trading_post_sales = 0
         self.profit_value = 0
+        self.items_values_by_source = {}
+        self.start_items_values = {}
+        self.top_movers = {"gainers": [], "losers": []}
+        self.valuation_cache = {}
+        self.items_breakdown_by_source = {}
+        self.items_names = {}
+        self.session_id = uuid.uuid4().hex
+        self.timeline = []
+        self.journal = None
         if not self.api_key:
             if api_key := os.getenv("GW2_API_KEY"):
                 self.set_api_key(api_key)
@@ -50,12 +162,82 @@ class SessionTracker:
                 self.set_api_key(self.config.get("api_key"))
         self.api = Gw2Api(api_key=self.api_key)
         self.api.set_active_character(self.config.get("character"))
+        self.poll_scheduler = PollScheduler(
+            (self.config.get("update_every_minutes") or 1) * 60,
+            self.config.get("poll_min_seconds", 30),
+            self.config.get("poll_max_seconds", 600),
+        )
+        if self.config.get("adaptive_polling", True):
+            self.api.on_response = self.poll_scheduler.observe_response
+        # Sources whose snapshot changed during the current tick
+        self.tick_changes = set()
+        # Lookups not done within tick_budget_seconds finish in the background
+        # and the stale sources are valued again once they are done
+        self.tick_budget_seconds = self.config.get("tick_budget_seconds", 10)
+        self.tick_deadline: Optional[float] = None
+        self.tick_lock = threading.RLock()
+        # Created again by start_session once stop_session shut it down
+        self.lookups_executor: Optional[ThreadPoolExecutor] = None
+        self.start_lookups()
+        self.budget_misses = 0
+        self.stale = False
+        self.stale_sources = {}
+        self.sources_values = {}
+        self.on_revalidated: Optional[Callable[[dict], None]] = None
+        self.sale_channels = SaleChannelTable()
+        self.wallet_valuator = WalletValuator(
+            self.api,
+            self.config.get("currency_rates"),
+            self.config.get("gems_exchange_ttl_seconds", 600),
+        )
+        self.loot_prefetcher = LootPrefetcher(
+            self.api,
+            self.resolve_sale_channels,
+            lambda item_id: item_id in self.sale_channels,
+            self.config.get("prefetch_every_seconds", 15),
+            self.poll_scheduler.record_activity,
+            self.config.get("track_all_characters", True),
+        )
         update_tp_prices_thread = threading.Thread(
             target=self.update_trading_post_prices
         )
         update_tp_prices_thread.start()
+        # Values items that can't be sold, like precursors, by their recipes
+        self.recipe_graph = (
+            get_recipe_graph(self.api)
+            if self.config.get("crafting_valuation", True)
+            else RecipeGraph()
+        )
+        # The graph is shared, the market values it is priced with are not
+        self.craft_valuator = CraftValuator(self.recipe_graph)
+        self.session_tags = self.config.get("session_tags", [])
+        self.memory_monitor = MemoryMonitor(
+            self.config.get("memory_report_every_ticks", 0)
+        )
+        self.register_caches()
+        # Samples the ticks when profile_ticks is set, see start_session
+        self.tick_profiler: Optional[TickProfiler] = None
         self.start_time = datetime.now()
 
+    def register_caches(self):
+        cache_ceilings = {
+            **DEFAULT_CACHE_CEILINGS,
+            **self.config.get("cache_ceilings", {}),
+        }
+        self.memory_monitor.register_cache(
+            "items_names",
+            lambda: len(self.items_names),
+            lambda count: evict_oldest(self.items_names, count),
+            cache_ceilings.get("items_names"),
+        )
+        # Items held right now are kept, their entries are needed every tick
+        self.memory_monitor.register_cache(
+            "sale_channels",
+            lambda: len(self.sale_channels),
+            lambda count: self.sale_channels.evict(count, keep=self.get_items_values()),
+            cache_ceilings.get("sale_channels"),
+        )
+
     def get_api(self):
         return self.api
 
@@ -67,16 +249,71 @@ class SessionTracker:
         self.start_value = 0
         self.current_value = 0
         self.inventory_value = 0
+        self.characters_values = {}
+        self.characters_start_values = {}
         self.materials_value = 0
+        self.bank_value = 0
+        self.shared_inventory_value = 0
+        self.wallet_value = 0
+        self.trading_post_value = 0
+        self.trading_post_sales = 0
         self.profit_value = 0
+        self.items_values_by_source = {}
+        self.start_items_values = {}
+        self.top_movers = {"gainers": [], "losers": []}
+        self.items_breakdown_by_source = {}
+        self.valuation_cache = {}
+        self.sources_values = {}
+        self.stale_sources = {}
+        self.stale = False
+        self.session_id = uuid.uuid4().hex
+        self.timeline = []
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+        if self.tick_profiler:
+            self.tick_profiler.stop()
+            self.tick_profiler = None
         self.start_time = datetime.now()
 
+    def set_session_tags(self, tags: List[str]):
+        """Tag the session with the map or activity played, e.g. "fractals"."""
+        self.session_tags = tags
+
+    def add_timeline_sample(self):
+        now = datetime.now()
+        self.timeline.append(
+            (
+                now.isoformat(sep="_", timespec="seconds"),
+                self.current_value,
+                self.profit_value,
+            )
+        )
+        if self.journal:
+            self.journal.append(
+                now.timestamp(),
+                self.start_value,
+                self.current_value,
+                self.inventory_value,
+                self.materials_value,
+                self.profit_value,
+            )
+
     def get_session_data(self):
         return {
+            "session_id": self.session_id,
+            "character": self.api.get_active_character(),
+            "characters_values": dict(self.characters_values),
+            "characters_start_values": dict(self.characters_start_values),
+            "tags": self.session_tags,
             "start_value": self.start_value,
             "current_value": self.current_value,
             "profit_value": self.profit_value,
+            "trading_post_sales": self.trading_post_sales,
             "start_time": self.start_time.isoformat(sep="_", timespec="seconds"),
+            "end_time": datetime.now().isoformat(sep="_", timespec="seconds"),
+            "top_movers": self.top_movers,
+            "timeline": list(self.timeline),
         }
 
     def update_trading_post_prices(self):
@@ -86,7 +323,8 @@ class SessionTracker:
                 "Trading post prices older than 1 day. Updating trading post prices..."
             )
             time.sleep(60)
-            self.api.get_prices_from_trading_post()
+            prices = self.api.get_prices_from_trading_post()
+            self.sale_channels.update_prices(prices)
 
     def load_config(self):
         logger.info("Loading config")
@@ -141,9 +379,10 @@ class SessionTracker:
         price = get_tp_item_price_by_id_from_db(item_id)
         if not price:
             price = self.api.get_item_price_from_trading_post(item_id)
+        trading_post_mode = TRADING_POST_MODE.get(trading_post_mode, trading_post_mode)
         trading_post_mode_price = None
         try:
-            trading_post_mode_price = price.get("sells").get("unit_price")
+            trading_post_mode_price = price.get(trading_post_mode).get("unit_price")
         except Exception as e:
             logger.warning(
                 f"Error getting {trading_post_mode} price for item {item_id}. {e}"
@@ -176,18 +415,29 @@ class SessionTracker:
             vendor_value = self.get_item_vendor_value(item_info) or 0
         if self.can_sell_item_on_trading_post(inventory_item):
             tp_value = self.get_price_from_item(item_id) or 0
-        if vendor_value == 0 and tp_value == 0:
+        where_to_sell = best_sale_channel(vendor_value, tp_value)
+        if not where_to_sell:
             logger.info("Item can't be sold")
-            return None
-        if vendor_value >= tp_value:
-            return "vendor"
-        return "trading_post"
+        return where_to_sell
 
     def can_sell_item_on_trading_post(self, inventory_item: dict) -> bool:
         if not inventory_item.get("binding"):
             return True
         return False
 
+    def get_item_info(self, item_id: str) -> Optional[dict]:
+        """Get the item info from the local item catalog, falling back to the
+        database and then to the API."""
+        if catalog := get_item_catalog():
+            if item_info := catalog.get_item_info(item_id):
+                return item_info
+        item_info = get_item_info_from_db(item_id)
+        if not item_info:
+            item_info = self.api.fetch_item_info(item_id)
+            if item_info:
+                add_item_info_to_db(item_info)
+        return item_info
+
     def add_new_item_to_db(self, item_id: str):
         logger.info(f"Adding new item {item_id} to the database")
         item_info = self.api.fetch_item_info(item_id)
@@ -201,45 +451,287 @@ class SessionTracker:
         )
         return sorted_dict
 
+    def get_items_names(self, items_ids: List[int]) -> dict:
+        """Get the names of the items from the item catalog, reading the missing
+        ones from the database in a single query."""
+        names = {}
+        catalog = get_item_catalog()
+        for item_id in items_ids:
+            if catalog and (name := catalog.get_item_name(item_id)) is not None:
+                names[int(item_id)] = name
+        missing_ids = [item_id for item_id in items_ids if int(item_id) not in names]
+        if missing_ids:
+            names.update(get_items_names_from_db(missing_ids))
+        return names
+
     def format_sorted_items_dict(self, items_dict: dict):
         """Format the items dict to a human readable format, adding the names of
         the items"""
         formatted_items_dict = {}
+        names = self.get_items_names(list(items_dict))
         for key in items_dict:
             formatted_items_dict[key] = {}
-            formatted_items_dict[key]["name"] = get_item_name_from_db(key)
+            formatted_items_dict[key]["name"] = names.get(int(key))
             formatted_items_dict[key]["price"] = items_dict[key]
         return formatted_items_dict
 
-    def calculate_items_value(self, items: List[dict], trading_post_mode="sell") -> int:
+    def get_items_values(self) -> dict:
+        """Return the value of each item summed across inventory and storage."""
+        items_values = {}
+        for source_items_values in self.items_values_by_source.values():
+            for item_id, value in source_items_values.items():
+                items_values[item_id] = items_values.get(item_id, 0) + value
+        return items_values
+
+    def get_items_breakdown(self) -> dict:
+        """Return, for every valued item, a (name, count, unit price, channel,
+        total value) row summed across inventory and storage."""
+        items_breakdown = {}
+        for source_breakdown in self.items_breakdown_by_source.values():
+            for item_id, (count, channel, total) in source_breakdown.items():
+                if item_row := items_breakdown.get(item_id):
+                    count += item_row[0]
+                    total += item_row[2]
+                    channel = channel if channel == item_row[1] else "mixed"
+                items_breakdown[item_id] = (count, channel, total)
+        unnamed_ids = [
+            item_id for item_id in items_breakdown if item_id not in self.items_names
+        ]
+        if unnamed_ids:
+            names = self.get_items_names(unnamed_ids)
+            for item_id in unnamed_ids:
+                self.items_names[item_id] = names.get(int(item_id))
+        return {
+            item_id: (
+                self.items_names.get(item_id) or str(item_id),
+                count,
+                total // count if count else 0,
+                channel,
+                total,
+            )
+            for item_id, (count, channel, total) in items_breakdown.items()
+        }
+
+    def get_top_movers(self, count: int = TOP_MOVERS_COUNT) -> dict:
+        """Return the items whose value grew and dropped the most since the
+        session started."""
+        current_items_values = self.get_items_values()
+        deltas = {}
+        for item_id in current_items_values.keys() | self.start_items_values.keys():
+            delta = current_items_values.get(item_id, 0) - self.start_items_values.get(
+                item_id, 0
+            )
+            if delta:
+                deltas[item_id] = delta
+        gainers = heapq.nlargest(count, deltas.items(), key=lambda item: item[1])
+        losers = heapq.nsmallest(count, deltas.items(), key=lambda item: item[1])
+        gainers = [item for item in gainers if item[1] > 0]
+        losers = [item for item in losers if item[1] < 0]
+        names = self.get_items_names([item_id for item_id, _ in gainers + losers])
+        return {
+            "gainers": [
+                {"id": item_id, "name": names.get(int(item_id)), "value": delta}
+                for item_id, delta in gainers
+            ],
+            "losers": [
+                {"id": item_id, "name": names.get(int(item_id)), "value": delta}
+                for item_id, delta in losers
+            ],
+        }
+
+    def start_lookups(self):
+        if not self.lookups_executor:
+            self.lookups_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="lookups"
+            )
+
+    def resolve_sale_channels(self, items_ids: List[int]):
+        resolve_sale_channels(self.sale_channels, self.api, items_ids)
+
+    def resolve_within_budget(self, items_ids: List[int]) -> bool:
+        """Resolve the sale channels of the items, waiting at most until the
+        tick deadline. Returns False when the lookups didn't finish in time, they
+        keep running in the background."""
+        if not any(
+            item_id is not None and item_id not in self.sale_channels
+            for item_id in items_ids
+        ):
+            return True
+        lookups_executor = self.lookups_executor
+        if self.tick_deadline is None or not lookups_executor:
+            self.resolve_sale_channels(items_ids)
+            return True
+        future = lookups_executor.submit(self.resolve_sale_channels, items_ids)
+        try:
+            future.result(timeout=max(self.tick_deadline - time.monotonic(), 0))
+            return True
+        except FutureTimeoutError:
+            logger.warning("Tick budget exceeded, using the last known values")
+            self.budget_misses += 1
+            return False
+
+    def start_tick(self):
+        self.tick_changes = set()
+        self.stale_sources = {}
+        if self.tick_budget_seconds:
+            self.tick_deadline = time.monotonic() + self.tick_budget_seconds
+        if self.tick_profiler:
+            self.tick_profiler.start_tick()
+
+    def end_tick(self):
+        self.tick_deadline = None
+        self.stale = bool(self.stale_sources)
+        # A stopped session has no lookups executor, nothing is revalidated
+        if self.stale and (lookups_executor := self.lookups_executor):
+            # Queued after the pending lookups, so it runs once they are done
+            lookups_executor.submit(self.revalidate)
+        if self.tick_profiler:
+            self.tick_profiler.end_tick()
+
+    def revalidate(self):
+        """Value the stale sources again now that their lookups are done and
+        publish the corrected values."""
+        with self.tick_lock:
+            if not self.stale_sources:
+                return
+            stale_sources, self.stale_sources = self.stale_sources, {}
+            delta = 0
+            for source, (items, trading_post_mode) in stale_sources.items():
+                previous_value = self.sources_values.get(source, 0)
+                value = self.calculate_items_value(items, trading_post_mode, source)
+                source_delta = value - previous_value
+                delta += source_delta
+                # Character inventories are valued as "inventory:<name>"
+                kind, _, character_name = source.partition(":")
+                if attribute := SOURCES_VALUES_ATTRIBUTES.get(kind):
+                    setattr(self, attribute, getattr(self, attribute) + source_delta)
+                if character_name in self.characters_values:
+                    self.characters_values[character_name] = value
+            self.current_value += delta
+            if len(self.timeline) <= 1:
+                # The session start itself was stale
+                self.start_value += delta
+                self.start_items_values = self.get_items_values()
+            self.profit_value = self.current_value - self.start_value
+            self.stale = bool(self.stale_sources)
+            self.top_movers = self.get_top_movers()
+            values = {
+                "start_value": self.start_value,
+                "current_value": self.current_value,
+                "inventory_value": self.inventory_value,
+                "characters_values": dict(self.characters_values),
+                "materials_value": self.materials_value,
+                "bank_value": self.bank_value,
+                "shared_inventory_value": self.shared_inventory_value,
+                "trading_post_value": self.trading_post_value,
+                "profit_value": self.profit_value,
+                "top_movers": self.top_movers,
+                "items_breakdown": self.get_items_breakdown(),
+                "stale": self.stale,
+            }
+        logger.info(f"Revalidated {', '.join(stale_sources)}, value changed by {delta}")
+        if self.on_revalidated:
+            self.on_revalidated(values)
+
+    def get_craft_value(self, item_id, trading_post_mode="sells") -> Optional[int]:
+        """Value an item by the ingredients needed to craft it, pricing them
+        from the sale channel table."""
+        if not self.recipe_graph.has_recipe(item_id):
+            return None
+        ingredients_ids = self.recipe_graph.get_ingredients_ids(item_id)
+        if not self.resolve_within_budget(list(ingredients_ids)):
+            return None
+        market_values = {}
+        for ingredient_id in ingredients_ids:
+            sale_channel = self.sale_channels.lookup(ingredient_id, trading_post_mode)
+            market_values[ingredient_id] = (
+                sale_channel[1] if sale_channel and sale_channel[0] else None
+            )
+        self.craft_valuator.set_market_values(market_values)
+        return self.craft_valuator.get_craft_value(item_id)
+
+    def calculate_items_value(
+        self, items: List[dict], trading_post_mode="sell", source: Optional[str] = None
+    ) -> int:
+        trading_post_mode = TRADING_POST_MODE.get(trading_post_mode, trading_post_mode)
+        # Snapshots fetched from the API carry a hash of their content, when
+        # neither the snapshot nor the prices changed the last value still holds
+        snapshot_hash = getattr(items, "snapshot_hash", None)
+        if source and getattr(items, "changed", True):
+            self.tick_changes.add(source)
+        valuation_key = (
+            snapshot_hash,
+            trading_post_mode,
+            self.sale_channels.version,
+            self.craft_valuator.version,
+        )
+        if source and snapshot_hash:
+            cached_valuation = self.valuation_cache.get(source)
+            if cached_valuation and cached_valuation[0] == valuation_key:
+                logger.info(f"{source} unchanged, skipping valuation")
+                return cached_valuation[1]
         total_items_price = 0
         items_unit_price = {}
         items_price = {}
+        # item id -> [count, channel, total value]
+        items_breakdown = {}
+        previous_breakdown = self.items_breakdown_by_source.get(source) or {}
+        budget_misses = self.budget_misses
+        snapshot = items
+        items = [item for item in items if item]
+        self.resolve_within_budget([item.get("id") for item in items])
         for item in items:
-            item_info = get_item_info_from_db(item.get("id"))
-            if not item_info:
-                item_info = self.api.fetch_item_info(item.get("id"))
-                if not item_info:
-                    logger.warning(f"No item with id {item.get('id')} found")
+            sale_channel = self.sale_channels.lookup(
+                item.get("id"), trading_post_mode, bound=bool(item.get("binding"))
+            )
+            if not sale_channel or not sale_channel[0]:
+                # Items that can't be sold are worth what crafting them takes
+                craft_value = self.get_craft_value(item.get("id"), trading_post_mode)
+                last_breakdown = previous_breakdown.get(item.get("id"))
+                if craft_value:
+                    sale_channel = (CRAFTING_CHANNEL, craft_value)
+                elif self.budget_misses > budget_misses and last_breakdown:
+                    # Not resolved within the tick budget, use the last value
+                    last_count, last_channel, last_total = last_breakdown
+                    sale_channel = (
+                        last_channel,
+                        last_total // last_count if last_count else 0,
+                    )
+                else:
                     continue
-                add_item_info_to_db(item_info)
-            where_to_sell = self.where_to_sell_item(item.get("id"), item_info, item)
-            if not where_to_sell:
-                continue
-            elif where_to_sell == "vendor":
-                item_unit_price = self.get_item_vendor_value(item_info)
-                item_price = item_unit_price * item.get("count")
-                items_unit_price[item.get("id")] = item_unit_price
-                items_price[item.get("id")] = item_price
-                total_items_price += item_price
-            elif where_to_sell == "trading_post":
-                item_unit_price = self.get_price_from_item(
-                    item.get("id"), trading_post_mode
+            item_unit_price = sale_channel[1]
+            item_price = item_unit_price * item.get("count")
+            items_unit_price[item.get("id")] = item_unit_price
+            items_price[item.get("id")] = items_price.get(item.get("id"), 0) + item_price
+            total_items_price += item_price
+            if item_breakdown := items_breakdown.get(item.get("id")):
+                item_breakdown[0] += item.get("count")
+                if item_breakdown[1] != sale_channel[0]:
+                    item_breakdown[1] = "mixed"
+                item_breakdown[2] += item_price
+            else:
+                items_breakdown[item.get("id")] = [
+                    item.get("count"),
+                    sale_channel[0],
+                    item_price,
+                ]
+        stale = self.budget_misses > budget_misses
+        if source:
+            self.items_values_by_source[source] = items_price
+            self.items_breakdown_by_source[source] = items_breakdown
+            self.sources_values[source] = total_items_price
+            if stale:
+                self.stale_sources[source] = (snapshot, trading_post_mode)
+            elif snapshot_hash:
+                self.valuation_cache[source] = (
+                    (
+                        snapshot_hash,
+                        trading_post_mode,
+                        self.sale_channels.version,
+                        self.craft_valuator.version,
+                    ),
+                    total_items_price,
                 )
-                item_price = item_unit_price * item.get("count")
-                items_unit_price[item.get("id")] = item_unit_price
-                items_price[item.get("id")] = item_price
-                total_items_price += item_price
         return total_items_price
 
     def calculate_inventory_value(
@@ -249,12 +741,62 @@ class SessionTracker:
         character_name: Optional[str] = None,
     ) -> int:
         character_name = character_name or self.api.get_active_character()
-        inventory_price = self.calculate_items_value(inventory_items, trading_post_mode)
-        logger.info(f"Inventory value: {inventory_price}")
-        self.inventory_value = inventory_price
-        add_current_inventory_value_to_db(inventory_price, character_name)
+        inventory_price = self.calculate_items_value(
+            inventory_items, trading_post_mode, source=f"inventory:{character_name}"
+        )
+        logger.info(f"{character_name} inventory value: {inventory_price}")
+        if getattr(inventory_items, "changed", True) or (
+            inventory_price != self.characters_values.get(character_name)
+        ):
+            add_current_inventory_value_to_db(inventory_price, character_name)
+        self.characters_values[character_name] = inventory_price
+        self.inventory_value = sum(self.characters_values.values())
         return inventory_price
 
+    def drop_character(self, character_name: str):
+        """Stop valuing the inventory of a character that was deleted or is no
+        longer tracked."""
+        source = f"inventory:{character_name}"
+        for values in (
+            self.items_values_by_source,
+            self.items_breakdown_by_source,
+            self.valuation_cache,
+            self.sources_values,
+            self.stale_sources,
+        ):
+            values.pop(source, None)
+        self.characters_values.pop(character_name, None)
+        self.inventory_value = sum(self.characters_values.values())
+
+    def calculate_characters_inventories_value(self, trading_post_mode="sell") -> int:
+        """Value the inventories of every character of the account, fetched with
+        a single request, or only the active character's when
+        ``track_all_characters`` is off. Returns their total value."""
+        inventories = None
+        if self.config.get("track_all_characters", True):
+            inventories = self.api.get_characters_inventories_items()
+            if inventories is None and self.characters_values:
+                # A failed request isn't an empty account, keep the last values
+                return self.inventory_value
+        if inventories is None:
+            character_name = self.api.get_active_character()
+            inventories = {
+                character_name: self.api.get_character_inventory_items(character_name)
+            }
+        for character_name in list(self.characters_values):
+            if character_name not in inventories:
+                self.drop_character(character_name)
+        # Items of every character are looked up together, not once per character
+        self.resolve_within_budget(
+            [item.get("id") for items in inventories.values() for item in items if item]
+        )
+        for character_name, inventory_items in inventories.items():
+            self.calculate_inventory_value(
+                inventory_items, trading_post_mode, character_name
+            )
+        logger.info(f"Inventory value: {self.inventory_value}")
+        return self.inventory_value
+
     def calculate_materials_storage_value(
         self,
         material_storage_items: List[dict],
@@ -264,15 +806,38 @@ class SessionTracker:
 
         character_name = character_name or self.api.get_active_character()
         materials_storage_price = self.calculate_items_value(
-            material_storage_items, trading_post_mode
+            material_storage_items, trading_post_mode, source="materials"
         )
         logger.info(f"materials_storage value: {materials_storage_price}")
+        if getattr(material_storage_items, "changed", True) or (
+            materials_storage_price != self.materials_value
+        ):
+            add_current_materials_storage_value_to_db(
+                materials_storage_price, character_name
+            )
         self.materials_value = materials_storage_price
-        add_current_materials_storage_value_to_db(
-            materials_storage_price, character_name
-        )
         return materials_storage_price
 
+    def calculate_bank_value(
+        self, bank_items: List[dict], trading_post_mode="sell"
+    ) -> int:
+        bank_price = self.calculate_items_value(
+            bank_items, trading_post_mode, source="bank"
+        )
+        logger.info(f"Bank value: {bank_price}")
+        self.bank_value = bank_price
+        return bank_price
+
+    def calculate_shared_inventory_value(
+        self, shared_inventory_items: List[dict], trading_post_mode="sell"
+    ) -> int:
+        shared_inventory_price = self.calculate_items_value(
+            shared_inventory_items, trading_post_mode, source="shared_inventory"
+        )
+        logger.info(f"Shared inventory value: {shared_inventory_price}")
+        self.shared_inventory_value = shared_inventory_price
+        return shared_inventory_price
+
     def calculate_profit(self):
         character_name = self.api.get_active_character()
         previous_inventory_value = get_current_inventory_value_from_db(character_name)
@@ -294,55 +859,201 @@ class SessionTracker:
 
     def get_current_items_value(self, character_name: Optional[str] = None):
         character_name = character_name or self.api.get_active_character()
-        current_inventory_value = self.calculate_inventory_value(
-            self.api.get_character_inventory_items()
-        )
+        current_inventory_value = self.calculate_characters_inventories_value()
         current_materials_storage_value = self.calculate_materials_storage_value(
             self.api.get_materials()
         )
-        current_total = current_inventory_value + current_materials_storage_value
+        current_bank_value = self.calculate_bank_value(self.api.get_bank_content())
+        current_shared_inventory_value = self.calculate_shared_inventory_value(
+            self.api.get_shared_inventory()
+        )
+        current_total = (
+            current_inventory_value
+            + current_materials_storage_value
+            + current_bank_value
+            + current_shared_inventory_value
+        )
         return current_total
 
     def get_values(self, character_name: Optional[str] = None):
         character_name = character_name or self.api.get_active_character()
-        current_inventory_value = self.calculate_inventory_value(
-            self.api.get_character_inventory_items()
-        )
+        current_inventory_value = self.calculate_characters_inventories_value()
         current_materials_storage_value = self.calculate_materials_storage_value(
             self.api.get_materials()
         )
-        current_total = current_inventory_value + current_materials_storage_value
+        current_bank_value = self.calculate_bank_value(self.api.get_bank_content())
+        current_shared_inventory_value = self.calculate_shared_inventory_value(
+            self.api.get_shared_inventory()
+        )
+        current_total = (
+            current_inventory_value
+            + current_materials_storage_value
+            + current_bank_value
+            + current_shared_inventory_value
+        )
         return {
             "inventory_value": current_inventory_value,
+            "characters_values": dict(self.characters_values),
             "materials_value": current_materials_storage_value,
+            "bank_value": current_bank_value,
+            "shared_inventory_value": current_shared_inventory_value,
             "total_value": current_total,
         }
 
+    def calculate_trading_post_value(self, trading_post_mode="sell") -> int:
+        """Value what is on the trading post: the coins and items waiting in the
+        delivery box and the coins held by open buy orders and sell listings."""
+        delivery_box = self.api.get_delivery_box()
+        delivery_items_value = self.calculate_items_value(
+            delivery_box.get("items") or [], trading_post_mode, source="delivery"
+        )
+        self.trading_post_value = (
+            (delivery_box.get("coins") or 0)
+            + delivery_items_value
+            + get_listings_value(self.api.get_current_transactions("buys"), "buys")
+            + get_listings_value(self.api.get_current_transactions("sells"), "sells")
+        )
+        logger.info(f"Trading post value: {self.trading_post_value}")
+        return self.trading_post_value
+
+    def ingest_trading_post_transactions(self) -> int:
+        """Store the new trading post transactions and sum the coins made by
+        the sales completed during the session."""
+        for kind in TRANSACTION_HISTORY_KINDS:
+            ingest_transaction_history(
+                self.api,
+                kind,
+                self.config.get(
+                    "transaction_history_pages_per_tick",
+                    TRANSACTION_HISTORY_PAGES_PER_TICK,
+                ),
+            )
+        sales_total = get_transactions_total_from_db(
+            self.api.account_owner,
+            "history/sells",
+            self.start_time.astimezone(timezone.utc).isoformat(timespec="seconds"),
+        )
+        self.trading_post_sales = int(sales_total * (1 - TRADING_POST_EXCHANGE_FEE))
+        return self.trading_post_sales
+
+    def calculate_wallet_value(self) -> int:
+        """Value every currency of the wallet from a single fetch. The last
+        value is kept when the wallet can't be fetched."""
+        wallet = self.api.get_wallet_content()
+        if wallet is None:
+            return self.wallet_value
+        if getattr(wallet, "changed", True):
+            self.tick_changes.add("wallet")
+        self.api.get_wallet_coins(wallet)
+        self.wallet_value, _ = self.wallet_valuator.value_wallet(wallet)
+        logger.info(f"Wallet value: {self.wallet_value}")
+        return self.wallet_value
+
     def get_current_total_value(self, character_name: Optional[str] = None):
         character_name = character_name or self.api.get_active_character()
         items_value = self.get_current_items_value(character_name)
-        current_total = items_value + self.api.get_wallet_coins()
+        current_total = items_value + self.calculate_wallet_value()
+        if self.config.get("trading_post_tracking", True):
+            current_total += self.calculate_trading_post_value()
         return current_total
 
     def start_session(self, character_name: Optional[str] = None):
         if character_name:
             self.api.set_active_character(character_name)
-        session_start_value = self.get_current_total_value(character_name)
-        self.start_value = session_start_value
+        self.start_lookups()
+        if self.config.get("profile_ticks") and not self.tick_profiler:
+            self.tick_profiler = TickProfiler(
+                create_session_profile_file("gw2tracker", self.session_id),
+                self.config.get("profile_interval_ms", 10) / 1000,
+                self.config.get("slow_tick_seconds", 5),
+            )
+            self.tick_profiler.start()
+        with self.tick_lock:
+            self.start_tick()
+            try:
+                session_start_value = self.get_current_total_value(character_name)
+                self.start_value = session_start_value
+                self.current_value = session_start_value
+                self.characters_start_values = dict(self.characters_values)
+                self.journal = SessionJournal(
+                    create_session_journal_file("gw2tracker", self.session_id),
+                    self.config.get("journal_fsync_every", 10),
+                )
+                self.add_timeline_sample()
+                self.start_items_values = self.get_items_values()
+                self.top_movers = {"gainers": [], "losers": []}
+            finally:
+                self.end_tick()
+            values = {
+                "start_value": session_start_value,
+                "inventory_value": self.inventory_value,
+                "characters_values": dict(self.characters_values),
+                "materials_value": self.materials_value,
+                "bank_value": self.bank_value,
+                "shared_inventory_value": self.shared_inventory_value,
+                "wallet_value": self.wallet_value,
+                "trading_post_value": self.trading_post_value,
+                "items_breakdown": self.get_items_breakdown(),
+                "stale": self.stale,
+            }
+        self.loot_prefetcher.start()
+        self.memory_monitor.start()
         logger.info(f"START VALUE: {self.start_value}")
-        return {
-            "start_value": session_start_value,
-            "inventory_value": self.inventory_value,
-            "materials_value": self.materials_value,
-        }
+        return values
+
+    def stop_session(self):
+        self.loot_prefetcher.stop()
+        self.memory_monitor.stop()
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+        if self.tick_profiler:
+            self.tick_profiler.stop()
+            self.tick_profiler = None
+        self.on_revalidated = None
+        # Queued lookups and revalidations are dropped, one already running
+        # finishes without publishing
+        lookups_executor, self.lookups_executor = self.lookups_executor, None
+        if lookups_executor:
+            lookups_executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_next_poll_delay(self) -> float:
+        """Seconds to wait before the next tick."""
+        if not self.config.get("adaptive_polling", True):
+            return self.poll_scheduler.base_interval
+        return self.poll_scheduler.get_next_delay()
 
     def update_session(self, character_name: Optional[str] = None):
         character_name = character_name or self.api.get_active_character()
-        self.current_value = self.get_current_total_value(character_name)
-        self.profit_value = self.current_value - self.start_value
-        return {
-            "current_value": self.current_value,
-            "inventory_value": self.inventory_value,
-            "materials_value": self.materials_value,
-            "profit_value": self.profit_value,
-        }
+        with self.tick_lock:
+            self.start_tick()
+            try:
+                self.current_value = self.get_current_total_value(character_name)
+                # Sales are already in the profit: a sold listing's coins move
+                # from the listings value to the delivery box, then the wallet,
+                # which are all part of the current value. trading_post_sales is
+                # only shown, adding it would count those coins twice.
+                self.profit_value = self.current_value - self.start_value
+                if self.config.get("trading_post_tracking", True):
+                    self.ingest_trading_post_transactions()
+                self.top_movers = self.get_top_movers()
+                self.add_timeline_sample()
+            finally:
+                self.end_tick()
+            self.memory_monitor.tick()
+            self.poll_scheduler.record_tick(bool(self.tick_changes))
+            return {
+                "current_value": self.current_value,
+                "inventory_value": self.inventory_value,
+                "characters_values": dict(self.characters_values),
+                "materials_value": self.materials_value,
+                "bank_value": self.bank_value,
+                "shared_inventory_value": self.shared_inventory_value,
+                "wallet_value": self.wallet_value,
+                "trading_post_value": self.trading_post_value,
+                "trading_post_sales": self.trading_post_sales,
+                "profit_value": self.profit_value,
+                "top_movers": self.top_movers,
+                "items_breakdown": self.get_items_breakdown(),
+                "stale": self.stale,
+            }
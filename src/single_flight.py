@@ -0,0 +1,80 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Iterable
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key: the first caller runs the
+    call, the others wait for it and share its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._calls[key] = future
+        if not is_leader:
+            return future.result()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def do_many(
+        self,
+        keys: Iterable[Hashable],
+        fetch_many: Callable[[list], Dict[Hashable, Any]],
+    ) -> Dict[Hashable, Any]:
+        """Fetch many keys at once. Keys already in flight are awaited instead
+        of being fetched again, ``fetch_many`` only receives the others.
+
+        Args:
+            keys: The keys to fetch.
+            fetch_many: Called with the list of keys to fetch, returns a dict
+                with the result of each key. Missing keys result in None.
+
+        Returns:
+            Dict[Hashable, Any]: The result of each key.
+        """
+        in_flight = {}
+        own = {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                if key in self._calls:
+                    in_flight[key] = self._calls[key]
+                else:
+                    own[key] = self._calls[key] = Future()
+        results = {}
+        try:
+            if own:
+                results = fetch_many(list(own))
+        except BaseException as e:
+            for future in own.values():
+                future.set_exception(e)
+            raise
+        else:
+            for key, future in own.items():
+                future.set_result(results.get(key))
+        finally:
+            with self._lock:
+                for key in own:
+                    del self._calls[key]
+        results = {key: results.get(key) for key in own}
+        for key, future in in_flight.items():
+            try:
+                results[key] = future.result()
+            except Exception:
+                results[key] = None
+        return results
@@ -0,0 +1,78 @@
+import hashlib
+import json
+import sys
+import threading
+from typing import Optional, Tuple
+
+from loguru import logger
+
+from src.database import (
+    add_snapshot_to_db,
+    get_snapshot_heads_from_db,
+    set_snapshot_head_in_db,
+)
+
+logger.remove()
+logger.add(sys.stderr, level="INFO")
+
+
+class Snapshot(list):
+    """A list of items fetched from the API, carrying the hash of its content so
+    consumers can skip work when nothing changed."""
+
+    def __init__(self, items=(), snapshot_hash: Optional[str] = None, changed=True):
+        super().__init__(items)
+        self.snapshot_hash = snapshot_hash
+        self.changed = changed
+
+
+def hash_snapshot(data) -> str:
+    """Return a hash of the data that doesn't depend on dict keys order."""
+    canonical_data = json.dumps(
+        data, sort_keys=True, separators=(",", ":"), default=str
+    ).encode("utf-8")
+    return hashlib.blake2b(canonical_data, digest_size=16).hexdigest()
+
+
+class SnapshotStore:
+    """Keeps the hash of the last snapshot of each (owner, kind) pair and stores
+    snapshots by hash, so identical states are written once."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heads = None
+
+    def _load_heads(self):
+        if self._heads is None:
+            try:
+                self._heads = get_snapshot_heads_from_db()
+            except Exception as e:
+                logger.warning(f"Error loading snapshot heads. {e}")
+                self._heads = {}
+        return self._heads
+
+    def get_head(self, owner: str, kind: str) -> Optional[str]:
+        with self._lock:
+            return self._load_heads().get((owner, kind))
+
+    def record(self, owner: str, kind: str, data) -> Tuple[str, bool]:
+        """Hash the snapshot and store it if it differs from the last one.
+
+        Returns:
+            Tuple[str, bool]: The snapshot hash and whether it changed.
+        """
+        snapshot_hash = hash_snapshot(data)
+        with self._lock:
+            heads = self._load_heads()
+            if heads.get((owner, kind)) == snapshot_hash:
+                logger.debug(f"{kind} snapshot of {owner} unchanged")
+                return snapshot_hash, False
+            heads[(owner, kind)] = snapshot_hash
+        add_snapshot_to_db(snapshot_hash, kind, data)
+        set_snapshot_head_in_db(owner, kind, snapshot_hash)
+        logger.info(f"New {kind} snapshot of {owner}: {snapshot_hash}")
+        return snapshot_hash, True
+
+    def snapshot(self, owner: str, kind: str, items) -> Snapshot:
+        snapshot_hash, changed = self.record(owner, kind, items)
+        return Snapshot(items, snapshot_hash, changed)
@@ -0,0 +1,162 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from loguru import logger
+
+logger.remove()
+logger.add(sys.stderr, level="INFO")
+
+SRC_FOLDER = os.path.dirname(os.path.abspath(__file__))
+SLOW_TICK_TOP_STACKS = 5
+
+
+def get_frame_name(frame) -> str:
+    code = frame.f_code
+    filename = os.path.basename(code.co_filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame) -> Tuple[str, bool]:
+    """Return the stack of a frame as ``outer;...;inner`` frame names and
+    whether any of its frames runs tracker code."""
+    names = []
+    runs_tracker_code = False
+    while frame is not None:
+        names.append(get_frame_name(frame))
+        if frame.f_code.co_filename.startswith(SRC_FOLDER + os.sep):
+            runs_tracker_code = True
+        frame = frame.f_back
+    return ";".join(reversed(names)), runs_tracker_code
+
+
+def write_collapsed_stacks(path: str, stacks: Counter):
+    """Write stacks in the collapsed format read by flame graph tools, one
+    ``frame;frame;frame count`` line per stack."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+
+class TickProfiler:
+    """Statistical profiler for ticks.
+
+    While a tick runs, a background thread samples the stack of the thread
+    running it every ``interval_seconds``, along with the threads whose name
+    starts with one of ``thread_prefixes`` while they run tracker code, e.g.
+    the lookups finishing in the background. Nothing is traced between
+    samples, so the tick itself runs at full speed.
+
+    The samples of the whole session are written to ``path`` as collapsed
+    stacks. Ticks slower than ``slow_tick_seconds`` are logged with their
+    hottest stacks and written to a file of their own next to it.
+
+    Args:
+        path (str): File the session stacks are written to.
+        interval_seconds (float): Time between samples.
+        slow_tick_seconds (float): Ticks taking longer are flagged.
+        thread_prefixes (Tuple[str, ...]): Names of the other threads sampled.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        interval_seconds: float = 0.01,
+        slow_tick_seconds: float = 5,
+        thread_prefixes: Tuple[str, ...] = ("lookups",),
+    ):
+        self.path = path
+        self.interval_seconds = interval_seconds
+        self.slow_tick_seconds = slow_tick_seconds
+        self.thread_prefixes = thread_prefixes
+        self.session_stacks = Counter()
+        self.tick_stacks = Counter()
+        self.ticks = 0
+        # (tick number, seconds, collapsed stacks file)
+        self.slow_ticks: List[Tuple[int, float, str]] = []
+        self.tick_thread_id: Optional[int] = None
+        self.tick_started_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def sample(self):
+        frames = sys._current_frames()
+        threads_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        with self._lock:
+            if self.tick_thread_id is None:
+                return
+            for thread_id, frame in frames.items():
+                thread_name = threads_names.get(thread_id, str(thread_id))
+                if thread_id == self.tick_thread_id:
+                    stack, _ = collapse_stack(frame)
+                elif thread_name.startswith(self.thread_prefixes):
+                    stack, runs_tracker_code = collapse_stack(frame)
+                    if not runs_tracker_code:
+                        # Idle, waiting for work
+                        continue
+                else:
+                    continue
+                self.tick_stacks[f"{thread_name};{stack}"] += 1
+
+    def run(self):
+        while not self.stop_event.wait(self.interval_seconds):
+            self.sample()
+
+    def start(self):
+        if self.thread:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> str:
+        """Stop sampling and write the session stacks. Returns their path."""
+        self.stop_event.set()
+        self.thread = None
+        self.write()
+        return self.path
+
+    def start_tick(self):
+        with self._lock:
+            self.tick_thread_id = threading.get_ident()
+            self.tick_started_at = time.monotonic()
+            self.tick_stacks = Counter()
+
+    def end_tick(self) -> float:
+        """Stop sampling the tick and flag it when it was slow. Returns how
+        many seconds it took."""
+        with self._lock:
+            if self.tick_started_at is None:
+                return 0
+            seconds = time.monotonic() - self.tick_started_at
+            tick_stacks = self.tick_stacks
+            self.tick_thread_id = None
+            self.tick_started_at = None
+            self.session_stacks.update(tick_stacks)
+            self.ticks += 1
+        if self.slow_tick_seconds and seconds >= self.slow_tick_seconds:
+            self.flag_slow_tick(seconds, tick_stacks)
+        return seconds
+
+    def flag_slow_tick(self, seconds: float, stacks: Counter):
+        path = f"{os.path.splitext(self.path)[0]}_tick{self.ticks}.folded"
+        write_collapsed_stacks(path, stacks)
+        self.slow_ticks.append((self.ticks, seconds, path))
+        samples = sum(stacks.values())
+        logger.warning(
+            f"Tick {self.ticks} took {seconds:.1f} seconds, stacks written to {path}"
+        )
+        for stack, count in stacks.most_common(SLOW_TICK_TOP_STACKS):
+            # The innermost frames tell where the time went
+            logger.warning(f"{count / samples:.0%} {';'.join(stack.split(';')[-4:])}")
+
+    def write(self):
+        with self._lock:
+            stacks = Counter(self.session_stacks)
+        write_collapsed_stacks(self.path, stacks)
+        logger.info(f"Profile of {self.ticks} ticks written to {self.path}")
@@ -0,0 +1,89 @@
+import sys
+from typing import List
+
+from loguru import logger
+
+from src.database import (
+    add_transactions_to_db,
+    get_transactions_watermark_from_db,
+    set_transactions_backfill_in_db,
+    set_transactions_watermark_in_db,
+)
+from src.gw2api import Gw2Api
+
+logger.remove()
+logger.add(sys.stderr, level="INFO")
+
+TRANSACTION_HISTORY_KINDS = ("history/buys", "history/sells")
+TRANSACTION_HISTORY_PAGES_PER_TICK = 5
+# Taken from the price of a listing when it sells, the 5% listing fee is
+# already paid when the listing is created
+TRADING_POST_EXCHANGE_FEE = 0.10
+
+
+def ingest_transaction_history(
+    api: Gw2Api, kind: str, max_pages: int = TRANSACTION_HISTORY_PAGES_PER_TICK
+) -> List[dict]:
+    """Store the transactions completed since the last ingestion.
+
+    History pages are newest first, so paging stops at the first transaction
+    that isn't newer than the stored watermark: a regular poll reads one page.
+    The watermark only moves once paging got there, or to the last page, without
+    a failed fetch. Until then, e.g. while the whole history is backfilled on
+    the first run, at most ``max_pages`` pages are read per call and the next
+    call carries on from the page where this one stopped.
+
+    Args:
+        api (Gw2Api): The API of the account.
+        kind (str): ``history/buys`` or ``history/sells``.
+        max_pages (int): Pages read per call.
+
+    Returns:
+        List[dict]: The new transactions, newest first.
+    """
+    watermark = get_transactions_watermark_from_db(api.account_owner, kind)
+    last_id = watermark.get("last_id")
+    backfill = watermark.get("backfill") or {}
+    # Newer transactions only push the older ones to later pages, so carrying on
+    # from the same page may read some twice but never skips any
+    page = backfill.get("page", 0)
+    newest_id = backfill.get("last_id")
+    new_transactions = []
+    complete = False
+    for _ in range(max_pages):
+        transactions, page_total = api.get_transactions_page(kind, page)
+        if transactions is None:
+            break
+        page += 1
+        for transaction in transactions:
+            if last_id is not None and transaction.get("id") <= last_id:
+                complete = True
+                break
+            new_transactions.append(transaction)
+        if complete or page >= page_total:
+            complete = True
+            break
+    if new_transactions:
+        logger.info(f"Ingested {len(new_transactions)} new {kind} transactions")
+        add_transactions_to_db(api.account_owner, kind, new_transactions)
+        newest_id = max(
+            [transaction.get("id") for transaction in new_transactions]
+            + ([newest_id] if newest_id is not None else [])
+        )
+    if complete:
+        set_transactions_watermark_in_db(api.account_owner, kind, newest_id)
+    elif page or newest_id is not None:
+        logger.info(f"Paged {kind} transactions up to page {page}, carrying on later")
+        set_transactions_backfill_in_db(api.account_owner, kind, page, newest_id)
+    return new_transactions
+
+
+def get_listings_value(listings: List[dict], kind: str) -> int:
+    """Coins held in open listings: buy orders hold their full price, sell
+    listings are worth their price minus the exchange fee."""
+    total = sum(
+        listing.get("price", 0) * listing.get("quantity", 0) for listing in listings
+    )
+    if kind == "sells":
+        return int(total * (1 - TRADING_POST_EXCHANGE_FEE))
+    return total
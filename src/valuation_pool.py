@@ -0,0 +1,137 @@
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from src.price_table import PriceTable, build_price_table
+from src.sale_channels import VENDOR_CHANNEL, best_sale_channel
+
+logger.remove()
+logger.add(sys.stderr, level="INFO")
+
+TRADING_POST_MODE_INDEX = {"buys": 2, "sells": 3}
+
+# Price table opened by a worker process, reopened when the parent publishes a
+# new version
+_WORKER_PRICE_TABLE: Optional[PriceTable] = None
+
+
+def get_default_price_table_folder() -> str:
+    return os.path.join(os.path.expanduser("~"), "gw2tracker", "price_tables")
+
+
+def get_worker_price_table(path: str) -> PriceTable:
+    global _WORKER_PRICE_TABLE
+    if not _WORKER_PRICE_TABLE or _WORKER_PRICE_TABLE.path != path:
+        if _WORKER_PRICE_TABLE:
+            _WORKER_PRICE_TABLE.close()
+        _WORKER_PRICE_TABLE = PriceTable(path)
+    return _WORKER_PRICE_TABLE
+
+
+def value_items_snapshot(
+    price_table_path: str,
+    items: List[Tuple[int, int, bool]],
+    trading_post_mode: str = "sells",
+) -> Tuple[int, Dict[int, int]]:
+    """Value (item id, count, bound) tuples against the shared price table.
+    Runs inside the worker processes.
+
+    Returns:
+        Tuple[int, Dict[int, int]]: The total value and the value of each item.
+    """
+    price_table = get_worker_price_table(price_table_path)
+    mode_index = TRADING_POST_MODE_INDEX[trading_post_mode]
+    total_value = 0
+    items_value = {}
+    for item_id, count, bound in items:
+        prices = price_table.get_prices(item_id)
+        if not prices:
+            continue
+        vendor_value = prices[1]
+        tp_value = 0 if bound else prices[mode_index]
+        channel = best_sale_channel(vendor_value, tp_value)
+        if not channel:
+            continue
+        item_value = (vendor_value if channel == VENDOR_CHANNEL else tp_value) * count
+        items_value[item_id] = items_value.get(item_id, 0) + item_value
+        total_value += item_value
+    return total_value, items_value
+
+
+def compact_items(items: List[dict]) -> List[Tuple[int, int, bool]]:
+    """Reduce API item slots to what valuation needs before sending them to a
+    worker process."""
+    return [
+        (int(item.get("id")), item.get("count") or 0, bool(item.get("binding")))
+        for item in items
+        if item
+    ]
+
+
+class ValuationPool:
+    """Values many accounts' snapshots in a process pool.
+
+    The parent publishes the sale channel sources (vendor value and trading
+    post prices) as a memory-mapped price table; workers map the same file
+    read-only, so only item snapshots and totals are pickled.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, folder: Optional[str] = None):
+        self.folder = folder or get_default_price_table_folder()
+        self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        self.price_table_path = None
+        self.price_table_version = None
+
+    def publish_price_table(self, sale_channels) -> str:
+        """Write a new price table when the sale channel table changed."""
+        if self.price_table_version == sale_channels.version:
+            return self.price_table_path
+        version = sale_channels.version
+        path = os.path.join(self.folder, f"price_table_{os.getpid()}_{version}.bin")
+        build_price_table(sale_channels.get_sources().items(), path)
+        previous_path = self.price_table_path
+        self.price_table_path = path
+        self.price_table_version = version
+        if previous_path:
+            self.remove_old_price_tables(keep=(previous_path, path))
+        return path
+
+    def remove_old_price_tables(self, keep: Tuple[str, ...]):
+        # Workers may still be reading the previous table, keep it one more round
+        pattern = os.path.join(self.folder, f"price_table_{os.getpid()}_*.bin")
+        for path in glob.glob(pattern):
+            if path not in keep:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"Error removing price table {path}. {e}")
+
+    def value_snapshots(
+        self,
+        snapshots: Dict[str, List[dict]],
+        sale_channels,
+        trading_post_mode: str = "sells",
+    ) -> Dict[str, Tuple[int, Dict[int, int]]]:
+        """Value each snapshot, keyed by any id (e.g. account and source).
+
+        The sale channel table must already contain every item in the
+        snapshots, see :func:`src.session_tracker.resolve_sale_channels`.
+        """
+        price_table_path = self.publish_price_table(sale_channels)
+        futures = {
+            key: self.executor.submit(
+                value_items_snapshot,
+                price_table_path,
+                compact_items(items),
+                trading_post_mode,
+            )
+            for key, items in snapshots.items()
+        }
+        return {key: future.result() for key, future in futures.items()}
+
+    def shutdown(self):
+        self.executor.shutdown()
@@ -0,0 +1,107 @@
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from src.gw2api import Gw2Api
+
+logger.remove()
+logger.add(sys.stderr, level="INFO")
+
+COIN_CURRENCY_ID = 1
+GEM_CURRENCY_ID = 4
+GEMS_EXCHANGE_QUANTITY = 100
+
+_CURRENCY_CATALOG = None
+_CURRENCY_CATALOG_LOCK = threading.Lock()
+
+
+class CurrencyCatalog:
+    """Names of the wallet currencies, read once from the database (or from the
+    API, when the database has none) and kept in memory."""
+
+    def __init__(self, currencies: List[dict]):
+        self.names = {
+            int(currency.get("id")): currency.get("name") for currency in currencies
+        }
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def get_name(self, currency_id) -> Optional[str]:
+        return self.names.get(int(currency_id))
+
+
+def get_currency_catalog(api: Gw2Api) -> CurrencyCatalog:
+    """Return the shared currency catalog, loading it on first use."""
+    global _CURRENCY_CATALOG
+    with _CURRENCY_CATALOG_LOCK:
+        if _CURRENCY_CATALOG is None or not len(_CURRENCY_CATALOG):
+            _CURRENCY_CATALOG = CurrencyCatalog(api.get_currencies_from_db() or [])
+            logger.info(f"Loaded {len(_CURRENCY_CATALOG)} currencies")
+        return _CURRENCY_CATALOG
+
+
+class WalletValuator:
+    """Values every currency of a wallet in coins.
+
+    Coins count as they are, gems at the gem exchange rate, refreshed at most
+    every ``exchange_ttl_seconds``, and any other currency at the rate set for
+    it in ``currency_rates``, keyed by currency id or name. Currencies without
+    a rate are worth nothing.
+    """
+
+    def __init__(
+        self,
+        api: Gw2Api,
+        currency_rates: Optional[Dict[str, float]] = None,
+        exchange_ttl_seconds: float = 600,
+    ):
+        self.api = api
+        self.currency_rates = currency_rates or {}
+        self.exchange_ttl_seconds = exchange_ttl_seconds
+        self.gems_rate: Optional[int] = None
+        self.gems_rate_fetched_at = 0.0
+        self.catalog: Optional[CurrencyCatalog] = None
+
+    def get_gems_rate(self) -> int:
+        now = time.monotonic()
+        if (
+            self.gems_rate is None
+            or now - self.gems_rate_fetched_at >= self.exchange_ttl_seconds
+        ):
+            gems_rate = self.api.get_gems_exchange_rate(GEMS_EXCHANGE_QUANTITY)
+            if gems_rate is not None:
+                self.gems_rate = gems_rate
+            # Also on failure, so a failing endpoint isn't requested every tick
+            self.gems_rate_fetched_at = now
+        return self.gems_rate or 0
+
+    def get_currency_rate(self, currency_id: int) -> Optional[float]:
+        if currency_id == COIN_CURRENCY_ID:
+            return 1
+        if str(currency_id) in self.currency_rates:
+            return self.currency_rates[str(currency_id)]
+        if self.currency_rates:
+            if self.catalog is None:
+                self.catalog = get_currency_catalog(self.api)
+            name = self.catalog.get_name(currency_id)
+            if name in self.currency_rates:
+                return self.currency_rates[name]
+        if currency_id == GEM_CURRENCY_ID:
+            return self.get_gems_rate()
+        return None
+
+    def value_wallet(self, wallet: List[dict]) -> Tuple[int, Dict[int, int]]:
+        """Return the total value of the wallet and the value of each
+        currency that has a rate."""
+        currencies_values = {}
+        for currency in wallet or []:
+            currency_id = int(currency.get("id"))
+            rate = self.get_currency_rate(currency_id)
+            if rate is None:
+                continue
+            currencies_values[currency_id] = int((currency.get("value") or 0) * rate)
+        return sum(currencies_values.values()), currencies_values